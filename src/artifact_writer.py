@@ -0,0 +1,189 @@
+"""
+Background writer for pipeline artifacts (masks, depth PNGs, PLY files, deviations)
+Writes are queued and done by a small thread pool so the verdict does not wait for PNG
+compression or SD card latency. Files appear atomically (written to a temporary name,
+then renamed), and only the newest write of a path is kept: a queued job is dropped
+once a newer one for its path arrives, and an older job still running then is not
+renamed into place. When the queue backs up, low-priority jobs are dropped instead of
+delaying the pipeline. Stages that read an artifact written earlier in the same
+process call wait_for(path) first; it raises IOError if the newest CRITICAL write of the
+path failed, so a later stage never reads the previous panel's file. Pending writes are
+flushed at exit
+"""
+
+import atexit
+import heapq
+import itertools
+import os
+import threading
+import time
+import numpy as np
+from constants import ARTIFACT_WRITER_CONFIG
+
+CRITICAL, NORMAL, HEAVY = 0, 1, 2
+
+class ArtifactWriter:
+    """Bounded, prioritised write queue served by background threads."""
+
+    def __init__(self, config=ARTIFACT_WRITER_CONFIG):
+        self.config = config
+        self.heap = []                  # (priority, sequence, path, write_fn, queued_at)
+        self.sequence = itertools.count()
+        self.pending = {}               # path -> jobs queued or running
+        self.latest = {}                # path -> sequence number of its newest job
+        self.failed = {}                # path -> error of its newest CRITICAL write, if that failed
+        self.condition = threading.Condition()
+        self.closed = False
+        self.stats = {'written': 0, 'shed': 0, 'superseded': 0, 'errors': 0, 'max_wait_ms': 0.0}
+        self.workers = [threading.Thread(target=self._work, name=f"artifact-writer-{i}", daemon=True)
+                        for i in range(config['workers'])]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, path, write_fn, priority=NORMAL):
+        """Queue write_fn(temporary_path) for path. Returns False if the job was shed."""
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("artifact writer is closed")
+            shed_depth = self.config['shed_depth'].get(priority)
+            if shed_depth is not None and len(self.heap) >= shed_depth:
+                self.stats['shed'] += 1
+                return False
+            while len(self.heap) >= self.config['max_queue']:
+                if priority != CRITICAL:
+                    self.stats['shed'] += 1
+                    return False
+                self.condition.wait()  # handoff files are never dropped
+            sequence = next(self.sequence)
+            heapq.heappush(self.heap, (priority, sequence, path, write_fn, time.perf_counter()))
+            self.pending[path] = self.pending.get(path, 0) + 1
+            self.latest[path] = sequence
+            self.condition.notify_all()
+            return True
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.heap and not self.closed:
+                    self.condition.wait()
+                if not self.heap:
+                    return
+                priority, sequence, path, write_fn, queued_at = heapq.heappop(self.heap)
+                self.condition.notify_all()
+                superseded = sequence != self.latest[path]
+            wait_ms = (time.perf_counter() - queued_at) * 1000
+            status = 'superseded'
+            if not superseded:
+                status = self._write(path, sequence, write_fn, priority)
+            with self.condition:
+                self.stats[status] += 1
+                self.stats['max_wait_ms'] = max(self.stats['max_wait_ms'], wait_ms)
+                self.pending[path] -= 1
+                if not self.pending[path]:
+                    del self.pending[path]
+                    del self.latest[path]
+                self.condition.notify_all()
+
+    def _write(self, path, sequence, write_fn, priority):
+        """Write one job to a temporary file of its own and rename it into place unless a
+        newer job for the path was submitted meanwhile. A failed newest CRITICAL write is
+        recorded for wait_for. Returns the stats key."""
+        root, ext = os.path.splitext(path)
+        # Unique per worker (two jobs for one path may run at once); keep the extension:
+        # OpenCV picks the format from it
+        tmp_path = f"{root}.{os.getpid()}.{threading.get_ident()}.partial{ext}"
+        try:
+            write_fn(tmp_path)
+            with self.condition:  # renames of one path happen in submission order
+                if sequence == self.latest[path]:
+                    os.replace(tmp_path, path)
+                    self.failed.pop(path, None)
+                    return 'written'
+            os.remove(tmp_path)
+            return 'superseded'
+        except Exception as e:
+            print(f"✗ Error writing {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with self.condition:
+                if priority == CRITICAL and sequence == self.latest[path]:
+                    self.failed[path] = e
+            return 'errors'
+
+    def wait_for(self, path, timeout=None):
+        """Block until no write to path is queued or running. Returns False on timeout and
+        raises IOError if the newest CRITICAL write of path failed."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: path not in self.pending, timeout):
+                return False
+            if path in self.failed:
+                raise IOError(f"background write of {path} failed: {self.failed[path]}")
+            return True
+
+    def flush(self, timeout=None):
+        """Block until every queued write has finished."""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending, timeout)
+
+    def close(self):
+        """Flush and stop the worker threads."""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        for worker in self.workers:
+            worker.join()
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer():
+    """Process-wide writer, started on first use and flushed at exit."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ArtifactWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+def shutdown():
+    """Flush and stop the process-wide writer if it was started. Returns its stats or None."""
+    if _writer is None:
+        return None
+    _writer.close()
+    return _writer.stats
+
+def wait_for(path):
+    """Wait for a pending background write of path (no-op if nothing is pending). Raises
+    IOError if the newest CRITICAL write of path failed."""
+    if _writer is not None:
+        _writer.wait_for(path)
+
+def _submit(path, write_fn, priority):
+    if not ARTIFACT_WRITER_CONFIG['enabled']:
+        write_fn(path)
+        return True
+    return get_writer().submit(path, write_fn, priority)
+
+def write_png(path, image, priority=NORMAL, copy=True):
+    """Queue a PNG write at ARTIFACT_WRITER_CONFIG['png_compression']. The image is copied
+    unless copy=False (only if the caller will not modify it afterwards)."""
+    import cv2
+
+    image = image.copy() if copy else image
+    level = ARTIFACT_WRITER_CONFIG['png_compression']
+
+    def write(target):
+        if not cv2.imwrite(target, image, [cv2.IMWRITE_PNG_COMPRESSION, level]):
+            raise IOError("cv2.imwrite failed")
+    return _submit(path, write, priority)
+
+def write_text(path, values, priority=NORMAL, copy=True):
+    """Queue an np.savetxt write."""
+    values = np.array(values) if copy else values
+    return _submit(path, lambda target: np.savetxt(target, values), priority)
+
+def write_file(path, write_fn, priority=NORMAL):
+    """Queue any writer function that takes the target path."""
+    return _submit(path, write_fn, priority)
@@ -0,0 +1,103 @@
+"""
+Batched flatness benchmark on synthetic ragged clouds (no hardware needed)
+Fits many panels with deviation.batch_flatness in one call and with a per-cloud loop of
+fit_plane / compute_deviations / np.std, for many small clouds (where the loop is mostly
+Python overhead) and fewer full-size ones, plus empty, 2-point and collinear clouds.
+Checks that planes, std-devs and verdicts agree (also with per-point weights) and
+reports both times
+"""
+
+import argparse
+import sys
+import time
+import numpy as np
+from deviation import batch_flatness, compute_deviations, concat_clouds, fit_plane
+from constants import DEVIATION_THRESHOLD
+
+def make_cloud(rng, n_points):
+    """float32 Nx3 points (meters) of a tilted panel ~0.6 m away, flat or bowed around
+    DEVIATION_THRESHOLD."""
+    x = rng.uniform(-0.3, 0.3, n_points)
+    y = rng.uniform(-0.2, 0.2, n_points)
+    bow = rng.uniform(0, 0.006)
+    z = 0.6 + 0.05 * x - 0.03 * y - bow * (x / 0.3) ** 2 + rng.normal(0, 0.0005, n_points)
+    return np.c_[x, y, z].astype(np.float32)
+
+def make_clouds(rng, count, sizes):
+    """count clouds with point counts drawn from sizes, plus the degenerate cases."""
+    clouds = [make_cloud(rng, int(rng.integers(*sizes))) for _ in range(count)]
+    line = np.c_[np.linspace(-0.1, 0.1, 50), np.zeros(50), np.full(50, 0.6)].astype(np.float32)
+    clouds[1:1] = [np.empty((0, 3), np.float32), make_cloud(rng, 2), line]
+    return clouds
+
+def loop_flatness(clouds, threshold, weights=None):
+    """(planes, std-devs, verdicts) one cloud at a time, the way deviation.py does it."""
+    planes, std_devs = [], []
+    for index, points in enumerate(clouds):
+        cloud_weights = None if weights is None else weights[index]
+        if len(points) < 3 or np.linalg.matrix_rank(points[:, :2] - points[:, :2].mean(axis=0)) < 2:
+            planes.append([np.nan] * 3)
+            std_devs.append(np.nan)
+            continue
+        plane = fit_plane(points, cloud_weights)
+        planes.append(plane)
+        std_devs.append(np.std(compute_deviations(points, plane)))
+    std_devs = np.array(std_devs)
+    return np.array(planes), std_devs, std_devs > threshold
+
+def compare(label, clouds, weights=None, repeats=3):
+    """Problems where the batch and the loop disagree (empty list if none)."""
+    points, offsets = concat_clouds(clouds)
+    flat_weights = None if weights is None else np.concatenate(weights)
+    batch_time = loop_time = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = batch_flatness(points, offsets, DEVIATION_THRESHOLD, flat_weights)
+        batch_time = min(batch_time, time.perf_counter() - start)
+        start = time.perf_counter()
+        planes, std_devs, warped = loop_flatness(clouds, DEVIATION_THRESHOLD, weights)
+        loop_time = min(loop_time, time.perf_counter() - start)
+
+    problems = []
+    if not np.array_equal(np.isnan(result['std_dev']), np.isnan(std_devs)):
+        problems.append(f"{label}: clouds without a plane differ")
+    valid = ~np.isnan(std_devs)
+    # The loop fits float32 z (fit_plane), the batch float64 moments
+    plane_error = np.abs(result['plane'][valid] - planes[valid]).max()
+    std_error = np.abs(result['std_dev'][valid] - std_devs[valid]).max()
+    if plane_error > 1e-5:
+        problems.append(f"{label}: planes differ by {plane_error:.2e}")
+    if std_error > 1e-6 * DEVIATION_THRESHOLD:
+        problems.append(f"{label}: std-devs differ by {std_error:.2e} m")
+    if not np.array_equal(result['warped'], warped):
+        problems.append(f"{label}: {np.count_nonzero(result['warped'] != warped)} verdicts differ")
+    print(f"  {label:32s} {len(clouds):5d} clouds {len(points):9d} points  batch {batch_time * 1000:7.1f} ms  "
+          f"loop {loop_time * 1000:7.1f} ms  ({loop_time / batch_time:.1f}x, "
+          f"{np.count_nonzero(result['warped'])} WARPED)")
+    return problems
+
+def main():
+    """Compare batched and per-cloud flatness on ragged synthetic clouds."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Batched flatness benchmark")
+    print("=" * 50)
+
+    rng = np.random.default_rng(args.seed)
+    small = make_clouds(rng, 2000, (50, 2000))
+    large = make_clouds(rng, 20, (50_000, 250_000))
+    problems = compare("small clouds", small)
+    problems += compare("full-size clouds", large, repeats=1)
+    weights = [rng.uniform(0.2, 1.0, len(points)) for points in small]
+    problems += compare("small clouds, weighted", small, weights)
+
+    if problems:
+        print("\n✗ " + "\n✗ ".join(problems))
+        sys.exit(1)
+    print("\n✓ Batched planes, std-devs and verdicts match the per-cloud analysis")
+
+if __name__ == "__main__":
+    main()
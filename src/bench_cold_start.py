@@ -0,0 +1,79 @@
+"""
+Cold-start benchmark: Hugging Face CLIPSeg loading versus the compiled artifact
+Each variant runs in a fresh interpreter (like a new extract_wood.py process) and is
+timed for model load and for the first segmentation of rgb_image.png.
+Build the artifact first: python src/compiled_model.py
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from constants import MODEL_ARTIFACT_DIR
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+VARIANT_LOADERS = {
+    'huggingface': "from extract_wood import load_clipseg_model as load; loader = lambda: load(local_files_only=True)",
+    'compiled': "from compiled_model import load_compiled_model as loader",
+}
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {src!r})
+{loader}
+from PIL import Image
+from extract_wood import predict_mask
+from constants import RGB_IMAGE_PATH, TEXT_PROMPT
+processor, model = loader()
+loaded = time.perf_counter()
+predict_mask(processor, model, Image.open(RGB_IMAGE_PATH).convert("RGB"), TEXT_PROMPT)
+done = time.perf_counter()
+print(json.dumps({{'load_s': loaded - start, 'first_mask_s': done - loaded}}))
+"""
+
+def run_variant(variant):
+    """Time one cold start in a fresh interpreter. Returns {'load_s', 'first_mask_s'}."""
+    code = SCRIPT.format(src=SRC_DIR, loader=VARIANT_LOADERS[variant])
+    env = dict(os.environ, HF_HUB_OFFLINE="1")  # neither variant may touch the network
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    """Compare cold starts and fail if the compiled artifact is not faster to load."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(MODEL_ARTIFACT_DIR, "manifest.json")):
+        print(f"✗ No compiled artifact in {MODEL_ARTIFACT_DIR}; run python src/compiled_model.py first")
+        sys.exit(1)
+
+    print("=" * 50)
+    print("CLIPSeg cold start benchmark")
+    print("=" * 50)
+
+    best = {}
+    for variant in VARIANT_LOADERS:
+        try:
+            runs = [run_variant(variant) for _ in range(args.repeats)]
+        except RuntimeError as e:
+            print(f"✗ {variant}: {e}")
+            sys.exit(1)
+        best[variant] = min(runs, key=lambda run: run['load_s'] + run['first_mask_s'])
+        run = best[variant]
+        print(f"  {variant:12s} load {run['load_s']:6.2f} s, first mask {run['first_mask_s']:6.2f} s, "
+              f"total {run['load_s'] + run['first_mask_s']:6.2f} s")
+
+    speedup = best['huggingface']['load_s'] / best['compiled']['load_s']
+    if speedup < 1.0:
+        print(f"\n✗ Compiled artifact loads slower ({speedup:.2f}x)")
+        sys.exit(1)
+    print(f"\n✓ Compiled artifact loads {speedup:.1f}x faster")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Depth filter latency benchmark at 400P (no hardware needed)
+Times depth_filter.filter_depth on a fully valid 640x400 frame (the worst case), on a
+synthetic panel with flying pixels, speckle and stereo holes, and on the fixture depth maps.
+Checks the output against a straightforward reference (np.median of the taps) for both
+median windows, that edge erosion follows the panel mask and leaves the stereo holes alone,
+and that filtering the fixture panel as the cloud stage does keeps the golden verdict
+(fixtures/deviations.txt). Fails on any difference or if the full frame is over
+DEPTH_FILTER_BUDGET_MS
+"""
+
+import argparse
+import sys
+import time
+import os
+import cv2
+import numpy as np
+from deviation import fit_plane, compute_deviations
+from depth_filter import filter_depth, erode_valid
+from point_cloud import PointCloud
+from constants import (
+    DEPTH_FILTER_CONFIG, DEPTH_FILTER_BUDGET_MS, DEPTH_MAP_PATH, DEPTH_SCALE, DEVIATION_THRESHOLD,
+    DEVIATIONS_PATH, OAK_D_LITE_INTRINSICS, REGRESSION_CONFIG, WOOD_PANEL_DEPTH_PATH
+)
+
+DEPTH_SHAPE = (400, 640)
+
+def make_frames(rng):
+    """(label, depth in mm, panel mask or None) test frames."""
+    height, width = DEPTH_SHAPE
+    full = np.round(600 + rng.normal(0, 1.0, DEPTH_SHAPE)).astype(np.uint16)
+    panel = np.zeros(DEPTH_SHAPE, np.uint16)
+    v, u = np.mgrid[60:340, 100:540]
+    panel[60:340, 100:540] = np.round(600 + 0.05 * (u - 320) - 0.03 * (v - 200) + rng.normal(0, 1.0, u.shape))
+    speckle = rng.random(DEPTH_SHAPE) < 0.005
+    panel[speckle & (panel > 0)] += 40
+    panel[rng.random(DEPTH_SHAPE) < 0.01] = 0             # stereo holes
+    panel[60:340, 538:540] = 900                          # flying pixels along an edge
+    mask = np.zeros(DEPTH_SHAPE, bool)
+    mask[60:340, 100:540] = True
+    frames = [('full 400P frame', full, None), ('synthetic panel', panel, mask)]
+    for label, path in (('fixture depth map', DEPTH_MAP_PATH), ('fixture panel depth', WOOD_PANEL_DEPTH_PATH)):
+        image = cv2.imread(fixture_path(path), cv2.IMREAD_UNCHANGED)
+        if image is not None:
+            frames.append((label, image, None))
+    return frames
+
+def fixture_path(name):
+    return os.path.join(REGRESSION_CONFIG['fixtures_dir'], os.path.basename(name))
+
+def reference_median(depth, valid, window):
+    """Row then column median of the taps, invalid or out-of-image taps replaced by the centre."""
+    radius = window // 2
+    result = depth
+    for axis in (1, 0):
+        padded = np.pad(result, [(radius, radius) if a == axis else (0, 0) for a in (0, 1)])
+        padded_valid = np.pad(valid, [(radius, radius) if a == axis else (0, 0) for a in (0, 1)])
+        size = result.shape[axis]
+        taps = []
+        for offset in range(window):
+            tap = np.take(padded, range(offset, offset + size), axis=axis)
+            tap_valid = np.take(padded_valid, range(offset, offset + size), axis=axis)
+            taps.append(np.where(tap_valid, tap, result))
+        result = np.median(np.stack(taps), axis=0)
+    return result
+
+def reference_filter(depth_map, config, mask=None):
+    """filter_depth written out step by step, in float64."""
+    depth = depth_map.astype(np.float64)
+    valid = depth_map > 0
+    if mask is not None:
+        valid &= erode_valid(mask, config['erode_pixels'])
+    flying = np.zeros_like(valid)
+    for axis in (0, 1):
+        ahead = np.diff(depth, axis=axis)
+        lower = [slice(None), slice(None)]
+        upper = [slice(None), slice(None)]
+        lower[axis], upper[axis] = slice(None, -1), slice(1, None)
+        lower, upper = tuple(lower), tuple(upper)
+        both = valid[lower] & valid[upper]
+        flying[lower] |= both & (np.abs(ahead) > depth[lower] * config['discontinuity'])
+        flying[upper] |= both & (np.abs(ahead) > depth[upper] * config['discontinuity'])
+    keep = valid & ~flying
+    median = reference_median(depth, keep, config['median_window'])
+    keep &= ~(np.abs(depth - median) > median * config['median_threshold'])
+    return np.where(keep, depth_map, 0)
+
+def check_holes(depth_map, mask):
+    """Problems if a pixel next to a stereo hole inside the panel is removed as an edge."""
+    filtered, stats = filter_depth(depth_map, dict(DEPTH_FILTER_CONFIG, discontinuity=1e9, median_threshold=1e9),
+                                   mask=mask)
+    inner = erode_valid(mask, DEPTH_FILTER_CONFIG['erode_pixels'])
+    lost = int(np.count_nonzero(inner & (depth_map > 0) & (filtered == 0)))
+    expected = int(np.count_nonzero(mask & (depth_map > 0) & ~inner))
+    if lost or stats['removed_edges'] != expected:
+        return [f"edge erosion removed {lost} pixels around stereo holes "
+                f"({stats['removed_edges']} edge pixels removed, {expected} on the mask edge)"]
+    return []
+
+def check_fixture_verdict():
+    """Problems if filtering the fixture panel depth the way the cloud stage does (no mask,
+    default settings) changes the verdict of the golden residuals."""
+    depth_map = cv2.imread(fixture_path(WOOD_PANEL_DEPTH_PATH), cv2.IMREAD_UNCHANGED)
+    golden_std = float(np.std(np.loadtxt(fixture_path(DEVIATIONS_PATH))))
+    filtered, stats = filter_depth(depth_map)
+    points = PointCloud.from_depth(filtered, OAK_D_LITE_INTRINSICS, DEPTH_SCALE).points
+    std_dev = float(np.std(compute_deviations(points, fit_plane(points))))
+    verdict = lambda std: 'WARPED' if std > DEVIATION_THRESHOLD else 'FLAT'
+    print(f"  fixture verdict: {verdict(std_dev)} ({std_dev * 1000:.3f} mm, {stats['kept']} of {stats['input']} points "
+          f"kept), golden {verdict(golden_std)} ({golden_std * 1000:.3f} mm)")
+    if verdict(std_dev) != verdict(golden_std):
+        return [f"filtering changes the fixture verdict to {verdict(std_dev)}"]
+    return []
+
+def best_ms(depth_map, config, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        filter_depth(depth_map, config)
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+def main():
+    """Time the depth filter at 400P and check it against the reference."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs per frame (best is kept)")
+    parser.add_argument("--budget-ms", type=float, default=DEPTH_FILTER_BUDGET_MS)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Depth filter benchmark")
+    print("=" * 50)
+
+    problems = []
+    for label, depth_map, mask in make_frames(np.random.default_rng(0)):
+        timings = []
+        for window in (3, 5):
+            config = dict(DEPTH_FILTER_CONFIG, median_window=window)
+            filtered, stats = filter_depth(depth_map, config, mask=mask)
+            mismatched = int(np.count_nonzero(filtered != reference_filter(depth_map, config, mask)))
+            if mismatched:
+                problems.append(f"{label}, {window}-pixel median: {mismatched} pixels differ from the reference")
+            timings.append(f"{window}-px median {best_ms(depth_map, config, args.repeats):6.2f} ms")
+        print(f"  {label:20s} {' | '.join(timings)}  ({stats['removed']} of {stats['input']} pixels removed)")
+        if label == 'full 400P frame':
+            worst = best_ms(depth_map, DEPTH_FILTER_CONFIG, args.repeats)
+            if worst > args.budget_ms:
+                problems.append(f"{worst:.1f} ms for a full 400P frame, budget {args.budget_ms:.0f} ms")
+        if mask is not None:
+            problems += check_holes(depth_map, mask)
+    problems += check_fixture_verdict()
+
+    if problems:
+        print("\n✗ " + "\n✗ ".join(problems))
+        sys.exit(1)
+    print(f"\n✓ The depth filter matches the reference, keeps the fixture verdict and stays within "
+          f"{args.budget_ms:.0f} ms per 400P frame")
+
+if __name__ == "__main__":
+    main()
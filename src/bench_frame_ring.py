@@ -0,0 +1,170 @@
+"""
+Frame handoff benchmark: shared-memory ring versus PNG files (no hardware needed)
+A producer process publishes 1080p RGB + 400P depth + mask frames and a consumer
+process in a separate interpreter receives them, once through frame_ring.FrameRing and
+once through PNG files in a directory plus a sequence file (how the stages hand off
+today). Reports delivery latency at a fixed frame rate and the maximum throughput, and
+fails if the ring delivers a torn frame or is not faster than files.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+RING_NAME = "wood_qa_bench_ring"
+
+def frame_shapes():
+    """Configured frame sizes, with raw uint16 depth so both transports carry the same data."""
+    from frame_ring import default_shapes
+
+    shapes = default_shapes()
+    shapes['depth'] = (shapes['depth'][0], 'uint16')
+    return shapes
+
+def make_frames(count, seed=0):
+    """Distinct synthetic frames; depth[0, 0] holds the frame index for checking delivery."""
+    shapes = frame_shapes()
+    rng = np.random.default_rng(seed)
+    frames = []
+    for index in range(count):
+        rgb = rng.integers(0, 256, shapes['rgb'][0], dtype=np.uint8)
+        depth = rng.integers(400, 900, shapes['depth'][0]).astype(shapes['depth'][1])
+        depth[0, 0] = index
+        mask = (depth > 650).astype(np.uint8) * 255
+        frames.append((rgb, depth, mask))
+    return frames
+
+def produce(transport, directory, n_frames, fps, ready):
+    """Producer process: publish n_frames (at fps, or as fast as possible when fps is 0)."""
+    import cv2
+    frames = make_frames(4)
+    if transport == 'ring':
+        from frame_ring import FrameRing
+        ring = FrameRing.attach(RING_NAME)
+    ready.wait()
+    for seq in range(1, n_frames + 1):
+        start = time.time()
+        rgb, depth, mask = frames[seq % len(frames)]
+        if transport == 'ring':
+            ring.write(rgb, depth, mask, meta={'sent': start, 'index': seq % len(frames)})
+        else:
+            for name, image in (('rgb.png', rgb), ('depth.png', depth), ('mask.png', mask)):
+                path = os.path.join(directory, name)
+                cv2.imwrite(path + ".partial.png", image)
+                os.replace(path + ".partial.png", path)
+            with open(os.path.join(directory, "seq.partial"), "w") as f:
+                f.write(f"{seq} {start} {seq % len(frames)}")
+            os.replace(os.path.join(directory, "seq.partial"), os.path.join(directory, "seq"))
+        if fps:
+            time.sleep(max(0.0, 1.0 / fps - (time.time() - start)))
+    if transport == 'ring':
+        ring.close()
+
+def consume(transport, directory, n_frames, results, ready, timeout=30.0):
+    """Consumer process: receive frames, check their content and record latencies."""
+    import cv2
+    expected = [frame[1][0, 0] for frame in make_frames(4)]
+    latencies, torn, last = [], 0, 0
+    if transport == 'ring':
+        from frame_ring import FrameRing
+        ring = FrameRing.attach(RING_NAME)
+    ready.set()
+    deadline = time.time() + timeout
+    while last < n_frames and time.time() < deadline:
+        if transport == 'ring':
+            frame = ring.wait(last, timeout=1.0)
+            if frame is None:
+                continue
+            depth_value, mask_value = frame.depth[0, 0], frame.mask[0, 0]  # zero-copy reads
+            received = time.time()
+            ok = frame.valid() and depth_value == expected[frame.meta['index']] and mask_value in (0, 255)
+            seq, sent = frame.seq, frame.meta['sent']
+            del frame  # views must go before the ring is closed
+        else:
+            try:
+                with open(os.path.join(directory, "seq")) as f:
+                    seq, sent, index = f.read().split()
+            except FileNotFoundError:
+                time.sleep(0.0002)
+                continue
+            seq, sent, index = int(seq), float(sent), int(index)
+            if seq <= last:
+                time.sleep(0.0002)
+                continue
+            rgb = cv2.imread(os.path.join(directory, "rgb.png"), cv2.IMREAD_UNCHANGED)
+            depth = cv2.imread(os.path.join(directory, "depth.png"), cv2.IMREAD_UNCHANGED)
+            mask = cv2.imread(os.path.join(directory, "mask.png"), cv2.IMREAD_UNCHANGED)
+            received = time.time()
+            # The producer may already have replaced some files with the next frame
+            ok = rgb is not None and mask is not None and depth is not None and depth[0, 0] == expected[index]
+        latencies.append(received - sent)
+        torn += not ok
+        last = seq
+    if transport == 'ring':
+        ring.close()
+    results.put({'received': len(latencies), 'torn': torn, 'latencies': latencies})
+
+def run(transport, n_frames, fps):
+    """One producer/consumer pair. Returns the consumer's results and the elapsed seconds."""
+    context = multiprocessing.get_context("spawn")
+    results, ready = context.Queue(), context.Event()
+    with tempfile.TemporaryDirectory() as directory:
+        ring = None
+        if transport == 'ring':
+            from frame_ring import FrameRing
+            ring = FrameRing.create(RING_NAME, shapes=frame_shapes())
+        try:
+            consumer = context.Process(target=consume, args=(transport, directory, n_frames, results, ready))
+            producer = context.Process(target=produce, args=(transport, directory, n_frames, fps, ready))
+            consumer.start()
+            producer.start()
+            ready.wait()
+            start = time.perf_counter()
+            producer.join()
+            elapsed = time.perf_counter() - start
+            result = results.get(timeout=60)
+            consumer.join()
+        finally:
+            if ring is not None:
+                ring.remove()
+    return result, elapsed
+
+def main():
+    """Compare the shared-memory ring with the PNG file handoff."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--fps", type=float, default=10.0, help="Frame rate of the latency run")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Frame handoff benchmark: shared memory ring vs PNG files")
+    print("=" * 50)
+
+    summary = {}
+    torn_ring = 0
+    for transport in ('files', 'ring'):
+        paced, _ = run(transport, args.frames, args.fps)
+        flood, elapsed = run(transport, args.frames, 0)
+        latencies = np.array(paced['latencies']) * 1000
+        summary[transport] = float(np.percentile(latencies, 50))
+        if transport == 'ring':
+            torn_ring = paced['torn'] + flood['torn']
+        print(f"  {transport:6s} latency p50 {np.percentile(latencies, 50):7.2f} ms, "
+              f"p99 {np.percentile(latencies, 99):7.2f} ms at {args.fps:.0f} fps; "
+              f"flat out {args.frames / elapsed:6.1f} frames/s sent, {flood['received']} received, "
+              f"{paced['torn'] + flood['torn']} torn")
+
+    if torn_ring:
+        print(f"\n✗ The ring delivered {torn_ring} torn frame(s)")
+        sys.exit(1)
+    if summary['ring'] >= summary['files']:
+        print("\n✗ The ring is not faster than the file handoff")
+        sys.exit(1)
+    print(f"\n✓ Ring handoff is {summary['files'] / summary['ring']:.0f}x faster than PNG files")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Import-time benchmark for the wood_qa command line entry point
+Runs each non-ML subcommand's cold start in a fresh interpreter under
+`python -X importtime`: resources.configure_process (which wood_qa.main runs before any
+stage loads) followed by the stage imports. Fails if the cold start exceeds its budget,
+pulls in torch/transformers, or a stage cannot be imported. Only a missing optional
+hardware module (depthai) skips a subcommand
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from constants import IMPORT_TIME_BUDGET_MS, ML_MODULES, OPTIONAL_HARDWARE_MODULES
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def measure_imports(command):
+    """Cold-start a subcommand the way wood_qa.main does in a fresh interpreter. Returns
+    ({module: self_us}, configure_process microseconds)."""
+    code = f"import sys; sys.path.insert(0, {SRC_DIR!r}); import wood_qa"
+    if command != 'cli':
+        code += (f"; import time, resources; start = time.perf_counter()"
+                 f"; resources.configure_process(wood_qa.STAGE_MODULES[{command!r}])"
+                 f"; print(int((time.perf_counter() - start) * 1e6))"
+                 f"; wood_qa.import_stage({command!r})")
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1]
+        missing = re.search(r"No module named '([\w.]+)'", error)
+        raise ImportError(error, name=missing.group(1) if missing else None)
+    configure_us = int(result.stdout.split()[0]) if command != 'cli' else 0
+
+    # Lines look like: "import time:       123 |       4567 |   package.module"
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        imports[name.strip()] = int(self_us)
+    return imports, configure_us
+
+def benchmark_command(command, repeats=5):
+    """Return (best total milliseconds, its configure_process milliseconds, imported module
+    names) over several cold starts."""
+    best_ms = best_configure_ms = None
+    modules = set()
+    for _ in range(repeats):
+        imports, configure_us = measure_imports(command)
+        total_ms = (sum(imports.values()) + configure_us) / 1000.0
+        if best_ms is None or total_ms < best_ms:
+            best_ms, best_configure_ms = total_ms, configure_us / 1000.0
+        modules.update(imports)
+    return best_ms, best_configure_ms, modules
+
+def main():
+    """Benchmark every budgeted subcommand and exit non-zero on regression."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5, help="Cold starts per subcommand (best is kept)")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("wood_qa cold start import-time benchmark")
+    print("=" * 50)
+
+    failures = 0
+    for command, budget_ms in IMPORT_TIME_BUDGET_MS.items():
+        try:
+            total_ms, configure_ms, modules = benchmark_command(command, args.repeats)
+        except ImportError as e:
+            if e.name and e.name.split(".")[0] in OPTIONAL_HARDWARE_MODULES:
+                print(f"- {command:<10} skipped ({e})")
+            else:
+                print(f"✗ {command:<10} cannot be imported ({e})")
+                failures += 1
+            continue
+        detail = f"budget {budget_ms} ms" + (f", configure_process {configure_ms:.1f} ms" if command != 'cli' else "")
+
+        ml_imported = sorted(m for m in modules if m.split(".")[0] in ML_MODULES)
+        if ml_imported:
+            print(f"✗ {command:<10} imports ML packages: {', '.join(ml_imported[:5])}")
+            failures += 1
+        elif total_ms > budget_ms:
+            print(f"✗ {command:<10} {total_ms:8.1f} ms ({detail})")
+            failures += 1
+        else:
+            print(f"✓ {command:<10} {total_ms:8.1f} ms ({detail})")
+
+    if failures:
+        print(f"\n✗ {failures} subcommand(s) over budget or not importable")
+        sys.exit(1)
+    print("\n✓ All subcommands within budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Multi-camera scaling benchmark using fake device stand-ins (no hardware needed)
+Each fake camera sees a different strip of one flat, tilted panel and takes a fixed
+time to deliver frames. Checks that the merged cloud is still flat (extrinsics and
+per-device intrinsics applied correctly) and that capture time scales with cameras
+"""
+
+import argparse
+import sys
+import time
+import numpy as np
+from multi_camera import capture_all, merge_clouds, analyze_cloud
+from constants import DEVIATION_THRESHOLD
+
+WIDTH, HEIGHT = 640, 400
+CAMERA_SPACING = 0.20  # meters between neighbouring cameras along x
+PANEL_DISTANCE = 0.60  # meters from the cameras to the panel
+PANEL_TILT = 0.05      # dz/dx slope of the panel in the common frame
+
+class FakeDeviceInfo:
+    """Stand-in for dai.DeviceInfo."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def getMxId(self):
+        return f"FAKE{self.index:04d}"
+
+def fake_intrinsics(index):
+    """Slightly different intrinsics per fake device, like real per-unit calibration."""
+    return {'fx': 450.0 + 5 * index, 'fy': 451.0 + 5 * index, 'cx': 318.0 + index, 'cy': 201.0 - index}
+
+def fake_extrinsics(n_devices):
+    """Cameras side by side along x, all looking straight at the panel."""
+    extrinsics = {}
+    for index in range(n_devices):
+        transform = np.eye(4)
+        transform[0, 3] = index * CAMERA_SPACING
+        extrinsics[FakeDeviceInfo(index).getMxId()] = transform.tolist()
+    return extrinsics
+
+def render_depth(index):
+    """Render the depth (mm) a fake camera sees of the shared tilted panel."""
+    intr = fake_intrinsics(index)
+    offset = index * CAMERA_SPACING
+    v, u = np.mgrid[0:HEIGHT, 0:WIDTH].astype(np.float64)
+    # Plane in the common frame: z = PANEL_DISTANCE + PANEL_TILT * x_common, x_common = x_cam + offset
+    rx = (u - intr['cx']) / intr['fx']
+    z = (PANEL_DISTANCE + PANEL_TILT * offset) / (1.0 - PANEL_TILT * rx)
+    return np.round(z * 1000.0).astype(np.uint16)
+
+def make_fake_capture(latency):
+    """Return a capture function that behaves like capture_from_device on a fake camera."""
+    def capture(info):
+        time.sleep(latency)  # USB transfer / frame wait, releases the GIL like depthai does
+        return {
+            'mxid': info.getMxId(),
+            'rgb': None,
+            'depth': render_depth(info.index),
+            'intrinsics': fake_intrinsics(info.index),
+        }
+    return capture
+
+def run(n_devices, latency):
+    """Capture and merge n fake cameras. Returns (seconds, merged points, std_dev)."""
+    devices = [FakeDeviceInfo(index) for index in range(n_devices)]
+    start = time.perf_counter()
+    captures = capture_all(make_fake_capture(latency), devices)
+    cloud = merge_clouds(captures, extrinsics=fake_extrinsics(n_devices))
+    _, _, std_dev, _ = analyze_cloud(cloud)
+    return time.perf_counter() - start, len(cloud), std_dev
+
+def main():
+    """Benchmark 1..N fake cameras and fail if scaling or merged flatness regress."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-devices", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake capture latency per device (seconds)")
+    parser.add_argument("--min-efficiency", type=float, default=0.7,
+                        help="Required parallel efficiency (single-camera time / N-camera time)")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Multi-camera scaling benchmark (fake devices)")
+    print("=" * 50)
+
+    failures = 0
+    baseline = None
+    for n_devices in range(1, args.max_devices + 1):
+        elapsed, n_points, std_dev = run(n_devices, args.latency)
+        baseline = baseline or elapsed
+        efficiency = baseline / elapsed
+        flat = std_dev <= DEVIATION_THRESHOLD
+        ok = flat and efficiency >= args.min_efficiency
+        failures += not ok
+        print(f"{'✓' if ok else '✗'} {n_devices} camera(s): {elapsed:.3f} s, {n_points} points, "
+              f"std dev {std_dev * 1000:.3f} mm, efficiency {efficiency:.2f}")
+
+    if failures:
+        print("\n✗ Multi-camera scaling or merge check failed")
+        sys.exit(1)
+    print("\n✓ Merged clouds are flat and capture scales across cameras")
+
+if __name__ == "__main__":
+    main()
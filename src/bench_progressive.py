@@ -0,0 +1,68 @@
+"""
+Progressive verdict benchmark on synthetic panels (no hardware needed)
+Generates clearly flat, clearly warped and borderline panels, then checks that the
+progressive verdict always matches the full analysis and reports the fraction of
+points it needed and the speed-up
+"""
+
+import argparse
+import sys
+import time
+import numpy as np
+from deviation import fit_plane, compute_deviations, progressive_verdict
+from constants import DEVIATION_THRESHOLD
+
+def make_panel(rng, n_points, bow, noise):
+    """Nx3 points of a tilted 0.6 x 0.4 m panel with a cylindrical bow (m) and noise (m)."""
+    x = rng.uniform(-0.3, 0.3, n_points)
+    y = rng.uniform(-0.2, 0.2, n_points)
+    z = 0.6 + 0.02 * x - 0.01 * y + bow * (x / 0.3) ** 2 + rng.normal(0, noise, n_points)
+    return np.column_stack([x, y, z]).astype(np.float32)
+
+def full_verdict(points):
+    plane_coeffs = fit_plane(points)
+    return float(np.std(compute_deviations(points, plane_coeffs))) > DEVIATION_THRESHOLD
+
+def main():
+    """Check verdict agreement and measure the work saved by the progressive mode."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, default=200000)
+    parser.add_argument("--panels", type=int, default=30)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Progressive verdict benchmark")
+    print("=" * 50)
+
+    rng = np.random.default_rng(42)
+    # (name, bow range, noise range) in meters; the std-dev of a bow b is about 0.3 b
+    kinds = [('flat', (0.0, 0.001), (0.0002, 0.0005)),
+             ('warped', (0.006, 0.02), (0.0002, 0.0005)),
+             ('borderline', (0.003, 0.0036), (0.0002, 0.0005))]
+
+    mismatches = 0
+    total_full = total_progressive = 0.0
+    for name, bow_range, noise_range in kinds:
+        fractions = []
+        for _ in range(args.panels):
+            points = make_panel(rng, args.points, rng.uniform(*bow_range), rng.uniform(*noise_range))
+            start = time.perf_counter()
+            expected = full_verdict(points)
+            total_full += time.perf_counter() - start
+            start = time.perf_counter()
+            result = progressive_verdict(points)
+            total_progressive += time.perf_counter() - start
+            fractions.append(result['fraction'])
+            mismatches += result['warped'] != expected
+        print(f"  {name:10s} mean fraction of points used {np.mean(fractions) * 100:6.2f}% "
+              f"(max {np.max(fractions) * 100:.1f}%)")
+
+    print(f"  full analysis {total_full * 1000:.0f} ms, progressive {total_progressive * 1000:.0f} ms "
+          f"({total_full / total_progressive:.1f}x faster)")
+    if mismatches:
+        print(f"\n✗ {mismatches} progressive verdict(s) differ from the full analysis")
+        sys.exit(1)
+    print("\n✓ Progressive verdicts match the full analysis")
+
+if __name__ == "__main__":
+    main()
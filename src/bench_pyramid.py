@@ -0,0 +1,137 @@
+"""
+Pyramid flatness benchmark on the fixture depth map and synthetic panels (no hardware needed)
+Runs pyramid.pyramid_flatness at several cell sizes against the point-by-point analysis
+of deviation.py on flat, warped, borderline and locally defective panels. Checks that the
+verdict, std-dev and plane agree, that the heatmap holds the exact residual in refined
+cells and the exact cell mean elsewhere, and that a local defect shows up in it; reports the
+fraction of points refined at full resolution and the time per panel
+"""
+
+import argparse
+import sys
+import time
+import numpy as np
+from deviation import fit_plane, compute_deviations
+from point_cloud import PointCloud
+from pyramid import pyramid_flatness
+from constants import DEPTH_SCALE, DEVIATION_THRESHOLD, PYRAMID_CONFIG, WOOD_PANEL_DEPTH_PATH
+
+DEPTH_SHAPE = (400, 640)
+INTRINSICS = {'fx': 452.0, 'fy': 452.5, 'cx': 318.4, 'cy': 201.7}
+FIXTURE_INTRINSICS = {'fx': 400.0, 'fy': 400.0, 'cx': 320.0, 'cy': 200.0}
+
+def make_panel(rng, bow=0.0, bump=None, noise=0.8):
+    """uint16 depth (mm) of a tilted panel with a cylindrical bow (mm) and an optional
+    local bump (row, col, radius in px, height in mm) such as a raised knot."""
+    height, width = DEPTH_SHAPE
+    v, u = np.mgrid[0:height, 0:width]
+    inside = (u >= 100) & (u < 540) & (v >= 60) & (v < 340)
+    x = (u - 320) / 220
+    depth = 600.0 + 0.05 * (u - 320) - 0.03 * (v - 200) - bow * x ** 2 + rng.normal(0, noise, DEPTH_SHAPE)
+    if bump is not None:
+        row, col, radius, lift = bump
+        depth -= lift * np.clip(1 - ((v - row) ** 2 + (u - col) ** 2) / radius ** 2, 0, None)
+    return np.where(inside, np.round(depth), 0).astype(np.uint16)
+
+def full_analysis(depth_map, intrinsics):
+    """(plane, std-dev, per-pixel residual image) the way deviation.py computes them."""
+    cloud = PointCloud.from_depth(depth_map, intrinsics, DEPTH_SCALE)
+    plane = fit_plane(cloud.points)
+    deviations = compute_deviations(cloud.points, plane)
+    residuals = np.zeros(depth_map.shape)
+    residuals[depth_map > 0] = deviations
+    return plane, float(np.std(deviations)), residuals
+
+def borderline_panel(intrinsics, seed=1):
+    """Panel whose bow puts the std-dev just above the threshold (bisected on the bow)."""
+    low, high = 0.0, 8.0
+    for _ in range(30):
+        bow = (low + high) / 2
+        _, std_dev, _ = full_analysis(make_panel(np.random.default_rng(seed), bow=bow), intrinsics)
+        low, high = (low, bow) if std_dev > DEVIATION_THRESHOLD else (bow, high)
+    return make_panel(np.random.default_rng(seed), bow=high)
+
+def timed(function, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return result, (time.perf_counter() - start) * 1000 / repeats
+
+def check_heatmap(result, residuals, depth_map):
+    """Largest heatmap error (m) against the full-resolution residuals."""
+    factor = result['factor']
+    valid = depth_map > 0
+    rows, cols = np.nonzero(valid)
+    top, left = rows.min() // factor * factor, cols.min() // factor * factor
+    cell_rows, cell_cols = (rows - top) // factor, (cols - left) // factor
+    shape = result['cell_residuals'].shape
+    sums = np.zeros(shape)
+    counts = np.zeros(shape)
+    np.add.at(sums, (cell_rows, cell_cols), residuals[rows, cols])
+    np.add.at(counts, (cell_rows, cell_cols), 1)
+    cell_mean = sums / np.maximum(counts, 1)
+    # A refined pixel holds its own |residual|; any other pixel its cell's |mean residual|
+    exact = np.abs(residuals[rows, cols])
+    coarse = np.abs(cell_mean[cell_rows, cell_cols])
+    heat = result['heatmap'][rows, cols]
+    return float(np.min([np.abs(heat - exact), np.abs(heat - coarse)], axis=0).max())
+
+def bump_shown(result, bump):
+    """Whether the bump's core stands above the threshold in the heatmap."""
+    row, col, radius, _ = bump
+    core = result['heatmap'][row - radius // 2:row + radius // 2, col - radius // 2:col + radius // 2]
+    return core.max() > DEVIATION_THRESHOLD
+
+def main():
+    """Compare the pyramid and point-by-point analyses across cell sizes."""
+    import cv2
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--factors", type=int, nargs='+', default=[2, 4, 8, 16])
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Pyramid flatness benchmark")
+    print("=" * 50)
+
+    rng = np.random.default_rng(0)
+    bump = (200, 300, 12, 4.0)
+    panels = [('fixture', cv2.imread(WOOD_PANEL_DEPTH_PATH, cv2.IMREAD_UNCHANGED), FIXTURE_INTRINSICS, None),
+              ('flat', make_panel(rng), INTRINSICS, None),
+              ('warped', make_panel(rng, bow=8.0), INTRINSICS, None),
+              ('borderline', borderline_panel(INTRINSICS), INTRINSICS, None),
+              ('knot', make_panel(rng, bump=bump), INTRINSICS, bump)]
+
+    problems = []
+    for name, depth_map, intrinsics, panel_bump in panels:
+        (plane, std_dev, residuals), full_ms = timed(lambda: full_analysis(depth_map, intrinsics), args.repeats)
+        print(f"\n{name}: {np.count_nonzero(depth_map)} points, std-dev {std_dev * 1000:.7f} mm "
+              f"({'WARPED' if std_dev > DEVIATION_THRESHOLD else 'FLAT'}), point by point {full_ms:.1f} ms")
+        for factor in args.factors:
+            config = dict(PYRAMID_CONFIG, factor=factor)
+            result, pyramid_ms = timed(lambda: pyramid_flatness(depth_map, intrinsics, config=config), args.repeats)
+            std_error = abs(result['std_dev'] - std_dev) / std_dev
+            plane_error = float(np.max(np.abs(result['plane'] - plane)))
+            heatmap_error = check_heatmap(result, residuals, depth_map)
+            print(f"  1/{factor:<2d} {pyramid_ms:6.1f} ms, refined {result['refined_fraction'] * 100:5.1f}% "
+                  f"({result['refined_cells']}/{result['cells']} cells), std-dev error {std_error:.1e}, "
+                  f"plane error {plane_error:.1e}, heatmap error {heatmap_error:.1e}"
+                  + (", fallback" if result['fallback'] else ""))
+            label = f"{name} 1/{factor}"
+            if result['warped'] != (std_dev > DEVIATION_THRESHOLD):
+                problems.append(f"{label}: verdict differs from the point-by-point analysis")
+            if std_error > 1e-5 or plane_error > 1e-5:
+                problems.append(f"{label}: std-dev or plane differs from the point-by-point analysis")
+            if heatmap_error > 1e-6:
+                problems.append(f"{label}: heatmap is off by {heatmap_error:.1e} m")
+            if panel_bump is not None and not bump_shown(result, panel_bump):
+                problems.append(f"{label}: the local defect does not show in the heatmap")
+
+    if problems:
+        print("\n✗ " + "\n✗ ".join(problems))
+        sys.exit(1)
+    print("\n✓ Pyramid verdicts, std-devs, planes and heatmaps match the point-by-point analysis")
+
+if __name__ == "__main__":
+    main()
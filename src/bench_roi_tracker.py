@@ -0,0 +1,147 @@
+"""
+ROI tracking benchmark on a synthetic panel sequence (no hardware or model needed)
+A wood-coloured panel drifts slowly across 1080p frames and jumps once to another spot.
+A stand-in for CLIPSeg (colour probability computed at the model's 352x352 input size,
+then resized back, like extract_wood.predict_masks) segments every frame once over the
+full frame and once through roi_tracker.RoiTracker. Reports mask accuracy, how often the
+tracker fell back to the full frame, the preprocessing cost, and the geometry time with
+the depth window; fails if tracking loses accuracy, misses the jump, or the depth window
+changes the plane fit
+"""
+
+import argparse
+import sys
+import time
+import numpy as np
+from compact_mask import CompactMask
+from depth_filter import filter_depth
+from roi_tracker import RoiTracker
+from workspace import FrameWorkspace
+from constants import DEPTH_SCALE, ROI_TRACKER_CONFIG
+
+RGB_SHAPE = (1080, 1920)
+DEPTH_SHAPE = (400, 640)
+MODEL_SIZE = 352
+INTRINSICS = {'fx': 452.0, 'fy': 452.5, 'cx': 318.4, 'cy': 201.7}
+
+def panel_box(index, jump_at):
+    """Panel bbox (fractions of the frame) in frame index: slow drift, then a jump."""
+    if index < jump_at:
+        top, left = 0.30 + 0.002 * index, 0.20 + 0.004 * index
+    else:
+        top, left = 0.15 + 0.002 * (index - jump_at), 0.55 + 0.003 * (index - jump_at)
+    return top, left, top + 0.35, left + 0.30
+
+def make_frame(box, rng):
+    """(rgb, depth in mm, true mask at RGB size) with the panel at box."""
+    height, width = RGB_SHAPE
+    rgb = rng.integers(90, 140, (height, width, 3), dtype=np.uint8)  # grey conveyor
+    top, left, bottom, right = (int(box[0] * height), int(box[1] * width), int(box[2] * height), int(box[3] * width))
+    grain = rng.integers(-15, 15, (bottom - top, right - left), dtype=np.int16)
+    for channel, base in enumerate((170, 120, 70)):
+        rgb[top:bottom, left:right, channel] = np.clip(base + grain, 0, 255)
+    truth = np.zeros(RGB_SHAPE, dtype=bool)
+    truth[top:bottom, left:right] = True
+
+    d_height, d_width = DEPTH_SHAPE
+    v, u = np.mgrid[0:d_height, 0:d_width]
+    depth = 600.0 + 0.04 * (u - d_width / 2) + 0.02 * (v - d_height / 2) + rng.normal(0, 0.8, DEPTH_SHAPE)
+    return rgb, np.round(depth).astype(np.uint16), truth
+
+def predict(images):
+    """CLIPSeg stand-in: panel colour score at the model's input size, resized back."""
+    import cv2
+
+    masks = []
+    for image in images:
+        array = np.asarray(image)
+        small = cv2.resize(array, (MODEL_SIZE, MODEL_SIZE), interpolation=cv2.INTER_LINEAR).astype(np.float32)
+        score = (small[..., 0] - small[..., 2]) / 100.0  # reddish-brown vs grey
+        probability = 1.0 / (1.0 + np.exp(-8.0 * (score - 0.5)))
+        masks.append(cv2.resize(probability, image.size, interpolation=cv2.INTER_LINEAR))
+    return masks
+
+def geometry(workspace, mask, depth, window_margin):
+    """Mask, filter and fit like the inspection service, optionally inside the depth window."""
+    from extract_wood import apply_mask_to_depth
+
+    depth_map, depth_mask = apply_mask_to_depth(mask, depth)
+    window = depth_mask.window(window_margin) if window_margin is not None else None
+    mask_array = depth_mask.to_array()
+    if window is None:
+        depth_map, _ = filter_depth(depth_map, mask=mask_array)
+    else:
+        top, left, bottom, right = window
+        depth_map[top:bottom, left:right], _ = filter_depth(depth_map[top:bottom, left:right],
+                                                            mask=mask_array[top:bottom, left:right])
+    _, coeffs, _, std_dev = workspace.analyze(depth_map, INTRINSICS, DEPTH_SCALE, window=window)
+    return coeffs.copy(), std_dev
+
+def main():
+    """Compare full-frame and tracked segmentation and geometry on a synthetic sequence."""
+    from PIL import Image
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=40)
+    args = parser.parse_args()
+    jump_at = args.frames // 2
+
+    print("=" * 50)
+    print("ROI tracking benchmark")
+    print("=" * 50)
+
+    rng = np.random.default_rng(0)
+    frames = [make_frame(panel_box(index, jump_at), rng) for index in range(args.frames)]
+
+    tracker = RoiTracker()
+    workspace = FrameWorkspace()
+    iou = {'full frame': [], 'tracked': []}
+    timings = {'full frame': [0.0, 0.0], 'tracked': [0.0, 0.0]}  # segment, geometry (ms)
+    max_plane_difference = 0.0
+    reacquired_at = []
+    for index, (rgb, depth, truth) in enumerate(frames):
+        truth = CompactMask.from_array(truth)
+
+        start = time.perf_counter()
+        full = CompactMask.from_array(predict([Image.fromarray(rgb)])[0] > 0.5)
+        timings['full frame'][0] += time.perf_counter() - start
+        start = time.perf_counter()
+        reacquired = tracker.stats['reacquired']
+        tracked = tracker.segment([rgb], predict, threshold=0.5)[0]
+        timings['tracked'][0] += time.perf_counter() - start
+        if tracker.stats['reacquired'] > reacquired:
+            reacquired_at.append(index)
+        iou['full frame'].append(full.iou(truth))
+        iou['tracked'].append(tracked.iou(truth))
+
+        start = time.perf_counter()
+        full_fit = geometry(workspace, tracked, depth, None)
+        timings['full frame'][1] += time.perf_counter() - start
+        start = time.perf_counter()
+        window_fit = geometry(workspace, tracked, depth, ROI_TRACKER_CONFIG['depth_margin'])
+        timings['tracked'][1] += time.perf_counter() - start
+        max_plane_difference = max(max_plane_difference, float(np.max(np.abs(full_fit[0] - window_fit[0]))),
+                                   abs(full_fit[1] - window_fit[1]))
+
+    for label in iou:
+        segment_ms, geometry_ms = (value * 1000 / args.frames for value in timings[label])
+        print(f"  {label:10s} mask IoU mean {np.mean(iou[label]):.4f} (min {np.min(iou[label]):.4f}), "
+              f"segment {segment_ms:6.1f} ms, geometry {geometry_ms:6.1f} ms per frame")
+    summary = tracker.summary()
+    print(f"  tracker: {summary['cropped']} cropped, {summary['full']} full-frame passes, "
+          f"re-acquired at frame(s) {reacquired_at}, mean crop {summary['mean_crop'] * 100:.0f}% of the frame")
+    print(f"  depth window vs full frame: max plane/std difference {max_plane_difference:.2e}")
+
+    if np.mean(iou['tracked']) < np.mean(iou['full frame']) - 0.005:
+        print("\n✗ Tracked segmentation is less accurate than full-frame segmentation")
+        sys.exit(1)
+    if jump_at not in reacquired_at:
+        print("\n✗ The tracker did not re-acquire the panel after it jumped")
+        sys.exit(1)
+    if max_plane_difference > 1e-9:
+        print("\n✗ Restricting geometry to the depth window changed the result")
+        sys.exit(1)
+    print("\n✓ ROI tracking keeps accuracy and the depth window gives identical geometry")
+
+if __name__ == "__main__":
+    main()
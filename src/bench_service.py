@@ -0,0 +1,77 @@
+"""
+Load-test client for the local inspection service
+Sends the repo's RGB/depth frames from several concurrent clients and reports
+throughput, p50/p99 latency and the mean micro-batch size at each concurrency level.
+Start the service first: python src/wood_qa.py serve
+"""
+
+import argparse
+import json
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from inspection_service import encode_request
+from constants import INSPECTION_SERVICE_CONFIG, RGB_IMAGE_PATH, DEPTH_MAP_PATH
+
+def post(url, body):
+    """POST one frame; returns (latency seconds, decoded reply)."""
+    start = time.perf_counter()
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/octet-stream"})
+    with urllib.request.urlopen(request) as response:
+        reply = json.loads(response.read())
+    return time.perf_counter() - start, reply
+
+def run_level(url, body, concurrency, n_requests):
+    """Fire n_requests from `concurrency` clients. Returns (seconds, latencies, replies)."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: post(url, body), range(n_requests)))
+    elapsed = time.perf_counter() - start
+    return elapsed, np.array([latency for latency, _ in results]), [reply for _, reply in results]
+
+def main():
+    """Measure latency versus throughput of a running inspection service."""
+    config = INSPECTION_SERVICE_CONFIG
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default=f"http://{config['host']}:{config['port']}/inspect")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="Fail if p99 latency exceeds this")
+    args = parser.parse_args()
+
+    rgb = cv2.cvtColor(cv2.imread(RGB_IMAGE_PATH), cv2.COLOR_BGR2RGB)
+    depth = cv2.imread(DEPTH_MAP_PATH, cv2.IMREAD_UNCHANGED)
+    if rgb is None or depth is None:
+        print(f"✗ Could not load {RGB_IMAGE_PATH} / {DEPTH_MAP_PATH}")
+        sys.exit(1)
+    body = encode_request(rgb, depth)
+
+    print("=" * 50)
+    print(f"Inspection service load test ({args.url})")
+    print("=" * 50)
+
+    try:
+        post(args.url, body)  # warm up
+    except Exception as e:
+        print(f"✗ Service not reachable: {e}")
+        sys.exit(1)
+
+    failures = 0
+    for concurrency in (int(value) for value in args.concurrency.split(",")):
+        elapsed, latencies, replies = run_level(args.url, body, concurrency, args.requests)
+        p50, p99 = np.percentile(latencies * 1000, [50, 99])
+        batch = np.mean([reply['batch_size'] for reply in replies])
+        ok = args.max_p99_ms is None or p99 <= args.max_p99_ms
+        failures += not ok
+        print(f"{'✓' if ok else '✗'} {concurrency:2d} clients: {args.requests / elapsed:6.2f} frames/s, "
+              f"p50 {p50:7.1f} ms, p99 {p99:7.1f} ms, mean batch {batch:.1f}, verdict {replies[-1]['verdict']}")
+
+    if failures:
+        print("\n✗ p99 latency over budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
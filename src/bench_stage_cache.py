@@ -0,0 +1,142 @@
+"""
+Stage cache benchmark: re-analysis of the fixture panel (no camera or model needed)
+Runs segment -> cloud -> deviation on a copy of the repository fixtures with the stage
+cache on. The CLIPSeg logits are seeded from the golden mask, so the segment stage runs
+from its cache entry without torch. The chain is run cold, again unchanged, with a new
+DEVIATION_THRESHOLD and with a new segmentation threshold; each run reports which
+stages hit the cache and its time. Also checks least-recently-used eviction against the
+size limit. Fails if a run misses a stage whose inputs did not change, or if a cached
+run changes any output
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import stage_cache
+from stage_cache import StageCache
+from constants import (
+    DEVIATIONS_PATH, DEPTH_MAP_PATH, RGB_IMAGE_PATH, STAGE_CACHE_CONFIG, WOOD_PANEL_MASK_PATH
+)
+
+FIXTURES = (RGB_IMAGE_PATH, DEPTH_MAP_PATH, WOOD_PANEL_MASK_PATH)
+
+def seed_logits(cache):
+    """Store logits for the fixture image that reproduce the golden mask, under the key
+    the segment stage looks up."""
+    import cv2
+    from PIL import Image
+    from extract_wood import logits_cache_key
+    from constants import TEXT_OR_IMAGE, TEXT_PROMPT
+
+    rgb_image = Image.open(RGB_IMAGE_PATH).convert("RGB")
+    mask = cv2.imread(WOOD_PANEL_MASK_PATH, cv2.IMREAD_GRAYSCALE)
+    small = cv2.resize(mask.astype(np.float32) / 255, (352, 352), interpolation=cv2.INTER_AREA)
+    logits = (12.0 * (small - 0.5))[None].astype(np.float32)  # (1, 352, 352) like predict_logits
+    key = logits_cache_key(cache, rgb_image, TEXT_PROMPT if TEXT_OR_IMAGE else None)
+    cache.put('logits', key, logits=logits)
+
+def run_chain():
+    """segment, cloud and deviation like python src/wood_qa.py inspect. Returns
+    (seconds, verdict line, deviations file bytes, per-stage cache counts)."""
+    import artifact_writer
+    import deviation
+    import depth_to_cloud
+    import extract_wood
+
+    cache = stage_cache.get_cache()
+    cache.stats.clear()
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        for module in (extract_wood, depth_to_cloud, deviation):
+            module.main()
+        artifact_writer.get_writer().flush()
+    elapsed = time.perf_counter() - start
+    verdict = next(line for line in output.getvalue().splitlines() if line.startswith("Wood panel is"))
+    with open(DEVIATIONS_PATH, 'rb') as f:
+        deviations = f.read()
+    return elapsed, verdict, deviations, cache.summary()
+
+def check_eviction(directory):
+    """Problems with LRU eviction in a small cache (empty list if none)."""
+    config = dict(STAGE_CACHE_CONFIG, dir=directory, max_mb=0.5)
+    cache = StageCache(config, enabled=True)
+    payload = np.zeros(100_000 // 8)  # ~100 kB per entry
+    keys = [cache.key('bench', index) for index in range(12)]
+    for index, key in enumerate(keys):
+        cache.put('bench', key, values=payload + index)
+        time.sleep(0.01)  # distinct modification times
+        if index >= 3:
+            cache.get('bench', keys[0])  # keep the first entry in use
+    problems = []
+    total = sum(size for _, size, _, _ in cache.entries())
+    if total > cache.max_bytes:
+        problems.append(f"cache holds {total} bytes, limit {cache.max_bytes}")
+    if cache.get('bench', keys[0]) is None:
+        problems.append("the most recently used entry was evicted")
+    if cache.get('bench', keys[1]) is not None:
+        problems.append("the least recently used entry was kept")
+    if cache.get('bench', keys[-1])['values'][0] != len(keys) - 1:
+        problems.append("the newest entry does not hold what was stored")
+    print(f"  LRU eviction: {len(cache.entries())} of {len(keys)} entries kept within {config['max_mb']} MB, "
+          f"{cache.summary()['evicted']} evicted")
+    return problems
+
+def main():
+    """Re-run the fixture chain with the stage cache and check what it reuses."""
+    argparse.ArgumentParser(description=__doc__).parse_args()
+
+    print("=" * 50)
+    print("Stage cache benchmark")
+    print("=" * 50)
+
+    repository = os.getcwd()
+    problems = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in FIXTURES:
+            shutil.copy(os.path.join(repository, name), workdir)
+        os.chdir(workdir)
+        try:
+            import deviation
+            import extract_wood
+
+            cache = stage_cache.get_cache(enabled=True)
+            seed_logits(cache)
+            threshold = deviation.DEVIATION_THRESHOLD
+            segmentation_threshold = extract_wood.SEGMENTATION_THRESHOLD
+            # (label, DEVIATION_THRESHOLD, SEGMENTATION_THRESHOLD, stages that must hit)
+            runs = [('cold', threshold, segmentation_threshold, {'logits'}),
+                    ('unchanged', threshold, segmentation_threshold, {'logits', 'mask', 'cloud', 'fit'}),
+                    ('new deviation threshold', threshold / 2, segmentation_threshold,
+                     {'logits', 'mask', 'cloud', 'fit'}),
+                    ('new segmentation threshold', threshold, segmentation_threshold - 0.2, {'logits'})]
+            reference = None
+            for label, deviation.DEVIATION_THRESHOLD, extract_wood.SEGMENTATION_THRESHOLD, must_hit in runs:
+                elapsed, verdict, deviations, summary = run_chain()
+                hits = {stage for stage, counts in summary['stages'].items() if counts['hits']}
+                print(f"  {label:27s} {elapsed * 1000:7.1f} ms  hits: {', '.join(sorted(hits)) or '-'}  ({verdict})")
+                if must_hit - hits:
+                    problems.append(f"{label}: {', '.join(sorted(must_hit - hits))} missed the cache")
+                if 'torch' in sys.modules:
+                    problems.append(f"{label}: the segment stage loaded the model")
+                if reference is None:
+                    reference = deviations
+                elif 'fit' in hits and deviations != reference:
+                    problems.append(f"{label}: cached deviations differ from the cold run")
+            problems += check_eviction(os.path.join(workdir, 'lru'))
+        finally:
+            os.chdir(repository)
+
+    if problems:
+        print("\n✗ " + "\n✗ ".join(problems))
+        sys.exit(1)
+    print("\n✓ Unchanged stages come from the cache and the cache stays within its size limit")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Thread budget sweep: finds the best split of the machine's cores between segmentation
+(CLIPSeg) and geometry (mask resize, depth filter, plane fit, PNG encode)
+Both workloads run at the same time in separate processes, as in the inspection service
+or when cameras overlap. Each candidate split gives segmentation the first k cores and
+geometry the rest; the unpinned full-width setting (every library's default) is measured
+as the baseline. Uses the fixture images in the repository root. Without torch only the
+geometry workload is swept.
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import numpy as np
+
+def run_workload(kind, budget, duration, results):
+    """Worker process: apply the budget, then time iterations of one workload."""
+    import resources
+    resources.THREAD_BUDGETS[kind] = budget
+    resources.configure_process([kind])  # before numpy starts its BLAS pool in this process
+    import cv2
+    from constants import DEPTH_MAP_PATH, DEPTH_SCALE, DEPTH_CAMERA, WOOD_PANEL_MASK_PATH, RGB_IMAGE_PATH, TEXT_PROMPT
+    resources.apply_budget(kind)
+
+    if kind == 'segment':
+        from PIL import Image
+        from extract_wood import load_segmentation_model, predict_mask
+        processor, model = load_segmentation_model(local_files_only=True)
+        rgb_image = Image.open(RGB_IMAGE_PATH).convert("RGB")
+        step = lambda: predict_mask(processor, model, rgb_image, TEXT_PROMPT)
+    else:
+        from calibration import get_intrinsics
+        from depth_filter import filter_depth
+        from extract_wood import apply_mask_to_depth
+        from workspace import FrameWorkspace
+        depth_map = cv2.imread(DEPTH_MAP_PATH, cv2.IMREAD_UNCHANGED)
+        mask = cv2.imread(WOOD_PANEL_MASK_PATH, cv2.IMREAD_GRAYSCALE)
+        rgb_size_mask = cv2.resize(mask, (mask.shape[1] * 2, mask.shape[0] * 2), interpolation=cv2.INTER_NEAREST)
+        intrinsics = get_intrinsics(DEPTH_CAMERA)
+        workspace = FrameWorkspace()
+
+        def step():
+            resized = cv2.resize(rgb_size_mask, (depth_map.shape[1], depth_map.shape[0]),
+                                 interpolation=cv2.INTER_NEAREST)
+            panel_depth, _ = apply_mask_to_depth(resized, depth_map)
+            filtered, _ = filter_depth(panel_depth)
+            workspace.analyze(filtered, intrinsics, DEPTH_SCALE)
+            cv2.imencode('.png', resized)
+
+    step()  # warm-up (lazy allocations, first-run kernels)
+    latencies = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        step()
+        latencies.append(time.perf_counter() - start)
+    results.put((kind, latencies))
+
+def measure(budgets, duration):
+    """Run the workloads in budgets concurrently. Returns {kind: {'rate', 'p50_ms', 'p99_ms'}}."""
+    context = multiprocessing.get_context("spawn")  # fresh interpreters: pools start with the budget
+    results = context.Queue()
+    processes = [context.Process(target=run_workload, args=(kind, budget, duration, results))
+                 for kind, budget in budgets.items()]
+    for process in processes:
+        process.start()
+    collected = {}
+    while len(collected) < len(processes):
+        try:
+            kind, latencies = results.get(timeout=1.0)
+            collected[kind] = latencies
+        except queue.Empty:
+            if any(process.exitcode not in (None, 0) for process in processes):
+                for process in processes:
+                    process.terminate()
+                raise RuntimeError("a workload process failed (see the traceback above)")
+    for process in processes:
+        process.join()
+    summary = {}
+    for kind, latencies in collected.items():
+        latencies = np.array(latencies) * 1000
+        summary[kind] = {'rate': len(latencies) / duration,
+                         'p50_ms': float(np.percentile(latencies, 50)),
+                         'p99_ms': float(np.percentile(latencies, 99))}
+    return summary
+
+def candidate_splits(cpus, kinds):
+    """(label, budgets) pairs: the unpinned baseline plus every pinned split of cpus."""
+    width = len(cpus)
+    candidates = [("unpinned, full width", {kind: {'threads': width, 'cpus': None} for kind in kinds})]
+    if len(kinds) == 1:
+        for threads in range(1, width + 1):
+            candidates.append((f"{threads} thread(s)", {kinds[0]: {'threads': threads, 'cpus': cpus[:threads]}}))
+        return candidates
+    for k in range(1, width):
+        candidates.append((f"segment {k} / geometry {width - k}",
+                           {'segment': {'threads': k, 'cpus': cpus[:k]},
+                            'geometry': {'threads': width - k, 'cpus': cpus[k:]}}))
+    return candidates
+
+def score(summary):
+    """Panels per second the pair sustains (each panel needs one mask and one geometry pass)."""
+    return min(result['rate'] for result in summary.values())
+
+def main():
+    """Sweep thread splits and print the best one as a THREAD_BUDGETS entry."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per candidate")
+    args = parser.parse_args()
+
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    try:
+        import torch  # noqa: F401 (only checks that the segmentation workload can run)
+        kinds = ['segment', 'geometry']
+    except ImportError:
+        print("⚠️ torch is not installed; sweeping the geometry workload only")
+        kinds = ['geometry']
+
+    print("=" * 50)
+    print(f"Thread budget sweep on {len(cpus)} core(s)")
+    print("=" * 50)
+
+    best = None
+    for label, budgets in candidate_splits(cpus, kinds):
+        try:
+            summary = measure(budgets, args.duration)
+        except Exception as e:
+            print(f"✗ {label}: {e}")
+            sys.exit(1)
+        parts = ", ".join(f"{kind} {result['rate']:.1f}/s p99 {result['p99_ms']:.0f} ms"
+                          for kind, result in summary.items())
+        print(f"  {label:28s} {parts}")
+        if best is None or score(summary) > score(best[2]) * 1.02:  # prefer earlier (simpler) on ties
+            best = (label, budgets, summary)
+
+    label, budgets, summary = best
+    print(f"\n✓ Best split: {label} ({score(summary):.1f} panels/s)")
+    names = {'segment': ['extract_wood', 'inspection_service'], 'geometry': ['depth_to_cloud', 'deviation']}
+    print("THREAD_BUDGETS entries for constants.py:")
+    for kind, budget in budgets.items():
+        for name in names[kind]:
+            print(f"    '{name}': {budget},")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Trigger mode benchmark on a replayed synthetic belt session (no hardware or model needed)
+Records a session of panels riding a belt through the view (one of them warped), then
+replays it through trigger.TriggerSession: once with the depth presence trigger and once
+with socket triggers sent by a stand-in controller thread. Checks that every panel is
+inspected exactly once, centred, with the right verdict, and reports trigger-to-verdict
+latency and panels per minute
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from trigger import PresenceDetector, SocketTrigger, TriggerSession, depth_inspector, replay_frames, send_trigger
+from constants import TRIGGER_CONFIG
+
+DEPTH_SHAPE = (400, 640)
+RGB_SHAPE = (108, 192)   # the depth-mask inspection does not look at RGB; keep the session small
+PANEL_FRAMES = 50        # frames a panel takes to cross the view
+GAP_FRAMES = 10          # empty belt between panels
+WARPED = {2}             # indices of warped panels
+
+def panel_position(frame_index, n_panels):
+    """(panel index, x of the panel centre as a fraction of the width) or (None, None)."""
+    index = frame_index - TRIGGER_CONFIG['background_frames']
+    panel, offset = divmod(index, PANEL_FRAMES + GAP_FRAMES)
+    if index < 0 or panel >= n_panels or offset >= PANEL_FRAMES:
+        return None, None
+    return panel, -0.25 + 1.5 * offset / (PANEL_FRAMES - 1)  # from off-view left to off-view right
+
+def make_session(directory, n_panels, fps, seed=0):
+    """Write the session frames; returns the frame paths."""
+    rng = np.random.default_rng(seed)
+    height, width = DEPTH_SHAPE
+    v, u = np.mgrid[0:height, 0:width]
+    belt = 700.0 + 0.02 * (v - height / 2)  # mm, slightly tilted towards the camera
+    n_frames = TRIGGER_CONFIG['background_frames'] + n_panels * (PANEL_FRAMES + GAP_FRAMES)
+    for frame_index in range(n_frames):
+        depth = belt + rng.normal(0, 0.4, DEPTH_SHAPE)
+        panel, centre = panel_position(frame_index, n_panels)
+        if panel is not None:
+            left, right = int((centre - 0.2) * width), int((centre + 0.2) * width)
+            inside = (u >= left) & (u < right) & (v >= height * 0.25) & (v < height * 0.75)
+            lift = 25.0
+            if panel in WARPED:
+                x = (u - (left + right) / 2) / ((right - left) / 2)
+                lift = lift + 6.0 * (1 - x ** 2)  # bowed panel, 6 mm at the middle
+            depth = np.where(inside, depth - lift, depth)
+        depth[:, :30] = 0  # stereo shadow band
+        rgb = rng.integers(0, 255, RGB_SHAPE + (3,), dtype=np.uint8)
+        np.savez(os.path.join(directory, f"frame_{frame_index:05d}.npz"), rgb=rgb,
+                 depth=np.round(depth).astype(np.uint16), timestamp=frame_index / fps)
+    return n_frames
+
+def check(results, n_panels, expected_ids=None):
+    """Problems with a run's results (empty list if none)."""
+    problems = []
+    if len(results) != n_panels:
+        problems.append(f"{len(results)} panels inspected, expected {n_panels}")
+    for number, entry in enumerate(results):
+        frame_index = int(entry['source'].split('_')[1].split('.')[0])
+        panel, centre = panel_position(frame_index, n_panels)
+        expected = 'WARPED' if panel in WARPED else 'FLAT'
+        if panel is None or abs(centre - 0.5) > TRIGGER_CONFIG['center_tolerance'] + 0.05:
+            problems.append(f"{entry['panel_id']}: inspected frame {frame_index} does not show a centred panel")
+        elif entry['verdict'] != expected:
+            problems.append(f"{entry['panel_id']}: {entry['verdict']}, expected {expected}")
+        if expected_ids and entry['panel_id'] != expected_ids[number]:
+            problems.append(f"panel ID {entry['panel_id']}, expected {expected_ids[number]}")
+    return problems
+
+def run_presence(session):
+    detector = PresenceDetector()
+    trigger_session = TriggerSession(depth_inspector(detector), 'presence', detector, log_path=None)
+    summary = trigger_session.run(replay_frames(session, fps=0))
+    return trigger_session.results, summary
+
+def run_socket(session, n_panels, fps):
+    detector = PresenceDetector()
+    listener = SocketTrigger(port=0)
+    port = listener.sock.getsockname()[1]
+    trigger_session = TriggerSession(depth_inspector(detector), 'socket', detector, listener, log_path=None)
+    panel_ids = [f"PLC-{panel + 1:03d}" for panel in range(n_panels)]
+
+    def controller(start):
+        # A photo-eye style controller fires when each panel reaches the centre of the view
+        for panel, panel_id in enumerate(panel_ids):
+            centre_frame = (TRIGGER_CONFIG['background_frames'] + panel * (PANEL_FRAMES + GAP_FRAMES)
+                            + (PANEL_FRAMES - 1) // 2)
+            time.sleep(max(0.0, start + centre_frame / fps - time.time()))
+            send_trigger(panel_id, port=port)
+
+    sender = threading.Thread(target=controller, args=(time.time(),), daemon=True)
+    sender.start()
+    try:
+        summary = trigger_session.run(replay_frames(session, fps=fps))
+    finally:
+        listener.close()
+    sender.join()
+    return trigger_session.results, summary, panel_ids
+
+def main():
+    """Replay a synthetic session through both trigger modes and check the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--panels", type=int, default=5)
+    parser.add_argument("--fps", type=float, default=30.0, help="Replay rate of the socket run")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Trigger mode benchmark")
+    print("=" * 50)
+
+    problems = []
+    with tempfile.TemporaryDirectory() as session:
+        n_frames = make_session(session, args.panels, args.fps)
+        print(f"Session: {n_frames} frames, {args.panels} panels (panel {sorted(WARPED)} warped)\n")
+
+        print("Presence trigger (replayed flat out):")
+        results, summary = run_presence(session)
+        problems += check(results, args.panels)
+        print(f"  -> {summary['panels']} panels, trigger to verdict p50 {summary.get('latency_p50_ms', 0):.1f} ms\n")
+
+        print(f"Socket trigger (replayed at {args.fps:.0f} fps):")
+        results, summary, panel_ids = run_socket(session, args.panels, args.fps)
+        problems += check(results, args.panels, panel_ids)
+        print(f"  -> {summary['panels']} panels, {summary['panels_per_min']:.0f} panels/min, trigger to verdict "
+              f"p50 {summary.get('latency_p50_ms', 0):.1f} ms, max {summary.get('latency_max_ms', 0):.1f} ms")
+
+    if problems:
+        print("\n✗ " + "\n✗ ".join(problems))
+        sys.exit(1)
+    print("\n✓ Every panel was triggered once, on a centred frame, with the right verdict")
+
+if __name__ == "__main__":
+    main()
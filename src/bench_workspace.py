@@ -0,0 +1,102 @@
+"""
+Steady-state allocation benchmark for the FrameWorkspace geometry path (no hardware needed)
+Runs back-projection, plane fit and residuals on synthetic 400P depth frames, both with
+the per-call functions and with a FrameWorkspace. Fails if the workspace results differ
+from deviation.py or if a steady-state workspace frame allocates array memory
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+import numpy as np
+from deviation import fit_plane, compute_deviations
+from point_cloud import PointCloud
+from workspace import FrameWorkspace
+from constants import DEPTH_SCALE
+
+INTRINSICS = {'fx': 452.0, 'fy': 452.5, 'cx': 318.4, 'cy': 201.7}
+
+def make_frames(count, shape=(400, 640), seed=0):
+    """Noisy depth frames (mm) of a tilted panel with invalid pixels around it."""
+    rng = np.random.default_rng(seed)
+    v, u = np.mgrid[0:shape[0], 0:shape[1]]
+    frames = []
+    for _ in range(count):
+        depth = 600.0 + 0.05 * (u - shape[1] / 2) + 0.02 * (v - shape[0] / 2) + rng.normal(0, 0.8, shape)
+        depth[rng.random(shape) < 0.1] = 0
+        depth[:, :40] = 0
+        frames.append(np.round(depth).astype(np.uint16))
+    return frames
+
+def reference_frame(depth_map):
+    cloud = PointCloud.from_depth(depth_map, INTRINSICS, DEPTH_SCALE)
+    coeffs = fit_plane(cloud.points)
+    deviations = compute_deviations(cloud.points, coeffs)
+    return coeffs, float(np.std(deviations))
+
+def workspace_frame(workspace, depth_map):
+    _, coeffs, _, std_dev = workspace.analyze(depth_map, INTRINSICS, DEPTH_SCALE)
+    return coeffs, std_dev
+
+def measure(process, frames):
+    """Per-frame traced peak allocation (bytes) and mean seconds per frame."""
+    peaks = []
+    start = time.perf_counter()
+    tracemalloc.start()
+    for depth_map in frames:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        process(depth_map)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - baseline)
+    tracemalloc.stop()
+    return max(peaks), (time.perf_counter() - start) / len(frames)
+
+def main():
+    """Compare allocation churn and results of the per-call and workspace geometry paths."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--max-frame-kb", type=float, default=64.0,
+                        help="Allowed traced allocation per steady-state workspace frame")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Frame workspace allocation benchmark")
+    print("=" * 50)
+
+    frames = make_frames(args.frames)
+    workspace = FrameWorkspace()
+    for depth_map in frames[:2]:  # warm up: rays and depth buffer are set up on first use
+        workspace_frame(workspace, depth_map)
+    allocations = workspace.allocations
+
+    failures = 0
+    for depth_map in frames[:3]:
+        expected_coeffs, expected_std = reference_frame(depth_map)
+        coeffs, std_dev = workspace_frame(workspace, depth_map)
+        if not (np.allclose(coeffs, expected_coeffs, rtol=1e-6, atol=1e-9) and abs(std_dev - expected_std) < 1e-9):
+            print(f"✗ Workspace result differs: {coeffs} vs {expected_coeffs}, {std_dev} vs {expected_std}")
+            failures += 1
+    if not failures:
+        print("✓ Workspace plane fit and deviations match deviation.py")
+
+    reference_peak, reference_time = measure(reference_frame, frames)
+    workspace_peak, workspace_time = measure(lambda depth_map: workspace_frame(workspace, depth_map), frames)
+    print(f"  per-call functions: {reference_peak / 1e6:8.2f} MB allocated per frame, {reference_time * 1000:.1f} ms")
+    print(f"  frame workspace:    {workspace_peak / 1e6:8.2f} MB allocated per frame, {workspace_time * 1000:.1f} ms")
+
+    if workspace.allocations != allocations:
+        print(f"✗ Workspace reallocated buffers in steady state ({workspace.allocations - allocations} times)")
+        failures += 1
+    if workspace_peak > args.max_frame_kb * 1024:
+        print(f"✗ Steady-state frame allocated {workspace_peak / 1024:.1f} kB (limit {args.max_frame_kb:.0f} kB)")
+        failures += 1
+
+    if failures:
+        print("\n✗ Frame workspace check failed")
+        sys.exit(1)
+    print("\n✓ Steady-state frames reuse the workspace buffers")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Per-device calibration cache for OAK-D cameras
+Intrinsics, distortion and extrinsics for every camera socket and resolution are
+read from the device once and stored in CALIBRATION_DIR/<MxId>.json
+Pipeline stages read the cache at startup without connecting to the camera
+"""
+
+import hashlib
+import json
+import os
+import time
+from constants import (
+    CALIBRATION_DIR, CALIBRATION_MXID, CAMERA_SOCKETS, CAMERA_RESOLUTION,
+    CALIBRATION_RESOLUTIONS, SENSOR_RESOLUTION_SIZES, OAK_D_LITE_INTRINSICS
+)
+
+# Extrinsics stored in the cache as (source camera, destination camera)
+EXTRINSIC_PAIRS = {
+    'left_to_rgb': ('left', 'rgb'),
+    'right_to_rgb': ('right', 'rgb'),
+    'left_to_right': ('left', 'right'),
+}
+
+# Cache files already read in this process, keyed by path
+_loaded = {}
+
+def cache_path(mxid):
+    """Return the cache file path for a device MxId."""
+    return os.path.join(CALIBRATION_DIR, f"{mxid}.json")
+
+def calibration_hash(calib_data):
+    """Hash the device's EEPROM calibration so changes can be detected."""
+    eeprom = json.dumps(calib_data.eepromToJson(), sort_keys=True)
+    return hashlib.sha256(eeprom.encode("utf-8")).hexdigest()
+
+def read_device_calibration(dai, calib_data):
+    """Read intrinsics, distortion and extrinsics for every socket from a CalibrationHandler."""
+    cameras = {}
+    for camera, socket_name in CAMERA_SOCKETS.items():
+        socket = getattr(dai.CameraBoardSocket, socket_name)
+        intrinsics = {}
+        for resolution in CALIBRATION_RESOLUTIONS[camera]:
+            width, height = SENSOR_RESOLUTION_SIZES[resolution]
+            # Passing the pixel size (not a SensorResolution enum) returns pixel units
+            matrix = calib_data.getCameraIntrinsics(socket, width, height)
+            intrinsics[resolution] = {
+                'width': width,
+                'height': height,
+                'fx': matrix[0][0],
+                'fy': matrix[1][1],
+                'cx': matrix[0][2],
+                'cy': matrix[1][2],
+            }
+        cameras[camera] = {
+            'socket': socket_name,
+            'distortion': list(calib_data.getDistortionCoefficients(socket)),
+            'intrinsics': intrinsics,
+        }
+
+    extrinsics = {}
+    for name, (src, dst) in EXTRINSIC_PAIRS.items():
+        matrix = calib_data.getCameraExtrinsics(
+            getattr(dai.CameraBoardSocket, CAMERA_SOCKETS[src]),
+            getattr(dai.CameraBoardSocket, CAMERA_SOCKETS[dst])
+        )
+        # DepthAI reports translation in centimeters; store meters like the rest of the pipeline
+        matrix = [list(row) for row in matrix]
+        for row in matrix[:3]:
+            row[3] = row[3] / 100.0
+        extrinsics[name] = matrix
+
+    return {'cameras': cameras, 'extrinsics': extrinsics}
+
+def save_calibration(calibration):
+    """Write a calibration dict to its cache file."""
+    os.makedirs(CALIBRATION_DIR, exist_ok=True)
+    path = cache_path(calibration['mxid'])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(calibration, f, indent=2)
+    os.replace(tmp_path, path)
+    _loaded[path] = calibration
+    return path
+
+def refresh_calibration(dai, device):
+    """Update the device's cache file if its calibration changed. Returns (calibration, updated)."""
+    mxid = device.getMxId()
+    calib_data = device.readCalibration()
+    digest = calibration_hash(calib_data)
+
+    cached = load_calibration(mxid)
+    if cached is not None and cached.get('calibration_hash') == digest:
+        return cached, False
+
+    calibration = {
+        'mxid': mxid,
+        'calibration_hash': digest,
+        'updated': time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    calibration.update(read_device_calibration(dai, calib_data))
+    save_calibration(calibration)
+    return calibration, True
+
+def find_cache_file(mxid=None):
+    """Return the cache file for mxid, CALIBRATION_MXID or the most recently refreshed device."""
+    mxid = mxid or CALIBRATION_MXID
+    if mxid:
+        path = cache_path(mxid)
+        return path if os.path.exists(path) else None
+
+    if not os.path.isdir(CALIBRATION_DIR):
+        return None
+    paths = [
+        os.path.join(CALIBRATION_DIR, name)
+        for name in os.listdir(CALIBRATION_DIR) if name.endswith(".json")
+    ]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+def load_calibration(mxid=None):
+    """Load a device's cached calibration (read from disk once per process), or None."""
+    path = find_cache_file(mxid)
+    if path is None:
+        return None
+    if path not in _loaded:
+        with open(path, 'r') as f:
+            _loaded[path] = json.load(f)
+    return _loaded[path]
+
+def get_intrinsics(camera='left', resolution=None, mxid=None):
+    """Return pixel intrinsics {'fx', 'fy', 'cx', 'cy'} for a camera and resolution.
+    Falls back to OAK_D_LITE_INTRINSICS when no cache exists."""
+    if resolution is None:
+        resolution = CAMERA_RESOLUTION['rgb' if camera == 'rgb' else 'mono']
+
+    calibration = load_calibration(mxid)
+    if calibration is None:
+        return dict(OAK_D_LITE_INTRINSICS)
+
+    entry = calibration['cameras'][camera]['intrinsics'][resolution]
+    return {key: entry[key] for key in ('fx', 'fy', 'cx', 'cy')}
+
+def get_distortion(camera='left', mxid=None):
+    """Return the distortion coefficients for a camera, or None when no cache exists."""
+    calibration = load_calibration(mxid)
+    if calibration is None:
+        return None
+    return calibration['cameras'][camera]['distortion']
+
+def get_extrinsics(name='left_to_rgb', mxid=None):
+    """Return a 4x4 extrinsic matrix (translation in meters), or None when no cache exists."""
+    calibration = load_calibration(mxid)
+    if calibration is None:
+        return None
+    return calibration['extrinsics'][name]
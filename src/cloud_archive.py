@@ -0,0 +1,324 @@
+"""
+Compressed archive format for inspected panel geometry (.wqc)
+Two kinds of archive:
+  points - fixed-point coordinates (ARCHIVE_CONFIG['quantum'] meters) relative to a per-cloud
+           origin, delta coded along the scan order, stored as int16 where the deltas fit
+  depth  - the organized (masked) depth image plus the intrinsics and depth scale needed
+           to back-project it, delta coded along rows
+Data is split into chunks that are byte-shuffled and zlib-compressed independently, so
+any chunk can be decoded on its own. Layout: b"WQC1", uint32 header length, JSON header
+(with the chunk offset table), chunk data
+
+Usage:
+  python src/cloud_archive.py to-archive point_cloud.ply panel.wqc
+  python src/cloud_archive.py to-ply panel.wqc point_cloud.ply
+  python src/cloud_archive.py info panel.wqc
+  python src/cloud_archive.py audit archive/ [--threshold M] [--all]
+(or python src/wood_qa.py archive ...)
+"""
+
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+import numpy as np
+from artifact_writer import write_file, NORMAL
+from constants import ARCHIVE_CONFIG
+
+MAGIC = b"WQC1"
+
+def _shuffle(values):
+    """Group the bytes of each significance together (compresses much better)."""
+    values = np.ascontiguousarray(values)
+    return np.ascontiguousarray(values.view(np.uint8).reshape(-1, values.itemsize).T).tobytes()
+
+def _unshuffle(data, dtype, count):
+    itemsize = np.dtype(dtype).itemsize
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(itemsize, count)
+    return np.ascontiguousarray(planes.T).view(dtype).ravel()
+
+def _delta_encode(values):
+    """First value then successive differences, as int16 when they all fit."""
+    deltas = np.diff(values, prepend=np.int64(0), axis=-1)
+    if deltas.size == 0 or (deltas.min() >= -32768 and deltas.max() <= 32767):
+        return deltas.astype(np.int16)
+    return deltas.astype(np.int32)
+
+def _delta_decode(deltas):
+    return np.cumsum(deltas, axis=-1, dtype=np.int64)
+
+def _encode_chunk(values, level):
+    """Delta code, shuffle and compress a (rows, n) integer block. Returns (bytes, dtype)."""
+    deltas = _delta_encode(values.astype(np.int64))
+    return zlib.compress(_shuffle(deltas), level), deltas.dtype.name
+
+def _write(path, header, chunks):
+    offset = 0
+    table = []
+    for data, dtype, count in chunks:
+        table.append([offset, len(data), dtype, count])
+        offset += len(data)
+    header['chunks'] = table
+    encoded = json.dumps(header).encode("utf-8")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(encoded)))
+        f.write(encoded)
+        for data, _, _ in chunks:
+            f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+def write_points(path, points, quantum=ARCHIVE_CONFIG['quantum'],
+                 chunk_points=ARCHIVE_CONFIG['chunk_points'], level=ARCHIVE_CONFIG['level']):
+    """Archive an Nx3 point array as fixed-point coordinates relative to its minimum corner."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    origin = points.min(axis=0) if len(points) else np.zeros(3)
+    fixed = np.rint((points - origin) / quantum).astype(np.int64).T  # (3, N), structure of arrays
+
+    chunks = []
+    for start in range(0, fixed.shape[1], chunk_points):
+        block = fixed[:, start:start + chunk_points]
+        data, dtype = _encode_chunk(block, level)
+        chunks.append((data, dtype, block.shape[1]))
+
+    header = {
+        'kind': 'points',
+        'n_points': int(points.shape[0]),
+        'origin': origin.tolist(),
+        'quantum': quantum,
+        'chunk_points': chunk_points,
+        'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    return _write(path, header, chunks)
+
+def write_depth(path, depth_map, intrinsics, depth_scale,
+                chunk_rows=ARCHIVE_CONFIG['chunk_rows'], level=ARCHIVE_CONFIG['level'], quantum=None, distortion=None):
+    """Archive an organized depth image with what is needed to back-project it (including
+    the lens distortion if it was corrected). Float depth (e.g. fused) is stored as fixed
+    point in steps of `quantum` depth units."""
+    depth_map = np.asarray(depth_map)
+    if np.issubdtype(depth_map.dtype, np.floating):
+        quantum = quantum or ARCHIVE_CONFIG['depth_quantum']
+        fixed = np.rint(depth_map / quantum).astype(np.int64)
+    else:
+        quantum = 1
+        fixed = depth_map.astype(np.int64)
+
+    chunks = []
+    for start in range(0, fixed.shape[0], chunk_rows):
+        block = fixed[start:start + chunk_rows]
+        data, dtype = _encode_chunk(block, level)  # deltas along each row
+        chunks.append((data, dtype, block.shape[0]))
+
+    header = {
+        'kind': 'depth',
+        'shape': list(depth_map.shape),
+        'dtype': depth_map.dtype.name,
+        'depth_quantum': quantum,
+        'n_points': int(np.count_nonzero(depth_map)),
+        'intrinsics': {key: float(intrinsics[key]) for key in ('fx', 'fy', 'cx', 'cy')},
+        'depth_scale': depth_scale,
+        'distortion': [float(value) for value in distortion] if distortion is not None else None,
+        'chunk_rows': chunk_rows,
+        'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    return _write(path, header, chunks)
+
+class CloudArchive:
+    """Random-access reader for .wqc archives; chunks are decoded only when requested."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(4) != MAGIC:
+                raise ValueError(f"{path} is not a point cloud archive")
+            (length,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(length).decode("utf-8"))
+            self.data_offset = 8 + length
+        self.kind = self.header['kind']
+        self.chunks = self.header['chunks']
+
+    def __len__(self):
+        return self.header['n_points']
+
+    def _read_raw(self, index):
+        offset, size, dtype, count = self.chunks[index]
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_offset + offset)
+            data = zlib.decompress(f.read(size))
+        width = 3 if self.kind == 'points' else self.header['shape'][1]
+        deltas = _unshuffle(data, dtype, count * width)
+        if self.kind == 'points':
+            return _delta_decode(deltas.reshape(3, count))
+        return _delta_decode(deltas.reshape(count, width))
+
+    def read_chunk(self, index):
+        """Decode one chunk: (3, n) float32 points, or a block of depth rows."""
+        fixed = self._read_raw(index)
+        if self.kind == 'points':
+            origin = np.asarray(self.header['origin'])[:, None]
+            return (fixed * self.header['quantum'] + origin).astype(np.float32)
+        return self._to_depth(fixed)
+
+    def _to_depth(self, fixed):
+        dtype = np.dtype(self.header['dtype'])
+        if np.issubdtype(dtype, np.floating):
+            return (fixed * self.header['depth_quantum']).astype(dtype)
+        return fixed.astype(dtype)
+
+    def read_points(self, start=0, stop=None):
+        """Decode points [start, stop) of a points archive as a (3, n) float32 block,
+        touching only the chunks that overlap the range."""
+        if self.kind != 'points':
+            raise ValueError("read_points needs a points archive; use read_depth()")
+        stop = len(self) if stop is None else min(stop, len(self))
+        size = self.header['chunk_points']
+        blocks = [self.read_chunk(i) for i in range(start // size, (stop - 1) // size + 1)] if stop > start else []
+        if not blocks:
+            return np.empty((3, 0), dtype=np.float32)
+        first = (start // size) * size
+        return np.concatenate(blocks, axis=1)[:, start - first:stop - first]
+
+    def read_depth(self, row_start=0, row_stop=None):
+        """Decode depth rows [row_start, row_stop) of a depth archive."""
+        if self.kind != 'depth':
+            raise ValueError("read_depth needs a depth archive; use read_points()")
+        height = self.header['shape'][0]
+        row_stop = height if row_stop is None else min(row_stop, height)
+        rows = self.header['chunk_rows']
+        blocks = [self.read_chunk(i) for i in range(row_start // rows, (row_stop - 1) // rows + 1)]
+        first = (row_start // rows) * rows
+        return np.concatenate(blocks)[row_start - first:row_stop - first]
+
+    def to_cloud(self):
+        """Decode the whole archive as a PointCloud."""
+        from point_cloud import PointCloud
+
+        if self.kind == 'points':
+            return PointCloud(self.read_points())
+        depth_map = self.read_depth()
+        rays = None
+        if self.header.get('distortion'):
+            from ray_table import build_ray_table
+            rays = build_ray_table(self.header['intrinsics'], self.header['distortion'], depth_map.shape)
+        return PointCloud.from_depth(depth_map, self.header['intrinsics'], self.header['depth_scale'], rays)
+
+def archive_panel(depth_map, intrinsics, depth_scale, directory=ARCHIVE_CONFIG['dir'], distortion=None):
+    """Queue the inspected panel's masked depth for the archive directory, named by capture time."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime("panel_%Y%m%d_%H%M%S") + f"_{int(time.time() * 1000) % 1000:03d}.wqc")
+    write_file(path, lambda target: write_depth(target, depth_map, intrinsics, depth_scale, distortion=distortion),
+               NORMAL)
+    return path
+
+def ply_to_archive(ply_path, archive_path):
+    """Convert a PLY point cloud into a points archive."""
+    from deviation import load_ply
+    return write_points(archive_path, load_ply(ply_path))
+
+def archive_to_ply(archive_path, ply_path):
+    """Convert an archive (points or depth) back into an ASCII PLY."""
+    from depth_to_cloud import save_ply
+    cloud = CloudArchive(archive_path).to_cloud()
+    save_ply(ply_path, cloud.points)
+    return len(cloud)
+
+def archive_paths(paths):
+    """.wqc files among paths, with directories expanded, sorted by name (capture time)."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found += [os.path.join(path, name) for name in os.listdir(path) if name.endswith('.wqc')]
+        else:
+            found.append(path)
+    return sorted(found)
+
+def audit(paths, threshold, batch_points=ARCHIVE_CONFIG['audit_batch_points']):
+    """Flatness of every archived panel: decode the archives and fit them in batches of
+    about batch_points points with deviation.batch_flatness.
+    Returns (rows of (path, n_points, std_dev, warped), decode seconds, fit seconds)."""
+    from deviation import batch_flatness, concat_clouds
+
+    rows, clouds, names = [], [], []
+    decode_time = fit_time = 0.0
+
+    def fit_batch():
+        nonlocal fit_time
+        start = time.perf_counter()
+        points, offsets = concat_clouds(clouds)
+        result = batch_flatness(points, offsets, threshold)
+        fit_time += time.perf_counter() - start
+        rows.extend(zip(names, result['n_points'], result['std_dev'], result['warped']))
+        clouds.clear()
+        names.clear()
+
+    pending = 0
+    for path in paths:
+        start = time.perf_counter()
+        clouds.append(CloudArchive(path).to_cloud().points)
+        decode_time += time.perf_counter() - start
+        names.append(path)
+        pending += len(clouds[-1])
+        if pending >= batch_points:
+            fit_batch()
+            pending = 0
+    if clouds:
+        fit_batch()
+    return rows, decode_time, fit_time
+
+def main(argv=None):
+    """Convert between PLY and .wqc archives, describe an archive, or audit many."""
+    parser = argparse.ArgumentParser(description="Point cloud archive converter")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    to_archive = subparsers.add_parser("to-archive", help="PLY -> archive")
+    to_archive.add_argument("ply")
+    to_archive.add_argument("archive")
+    to_ply = subparsers.add_parser("to-ply", help="archive -> PLY")
+    to_ply.add_argument("archive")
+    to_ply.add_argument("ply")
+    info = subparsers.add_parser("info", help="Describe an archive")
+    info.add_argument("archive")
+    audit_parser = subparsers.add_parser("audit", help="Flatness of every panel in archives or directories")
+    audit_parser.add_argument("paths", nargs='+')
+    audit_parser.add_argument("--threshold", type=float, default=None, help="Std-dev threshold in meters "
+                              "(default: DEVIATION_THRESHOLD)")
+    audit_parser.add_argument("--all", action="store_true", help="List every panel, not only the warped ones")
+    args = parser.parse_args(argv)
+
+    start_time = time.time()
+    if args.command == "to-archive":
+        ply_to_archive(args.ply, args.archive)
+        before, after = os.path.getsize(args.ply), os.path.getsize(args.archive)
+        print(f"✓ {args.ply} ({before / 1e6:.2f} MB) -> {args.archive} ({after / 1e6:.2f} MB, {before / max(after, 1):.1f}x smaller)")
+    elif args.command == "audit":
+        from constants import DEVIATION_THRESHOLD
+        threshold = DEVIATION_THRESHOLD if args.threshold is None else args.threshold
+        paths = archive_paths(args.paths)
+        rows, decode_time, fit_time = audit(paths, threshold)
+        for path, n_points, std_dev, warped in rows:
+            if warped or args.all:
+                verdict = 'WARPED' if warped else ('FLAT' if std_dev == std_dev else 'NO PLANE')
+                print(f"  {path}: {verdict} (std dev {std_dev:.6f} m, {n_points} points)")
+        warped = sum(1 for row in rows if row[3])
+        total_points = sum(int(row[1]) for row in rows)
+        print(f"✓ Audited {len(rows)} panels ({total_points} points): {warped} WARPED (std dev > {threshold}); "
+              f"decode {decode_time:.2f} s, batched plane fits {fit_time * 1000:.0f} ms")
+    elif args.command == "to-ply":
+        n_points = archive_to_ply(args.archive, args.ply)
+        print(f"✓ Wrote {n_points} points to {args.ply}")
+    else:
+        archive = CloudArchive(args.archive)
+        header = {key: value for key, value in archive.header.items() if key != 'chunks'}
+        print(f"{args.archive}: {os.path.getsize(args.archive) / 1e6:.3f} MB, {len(archive.chunks)} chunks")
+        for key, value in header.items():
+            print(f"  {key}: {value}")
+        return
+    print(f"Execution time: {time.time() - start_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
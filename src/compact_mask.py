@@ -0,0 +1,145 @@
+"""
+Compact binary mask: bounding box plus bit-packed rows
+The panel usually covers a minority of the frame, so only the mask's bounding box is
+stored, one bit per pixel (np.packbits). Applying the mask to depth, resizing it to the
+depth resolution, area and IoU all work inside the bounding box only
+"""
+
+import numpy as np
+
+# Number of set bits in every byte value, for counting area on packed rows
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+class CompactMask:
+    """Binary mask of an image of `shape`, stored as bit-packed rows inside its bbox."""
+
+    __slots__ = ('shape', 'bbox', 'packed', '_area')
+
+    def __init__(self, shape, bbox, packed):
+        self.shape = tuple(shape[:2])
+        self.bbox = tuple(int(value) for value in bbox)  # (top, left, bottom, right), exclusive ends
+        self.packed = packed                              # (bottom - top, ceil((right - left) / 8)) uint8
+        self._area = None
+
+    @classmethod
+    def from_array(cls, mask):
+        """Build from a 2D array; non-zero (or True) pixels are inside the mask."""
+        mask = np.asarray(mask)
+        rows = np.flatnonzero(mask.any(axis=1))
+        if rows.size == 0:
+            return cls.empty(mask.shape)
+        cols = np.flatnonzero(mask[rows[0]:rows[-1] + 1].any(axis=0))
+        bbox = (rows[0], cols[0], rows[-1] + 1, cols[-1] + 1)
+        crop = mask[bbox[0]:bbox[2], bbox[1]:bbox[3]] != 0
+        return cls(mask.shape, bbox, np.packbits(crop, axis=1))
+
+    @classmethod
+    def empty(cls, shape):
+        return cls(shape, (0, 0, 0, 0), np.zeros((0, 0), dtype=np.uint8))
+
+    @property
+    def height(self):
+        return self.bbox[2] - self.bbox[0]
+
+    @property
+    def width(self):
+        return self.bbox[3] - self.bbox[1]
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    def __repr__(self):
+        return f"CompactMask({self.shape}, bbox={self.bbox}, area={self.area}, {self.nbytes} bytes)"
+
+    @property
+    def area(self):
+        """Number of pixels inside the mask (popcount of the packed rows)."""
+        if self._area is None:
+            self._area = int(POPCOUNT[self.packed].sum(dtype=np.int64))
+        return self._area
+
+    def window(self, margin=0):
+        """bbox grown by margin pixels on every side and clipped to the image (None if empty)."""
+        if self.height == 0 or self.width == 0:
+            return None
+        top, left, bottom, right = self.bbox
+        return (max(0, top - margin), max(0, left - margin),
+                min(self.shape[0], bottom + margin), min(self.shape[1], right + margin))
+
+    def crop(self):
+        """Boolean array of the bbox region."""
+        return np.unpackbits(self.packed, axis=1, count=self.width).view(bool)
+
+    def to_array(self, value=255, dtype=np.uint8):
+        """Full-size array with `value` inside the mask and 0 elsewhere (like the mask PNG)."""
+        mask = np.zeros(self.shape, dtype=dtype)
+        top, left, bottom, right = self.bbox
+        mask[top:bottom, left:right][self.crop()] = value
+        return mask
+
+    def resized(self, shape):
+        """Nearest-neighbour resize to another image size (same sampling as cv2.INTER_NEAREST)."""
+        height, width = shape[:2]
+        if (height, width) == self.shape:
+            return self
+        top, left, bottom, right = self.bbox
+        # Same arithmetic as OpenCV (scale = 1 / (dst / src)) so the pixels picked are identical
+        ys = np.minimum((np.arange(height) * (1.0 / (height / self.shape[0]))).astype(np.int64), self.shape[0] - 1)
+        xs = np.minimum((np.arange(width) * (1.0 / (width / self.shape[1]))).astype(np.int64), self.shape[1] - 1)
+        rows = np.flatnonzero((ys >= top) & (ys < bottom))
+        cols = np.flatnonzero((xs >= left) & (xs < right))
+        if rows.size == 0 or cols.size == 0 or self.area == 0:
+            return CompactMask.empty((height, width))
+        crop = self.crop()[ys[rows] - top][:, xs[cols] - left]
+        bbox = (rows[0], cols[0], rows[-1] + 1, cols[-1] + 1)
+        return CompactMask.from_crop((height, width), bbox, crop)
+
+    @classmethod
+    def from_crop(cls, shape, bbox, crop):
+        """Build from a boolean crop placed at bbox, tightening the bbox to its content."""
+        rows = np.flatnonzero(crop.any(axis=1))
+        if rows.size == 0:
+            return cls.empty(shape)
+        cols = np.flatnonzero(crop.any(axis=0))
+        crop = crop[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        top, left = bbox[0] + rows[0], bbox[1] + cols[0]
+        return cls(shape, (top, left, top + crop.shape[0], left + crop.shape[1]), np.packbits(crop, axis=1))
+
+    def apply(self, depth_map):
+        """Depth inside the mask, 0 elsewhere; only the bbox region is read."""
+        if depth_map.shape[:2] != self.shape:
+            raise ValueError(f"mask shape {self.shape} does not match depth {depth_map.shape[:2]}")
+        masked = np.zeros_like(depth_map)
+        top, left, bottom, right = self.bbox
+        np.copyto(masked[top:bottom, left:right], depth_map[top:bottom, left:right], where=self.crop())
+        return masked
+
+    def intersection(self, other):
+        """Number of pixels in both masks (computed on the overlap of the two bboxes)."""
+        if self.shape != other.shape:
+            raise ValueError("masks must describe the same image size")
+        top = max(self.bbox[0], other.bbox[0])
+        left = max(self.bbox[1], other.bbox[1])
+        bottom = min(self.bbox[2], other.bbox[2])
+        right = min(self.bbox[3], other.bbox[3])
+        if top >= bottom or left >= right:
+            return 0
+        a = self.crop()[top - self.bbox[0]:bottom - self.bbox[0], left - self.bbox[1]:right - self.bbox[1]]
+        b = other.crop()[top - other.bbox[0]:bottom - other.bbox[0], left - other.bbox[1]:right - other.bbox[1]]
+        return int(np.count_nonzero(a & b))
+
+    def iou(self, other):
+        """Intersection over union (1.0 for two empty masks)."""
+        inter = self.intersection(other)
+        union = self.area + other.area - inter
+        return inter / union if union else 1.0
+
+    def save(self, filename):
+        """Store as .npz (a few kB instead of a full-resolution image)."""
+        np.savez_compressed(filename, shape=np.array(self.shape), bbox=np.array(self.bbox), packed=self.packed)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            return cls(tuple(data['shape']), tuple(data['bbox']), data['packed'])
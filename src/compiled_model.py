@@ -0,0 +1,217 @@
+"""
+One-time compile step for a fast, offline CLIPSeg cold start
+Saves a self-contained artifact in MODEL_ARTIFACT_DIR:
+  model.safetensors + config.json  - weights, memory-mapped on load (save_pretrained)
+  clipseg_traced.pt                - TorchScript graph of the text-prompt forward pass
+  manifest.json                    - frozen preprocessing (resize, rescale, normalize) and
+                                     the pre-tokenized text prompt, so no tokenizer or
+                                     processor config has to be resolved at run time
+The traced graph is only marked usable if it matches the eager model at batch 1 and 2.
+extract_wood.load_segmentation_model() uses the artifact when it matches the configured
+model and prompt, without any Hugging Face Hub or cache lookups
+
+Usage: python src/compiled_model.py [--output models/clipseg]
+"""
+
+import argparse
+import json
+import os
+import time
+from types import SimpleNamespace
+import numpy as np
+from constants import CLIPSEG_MODEL, MODEL_ARTIFACT_DIR, TEXT_OR_IMAGE, TEXT_PROMPT
+
+MANIFEST = "manifest.json"
+TRACED = "clipseg_traced.pt"
+
+class Encoded(dict):
+    """Processor output: a dict of tensors that also allows attribute access."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class FrozenProcessor:
+    """Stand-in for CLIPSegProcessor built from the frozen manifest (no tokenizer needed)."""
+
+    def __init__(self, manifest):
+        self.config = manifest['preprocessing']
+        self.prompt = manifest['prompt']
+
+    def preprocess(self, image):
+        """PIL RGB image -> (3, H, W) float32 array, as CLIPSeg's image processor does it."""
+        config = self.config
+        image = image.resize((config['width'], config['height']), resample=config['resample'])
+        pixels = np.asarray(image, dtype=np.float32)
+        if config['do_rescale']:
+            pixels = pixels * np.float32(config['rescale_factor'])
+        if config['do_normalize']:
+            pixels = (pixels - np.float32(config['image_mean'])) / np.float32(config['image_std'])
+        return pixels.transpose(2, 0, 1)
+
+    def __call__(self, text=None, images=None, padding=True, return_tensors="pt"):
+        import torch
+
+        encoded = Encoded(pixel_values=torch.from_numpy(np.stack([self.preprocess(image) for image in images])))
+        if text is not None:
+            if self.prompt is None or any(prompt != self.prompt['text'] for prompt in text):
+                raise ValueError(f"prompt {text[0]!r} was not compiled; rerun compiled_model.py")
+            for key in ('input_ids', 'attention_mask'):
+                encoded[key] = torch.tensor([self.prompt[key]] * len(text))
+        return encoded
+
+class TracedCLIPSeg:
+    """TorchScript CLIPSeg text-prompt graph with the call signature predict_masks uses."""
+
+    def __init__(self, path):
+        import torch
+        self.module = torch.jit.load(path, map_location="cpu")
+        self.module.eval()
+
+    def eval(self):
+        return self
+
+    def __call__(self, input_ids, pixel_values, attention_mask, **kwargs):
+        if kwargs:
+            raise ValueError("the traced graph only supports text prompts")
+        return SimpleNamespace(logits=self.module(input_ids, pixel_values, attention_mask))
+
+def read_manifest(artifact_dir=MODEL_ARTIFACT_DIR):
+    path = os.path.join(artifact_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def artifact_matches(manifest, model_name=CLIPSEG_MODEL):
+    """True if the artifact was compiled for this model and the configured prompt."""
+    if manifest is None or manifest['model'] != model_name:
+        return False
+    if TEXT_OR_IMAGE:
+        return manifest['prompt'] is not None and manifest['prompt']['text'] == TEXT_PROMPT
+    return True
+
+def load_compiled_model(artifact_dir=MODEL_ARTIFACT_DIR):
+    """(processor, model) from a compiled artifact, without tokenizer or Hub access."""
+    manifest = read_manifest(artifact_dir)
+    processor = FrozenProcessor(manifest)
+    if TEXT_OR_IMAGE and manifest['traced']:
+        return processor, TracedCLIPSeg(os.path.join(artifact_dir, TRACED))
+
+    from transformers import CLIPSegForImageSegmentation
+    model = CLIPSegForImageSegmentation.from_pretrained(artifact_dir, local_files_only=True)
+    model.eval()
+    return processor, model
+
+def freeze_preprocessing(image_processor):
+    """Copy the image processor settings that preprocessing depends on into plain JSON."""
+    size = image_processor.size
+    height = size.get('height', size.get('shortest_edge'))
+    width = size.get('width', size.get('shortest_edge'))
+    return {
+        'height': int(height),
+        'width': int(width),
+        'resample': int(image_processor.resample),
+        'do_rescale': bool(image_processor.do_rescale),
+        'rescale_factor': float(image_processor.rescale_factor),
+        'do_normalize': bool(image_processor.do_normalize),
+        'image_mean': [float(value) for value in image_processor.image_mean],
+        'image_std': [float(value) for value in image_processor.image_std],
+    }
+
+def trace_model(model, processor, example_images, output_path):
+    """Trace the text-prompt forward pass and check it against eager mode at batch 1 and 2.
+    Returns True if the traced graph can be used."""
+    import torch
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, pixel_values, attention_mask):
+            logits = self.model(input_ids=input_ids, pixel_values=pixel_values,
+                                attention_mask=attention_mask).logits
+            return logits.reshape(pixel_values.shape[0], logits.shape[-2], logits.shape[-1])
+
+    def inputs(batch):
+        images = (example_images * batch)[:batch]
+        encoded = processor(text=[TEXT_PROMPT] * batch, images=images, padding=True, return_tensors="pt")
+        return encoded['input_ids'], encoded['pixel_values'], encoded['attention_mask']
+
+    wrapper = LogitsOnly(model).eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(wrapper, inputs(2), check_trace=False)
+        for batch in (1, 2):
+            example = inputs(batch)
+            if not torch.allclose(traced(*example), wrapper(*example), atol=1e-4):
+                print(f"⚠️ Traced graph differs from eager model at batch {batch}; using safetensors only")
+                return False
+    traced.save(output_path)
+    return True
+
+def compile_artifact(output_dir=MODEL_ARTIFACT_DIR, model_name=CLIPSEG_MODEL, example_image=None):
+    """Build the artifact from the (cached or downloaded) Hugging Face model."""
+    import torch
+    import transformers
+    from PIL import Image
+    from extract_wood import load_clipseg_model
+
+    processor, model = load_clipseg_model(model_name)
+    model.eval()
+    os.makedirs(output_dir, exist_ok=True)
+    model.save_pretrained(output_dir, safe_serialization=True)
+
+    prompt = None
+    if TEXT_OR_IMAGE:
+        tokens = processor.tokenizer([TEXT_PROMPT], padding=True)
+        prompt = {'text': TEXT_PROMPT, 'input_ids': tokens['input_ids'][0],
+                  'attention_mask': tokens['attention_mask'][0]}
+    manifest = {
+        'model': model_name,
+        'prompt': prompt,
+        'preprocessing': freeze_preprocessing(processor.image_processor),
+        'traced': False,
+        'torch': torch.__version__,
+        'transformers': transformers.__version__,
+        'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+    # The frozen preprocessing must reproduce the processor exactly
+    example_image = example_image or Image.new("RGB", (640, 400), (128, 96, 64))
+    frozen = FrozenProcessor(manifest)(images=[example_image])['pixel_values']
+    reference = processor(images=[example_image], return_tensors="pt")['pixel_values']
+    if not torch.allclose(frozen, reference, atol=1e-4):
+        raise RuntimeError("frozen preprocessing does not match CLIPSegProcessor")
+
+    if TEXT_OR_IMAGE:
+        manifest['traced'] = trace_model(model, processor, [example_image], os.path.join(output_dir, TRACED))
+
+    with open(os.path.join(output_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def main(argv=None):
+    """Compile the configured CLIPSeg model into a self-contained artifact."""
+    parser = argparse.ArgumentParser(description="Compile CLIPSeg for fast offline loading")
+    parser.add_argument("--output", default=MODEL_ARTIFACT_DIR)
+    args = parser.parse_args(argv)
+
+    from PIL import Image
+    from constants import RGB_IMAGE_PATH
+
+    start_time = time.time()
+    example_image = Image.open(RGB_IMAGE_PATH).convert("RGB") if os.path.exists(RGB_IMAGE_PATH) else None
+    try:
+        manifest = compile_artifact(args.output, example_image=example_image)
+    except Exception as e:
+        print(f"✗ Error compiling model: {e}")
+        raise SystemExit(1)
+    graph = "traced graph + safetensors" if manifest['traced'] else "safetensors"
+    print(f"✓ Compiled {manifest['model']} to {args.output} ({graph})")
+    print(f"Execution time: {time.time() - start_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ Contains camera intrinsics, file paths, and configuration values
 
 # OAK-D Lite Camera Intrinsics
 # These values are for 400P resolution (640x400)
-# To get camera's exact intrinsics, run calibration script
+# Fallback only: run src/get_camera_intrinsics.py to cache the device's exact calibration
 OAK_D_LITE_INTRINSICS = {
     'fx': 461.9,  # Horizontal focal length in pixels
     'fy': 461.9,  # Vertical focal length in pixels
@@ -13,6 +13,57 @@ OAK_D_LITE_INTRINSICS = {
     'cy': 200.0,  # Principal point Y coordinate in pixels
 }
 
+# Per-device calibration cache (see src/calibration.py)
+# One JSON file per device MxId is written here by get_camera_intrinsics.py / image_output.py
+# OAK_D_LITE_INTRINSICS above is only used when no cache file exists yet
+CALIBRATION_DIR = "calibration"
+CALIBRATION_MXID = None  # MxId whose cache to load; None picks the most recently refreshed device
+
+# Camera whose intrinsics are used to back-project the depth map
+DEPTH_CAMERA = 'left'
+
+# Lens distortion during back-projection (see src/ray_table.py)
+# With a calibration cache, each depth pixel is back-projected along its undistorted ray.
+# The per-pixel ray table is built once per (device, camera, resolution) and stored in CALIBRATION_DIR
+# Without a cache (or with zero distortion) the pinhole model is used
+UNDISTORT_DEPTH = True
+# StereoDepth output is computed on the rectified mono pairs, so it is already undistorted and
+# back-projects with the pinhole model. Undistorting it again bends flat panels near the edges.
+# Set to False only when depth is aligned (stereo.setDepthAlign) to a camera whose image is not
+# undistorted; the ray table of DEPTH_CAMERA is then used
+DEPTH_RECTIFIED = True
+
+# Multi-camera rigs (see src/multi_camera.py)
+# MxIds to capture from; None uses every connected device
+MULTI_CAMERA_MXIDS = None
+# 4x4 transform (meters) from each device's depth camera frame into the common panel frame
+# A single connected device without an entry is used as the common frame
+MULTI_CAMERA_EXTRINSICS = {
+    # '18443010D1E4C31200': [[1, 0, 0, 0.0], [0, 1, 0, 0.0], [0, 0, 1, 0.0], [0, 0, 0, 1]],
+}
+
+# Depth filtering before back-projection (see src/depth_filter.py)
+# Removes flying pixels along panel edges and speckle inside the panel
+DEPTH_FILTER_CONFIG = {
+    'enabled': True,
+    'erode_pixels': 1,          # shrink the segmentation mask by this many pixels to drop edge pixels
+                                # (only where the mask is at hand; stereo holes are never eroded)
+    'discontinuity': 0.02,      # relative depth jump to any 4-neighbour that marks a flying pixel
+    'median_window': 5,         # window (3 or 5 pixels) of the separable row/column median
+    'median_threshold': 0.01,   # relative deviation from the local median that marks speckle
+}
+# Latency of filter_depth on a fully valid 400P frame (the worst case), checked by
+# src/bench_depth_filter.py (sized for a Raspberry Pi 5)
+DEPTH_FILTER_BUDGET_MS = 30
+
+# Temporal fusion of several depth frames of a stationary panel (see src/depth_fusion.py)
+DEPTH_FUSION_CONFIG = {
+    'frames': 8,                # K depth frames kept in the ring buffer (1 disables fusion)
+    'method': 'mean',           # 'mean' or 'median' fused depth
+    'min_valid_fraction': 0.5,  # pixels valid in fewer of the frames are dropped
+    'noise_floor': 0.5,         # depth units (mm) - temporal std-dev that still counts as fully confident
+}
+
 # Depth scale configuration
 # If your depth map is in millimeters, set to 0.001 for meters
 DEPTH_SCALE = 0.001
@@ -20,19 +71,49 @@ DEPTH_SCALE = 0.001
 # File paths
 RGB_IMAGE_PATH = "rgb_image.png"
 DEPTH_MAP_PATH = "depth_map.png"
+DEPTH_CONFIDENCE_PATH = "depth_confidence.npz"  # confidence + digest of the depth map it belongs to
 WOOD_REFERENCE_PATH = "wood_reference.png"
 WOOD_PANEL_MASK_PATH = "wood_panel_mask.png"
 WOOD_PANEL_DEPTH_PATH = "wood_panel_depth_map.png"
 POINT_CLOUD_PATH = "point_cloud.ply"
 DEVIATIONS_PATH = "deviations.txt"
+DEVIATION_HEATMAP_PATH = "deviation_heatmap.png"
 
 # CLIPSeg configuration
 CLIPSEG_MODEL = "CIDAS/clipseg-rd64-refined"
+MODEL_ARTIFACT_DIR = "models/clipseg"  # Compiled, offline copy of CLIPSEG_MODEL (src/compiled_model.py)
 SEGMENTATION_THRESHOLD = 0.5  # Threshold for binary mask (0.0 to 1.0)
 
 # Deviation analysis configuration
 DEVIATION_THRESHOLD = 0.001  # meters - threshold for determining if wood is warped
 
+# Progressive verdict (deviation.py): fit growing random subsets and stop once the
+# confidence interval of the std-dev is clearly on one side of DEVIATION_THRESHOLD
+PROGRESSIVE_VERDICT_CONFIG = {
+    'enabled': False,          # Off: every point is fitted and deviations.txt is written
+    'initial_points': 1024,
+    'growth': 4,               # Subset size multiplier per round
+    'z': 3.29,                 # Interval half-width in standard errors (99.9% two-sided)
+    'seed': 0,                 # Fixed so a panel always gets the same verdict
+}
+
+# Coarse-to-fine pyramid flatness (deviation.py, src/pyramid.py): plane and std-dev from
+# per-cell moments of the masked depth image, per-pixel residuals only in flagged cells
+PYRAMID_CONFIG = {
+    'enabled': False,          # Off: the point cloud is analyzed point by point
+    'factor': 4,               # Cell size in depth pixels (4: 1/4 resolution, 8: 1/8)
+    'refine_band': 0.25,       # Refine cells whose mean residual is within band * DEVIATION_THRESHOLD of it
+    'spread_factor': 3.0,      # ...or whose residual spread is this many times the median cell's
+    'verdict_margin': 1e-5,    # Std-dev this close to the threshold (relative) is recomputed point by point
+                               # (deviation.py works on float32 points)
+}
+
+# Local defect detection (knots, cracks, chipped edges) on top of global warp
+LOCAL_DEFECT_RADIUS = 0.01       # meters - neighborhood radius a point's residual is compared against
+LOCAL_DEFECT_THRESHOLD = 0.0005  # meters - flag points whose residual differs from their neighborhood by more
+LOCAL_DEFECT_MIN_POINTS = 20     # smallest flagged region reported as a defect
+LOCAL_DEFECT_KNN = 64            # neighbours per point for unorganized (merged) clouds
+
 TEXT_OR_IMAGE = True
 TEXT_PROMPT = "one brown, curvy cardboard"
 
@@ -52,6 +133,23 @@ CAMERA_RESOLUTION = {
     # 'mono': 'THE_720_P',    # Alternative high resolution
 }
 
+# Pixel size (width, height) of each sensor resolution
+SENSOR_RESOLUTION_SIZES = {
+    'THE_400_P': (640, 400),
+    'THE_480_P': (640, 480),
+    'THE_720_P': (1280, 720),
+    'THE_800_P': (1280, 800),
+    'THE_1080_P': (1920, 1080),
+    'THE_4_K': (3840, 2160),
+}
+
+# Resolutions stored in the calibration cache for each camera
+CALIBRATION_RESOLUTIONS = {
+    'rgb': ['THE_1080_P', 'THE_4_K'],
+    'left': ['THE_400_P', 'THE_480_P', 'THE_720_P', 'THE_800_P'],
+    'right': ['THE_400_P', 'THE_480_P', 'THE_720_P', 'THE_800_P'],
+}
+
 # Stereo depth configuration
 STEREO_DEPTH_CONFIG = {
     'preset': 'HIGH_DENSITY',  # HIGH_DENSITY, MEDIUM_DENSITY, HIGH_ACCURACY
@@ -59,3 +157,168 @@ STEREO_DEPTH_CONFIG = {
     'extended_disparity': True,
     'subpixel': True,
 }
+
+# Recording rectified mono pairs for offline stereo tuning (see src/stereo_replay.py)
+STEREO_RECORDING_CONFIG = {
+    'enabled': False,          # image_output.py also saves the rectified left/right frames of each capture
+    'dir': 'recordings',
+}
+OAK_D_LITE_BASELINE = 0.075    # Stereo baseline in meters, used when no calibration cache exists
+
+# Host-side stereo matching (OpenCV StereoSGBM) standing in for the device presets.
+# P1/P2 are per pixel of the block: OpenCV gets p1 * block_size^2 and p2 * block_size^2
+STEREO_HOST_PRESETS = {
+    'HIGH_DENSITY': {'block_size': 5, 'uniqueness': 5, 'speckle_window': 50, 'speckle_range': 2, 'p1': 8, 'p2': 32},
+    'MEDIUM_DENSITY': {'block_size': 5, 'uniqueness': 10, 'speckle_window': 100, 'speckle_range': 2, 'p1': 8, 'p2': 32},
+    'HIGH_ACCURACY': {'block_size': 7, 'uniqueness': 15, 'speckle_window': 200, 'speckle_range': 1, 'p1': 8, 'p2': 48},
+}
+STEREO_REPLAY_CONFIG = {
+    'num_disparities': 96,     # Search range in pixels (device: 95); doubled with extended disparity
+    'workers': 4,              # Processes matching tiles in parallel
+    'tiles': 4,                # Horizontal strips per frame
+    'tile_overlap': 16,        # Extra rows above/below each strip, cropped after matching
+    'roi': 0.5,                # Central fraction of the frame used for the flatness metric
+}
+
+# Cold start import-time budgets in milliseconds for the non-ML CLI subcommands
+# Checked by src/bench_import_time.py (values sized for a Raspberry Pi 5)
+IMPORT_TIME_BUDGET_MS = {
+    'cli': 100,          # wood_qa.py itself, before any subcommand is chosen
+    'capture': 2000,     # depthai + OpenCV
+    'cloud': 1000,       # OpenCV + NumPy
+    'deviation': 500,    # NumPy only
+}
+
+# Packages that only the ML subcommands (segment, inspect) are allowed to import
+ML_MODULES = ('torch', 'transformers')
+
+# Hardware SDKs that may be missing on a development machine; bench_import_time skips a
+# subcommand that cannot import them (any other ImportError fails the benchmark)
+OPTIONAL_HARDWARE_MODULES = ('depthai',)
+
+# Compressed geometry archive (src/cloud_archive.py) kept for every inspected panel
+ARCHIVE_CONFIG = {
+    'enabled': True,
+    'dir': 'archive',          # One .wqc file per panel, named by capture time
+    'quantum': 1e-5,           # Point archives: fixed-point step in meters (0.01 mm)
+    'depth_quantum': 0.01,     # Depth archives of float (fused) depth: step in depth units
+    'chunk_points': 65536,     # Points per independently decodable chunk
+    'chunk_rows': 32,          # Depth rows per independently decodable chunk
+    'level': 6,                # zlib compression level
+    'audit_batch_points': 10_000_000,  # Points fitted together by `archive audit` (about 500 MB of temporaries)
+}
+
+# Content-addressed stage result cache (src/stage_cache.py) for re-analysis runs: CLIPSeg
+# logits, masks, clouds and plane fits keyed by a hash of their inputs and settings, so
+# changing a downstream parameter only reruns the downstream stages
+STAGE_CACHE_CONFIG = {
+    'enabled': False,          # Off for live capture (every panel is new); python src/wood_qa.py --cache turns it on
+    'dir': 'stage_cache',      # One .npz per entry
+    'max_mb': 512,             # Least recently used entries are evicted beyond this
+    'version': 1,              # Bump when a stage's computation changes to invalidate old entries
+    'stats_path': 'stats.json',  # Lifetime hit/miss counts per stage, inside dir
+}
+
+# Memory profiling mode (python src/wood_qa.py --profile <command>), see src/profiling.py
+MEMORY_PROFILE_CONFIG = {
+    'budget_mb': {                 # Peak RSS budgets per stage module; 'total' for the whole run
+        'extract_wood': 2500,      # torch + CLIPSeg + 1080p float mask
+        'depth_to_cloud': 500,
+        'deviation': 500,
+        'total': 3000,             # Leave ~1 GB of a 4 GB Pi 5 for the OS
+    },
+    'top_allocators': 5,           # tracemalloc lines listed per stage
+    'traceback_frames': 1,
+    'large_array_mb': 1.0,         # Only report registered arrays at least this large
+    'report_path': 'memory_profile.json',
+}
+
+# Local inspection service (python src/wood_qa.py serve), see src/inspection_service.py
+INSPECTION_SERVICE_CONFIG = {
+    'host': '127.0.0.1',       # Local line software only
+    'port': 8765,
+    'max_batch': 4,            # Frames segmented together in one CLIPSeg forward pass
+    'max_latency_ms': 30,      # Longest a request waits for others to join its batch
+    'request_timeout': 60,     # Seconds before a queued request gives up
+}
+
+# Panel-arrival trigger mode (python src/wood_qa.py trigger), see src/trigger.py
+# presence: watch a downscaled depth stream for an object above the belt, centred in view
+# socket: wait for an external (PLC-style) trigger datagram on host:port
+TRIGGER_CONFIG = {
+    'mode': 'presence',
+    'downscale': 8,            # Presence check on every Nth depth row/column (80x50 at 400P)
+    'background_frames': 10,   # Frames of the empty belt that set its depth at start-up
+    'min_height_mm': 10,       # Depth this far in front of the belt counts as an object
+    'min_fill': 0.10,          # Fraction of the view the object must cover
+    'center_tolerance': 0.12,  # Max offset of the object's centroid from the image centre (fraction)
+    'settle_frames': 3,        # Centred frames before triggering; the stillest of them is inspected
+    'rearm_frames': 3,         # Empty frames after a panel before the next can trigger
+    'host': '127.0.0.1',
+    'port': 8766,              # UDP port for socket triggers
+    'log_path': 'panel_log.jsonl',  # One JSON line per inspected panel
+}
+
+# Panel ROI tracking between consecutive frames (src/roi_tracker.py), used only by the inspection
+# service (and the trigger inspector through it): CLIPSeg sees only the padded previous panel box,
+# geometry only the depth around the mask. The CLI stages see one capture per run and don't track
+ROI_TRACKER_CONFIG = {
+    'enabled': True,
+    'padding': 0.15,           # Box growth on each side, as a fraction of the box size
+    'min_confidence': 0.7,     # Below this a cropped result is redone on the full frame
+    'min_area': 0.02,          # Smallest panel mask, as a fraction of the frame, that can be tracked
+    'edge_margin': 2,          # Mask within this many pixels of a crop edge means the panel left the crop
+    'refresh_frames': 100,     # Full-frame pass at least this often (0: only when tracking is lost)
+    'depth_margin': 8,         # Pixels around the depth mask's bbox kept for filtering and back-projection
+}
+
+# Background artifact writer (src/artifact_writer.py): PNG/PLY/text outputs are written off
+# the critical path. Priorities: 0 = stage handoff files (never dropped, callers block when
+# the queue is full), 1 = normal outputs, 2 = heavy debug outputs
+ARTIFACT_WRITER_CONFIG = {
+    'enabled': True,           # False: write synchronously, as before
+    'workers': 2,
+    'max_queue': 16,
+    'png_compression': 1,      # 0-9; OpenCV's default is 3, 1 is much faster with similar size for masks
+    'shed_depth': {1: 12, 2: 6},  # Queue depth at which new jobs of each priority are dropped
+}
+
+# CPU thread budget and optional core affinity per stage module (src/resources.py).
+# Applied to torch, OpenCV and BLAS before each stage runs; 'default' covers the rest.
+# cpus: list of core ids to pin the stage to, or None for no pinning.
+# Pick the split for a machine with python src/bench_threads.py
+THREAD_BUDGETS = {
+    'extract_wood': {'threads': 3, 'cpus': None},
+    'inspection_service': {'threads': 3, 'cpus': None},
+    'depth_to_cloud': {'threads': 1, 'cpus': None},
+    'deviation': {'threads': 1, 'cpus': None},
+    'default': {'threads': 2, 'cpus': None},
+}
+
+# Golden-fixture regression gate (python src/wood_qa.py regress)
+# Runs every stage on the fixtures in fixtures/ and compares with the golden files there;
+# stage timings go to the history file and are compared with the median of recent passing runs
+REGRESSION_CONFIG = {
+    'history_path': 'regression_history.json',
+    'fixtures_dir': 'fixtures',    # Golden inputs/outputs; no pipeline stage writes here
+    'repeats': 5,                  # Timed runs per stage (the best is kept)
+    'baseline_runs': 5,            # Rolling baseline: median of this many recent passing runs on this host
+    'max_slowdown_pct': 25.0,      # Fail when a stage is this much slower than its baseline...
+    'min_slowdown_ms': 2.0,        # ...and at least this many ms slower (ignores jitter on fast stages)
+    'history_limit': 200,          # Runs kept in the history file
+    'min_mask_iou': 0.95,          # Segmentation mask vs wood_panel_mask.png
+    'plane_tolerance': 1e-6,       # Max difference of plane coefficients [a, b, c]
+    'residual_tolerance': 1e-6,    # Max per-point residual difference (m) vs deviations.txt
+    # Shipped pipeline (depth filter, calibration) vs the golden std-dev (m). The filter drops
+    # flying pixels the unfiltered golden run kept: 1.04 mm vs 1.40 mm on the fixture
+    'pipeline_std_tolerance': 0.0005,
+}
+
+# Shared-memory frame ring between separately running stage processes (src/frame_ring.py)
+# Fixed-size slots hold RGB, depth and mask frames; readers get NumPy views without copying
+FRAME_RING_CONFIG = {
+    'enabled': False,              # image_output.py also publishes each capture to the ring
+    'name': 'wood_qa_frames',      # Shared memory block name (/dev/shm/wood_qa_frames on Linux)
+    'slots': 4,                    # Frames kept; a reader more than slots - 1 frames behind loses frames
+    'poll_interval': 0.0002,       # Seconds between checks while waiting for a new frame
+}
@@ -0,0 +1,109 @@
+"""
+Temporal fusion of depth frames from a stationary panel
+The last K depth frames are kept in a ring buffer while per-pixel running mean,
+variance (Welford, with the oldest frame removed as a new one arrives) and valid
+counts are updated in place. Memory is fixed at K frames plus a few per-pixel
+arrays, and each extra frame costs the same constant amount of work
+"""
+
+import warnings
+import numpy as np
+from constants import DEPTH_FUSION_CONFIG
+
+class DepthFusion:
+    """Ring buffer of depth frames with per-pixel sliding-window statistics."""
+
+    def __init__(self, frames=DEPTH_FUSION_CONFIG['frames'], config=DEPTH_FUSION_CONFIG):
+        self.frames = frames
+        self.config = config
+        self.ring = None
+        self.n_frames = 0   # frames currently held (<= self.frames)
+        self.next_slot = 0
+
+    def _allocate(self, shape, dtype):
+        self.ring = np.zeros((self.frames,) + shape, dtype=dtype)
+        self.count = np.zeros(shape, dtype=np.int32)
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+
+    def _remove(self, frame):
+        """Reverse Welford update for the frame leaving the window."""
+        valid = frame > 0
+        x = frame[valid].astype(np.float64)
+        n = self.count[valid] - 1
+        mean = self.mean[valid]
+        delta = x - mean
+        new_mean = np.where(n > 0, mean - delta / np.maximum(n, 1), 0.0)
+        self.m2[valid] = np.where(n > 0, self.m2[valid] - delta * (x - new_mean), 0.0)
+        self.mean[valid] = new_mean
+        self.count[valid] = n
+
+    def _add(self, frame):
+        """Welford update for a new frame; zero depth is invalid and skipped."""
+        valid = frame > 0
+        x = frame[valid].astype(np.float64)
+        n = self.count[valid] + 1
+        mean = self.mean[valid]
+        delta = x - mean
+        mean += delta / n
+        self.m2[valid] += delta * (x - mean)
+        self.mean[valid] = mean
+        self.count[valid] = n
+
+    def add(self, depth_frame):
+        """Add a depth frame, evicting the oldest one once the ring is full."""
+        if self.ring is None:
+            self._allocate(depth_frame.shape, depth_frame.dtype)
+        elif depth_frame.shape != self.ring.shape[1:]:
+            raise ValueError(f"frame shape {depth_frame.shape} does not match {self.ring.shape[1:]}")
+
+        slot = self.ring[self.next_slot]
+        if self.n_frames == self.frames:
+            self._remove(slot)
+        else:
+            self.n_frames += 1
+        slot[...] = depth_frame
+        self._add(slot)
+        self.next_slot = (self.next_slot + 1) % self.frames
+
+    @property
+    def full(self):
+        return self.n_frames == self.frames
+
+    @property
+    def variance(self):
+        """Per-pixel sample variance of depth over the frames where it was valid."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, self.m2 / np.maximum(self.count - 1, 1), 0.0)
+
+    def median(self):
+        """Per-pixel temporal median over valid frames (0 where never valid)."""
+        frames = self.ring[:self.n_frames].astype(np.float32)
+        frames[frames == 0] = np.nan
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # pixels never valid are all-NaN
+            median = np.nanmedian(frames, axis=0)
+        return np.nan_to_num(median, nan=0.0)
+
+    def valid_mask(self):
+        """Pixels valid in at least min_valid_fraction of the held frames."""
+        return self.count >= max(1, int(np.ceil(self.config['min_valid_fraction'] * self.n_frames)))
+
+    def fused(self, method=None):
+        """Fused float32 depth map ('mean' or 'median' per DEPTH_FUSION_CONFIG), 0 where invalid.
+        Kept in floating point so averaging below one depth unit is not rounded away."""
+        method = method or self.config['method']
+        if method == 'mean':
+            depth = self.mean
+        elif method == 'median':
+            depth = self.median()
+        else:
+            raise ValueError(f"unknown fusion method: {method}")
+        return np.where(self.valid_mask(), depth, 0).astype(np.float32)
+
+    def confidence(self):
+        """Per-pixel weight in [0, 1] for weighted plane fitting: the fraction of frames
+        that were valid times how close the temporal std-dev is to the noise floor."""
+        floor = self.config['noise_floor'] ** 2
+        confidence = (self.count / self.frames) * floor / (floor + self.variance)
+        return np.where(self.valid_mask(), confidence, 0.0).astype(np.float32)
@@ -1,37 +1,43 @@
 import cv2
 import numpy as np
+import os
 import time
-from constants import OAK_D_LITE_INTRINSICS, DEPTH_SCALE, WOOD_PANEL_DEPTH_PATH, POINT_CLOUD_PATH
+from artifact_writer import wait_for, write_file, CRITICAL
+from calibration import get_intrinsics, get_distortion
+from cloud_archive import archive_panel
+from depth_filter import filter_depth
+from point_cloud import PointCloud
+from ray_table import get_ray_table
+from stage_cache import file_digest, get_cache
+from profiling import record_array
+from constants import (
+   ARCHIVE_CONFIG, DEPTH_CAMERA, DEPTH_SCALE, DEPTH_FILTER_CONFIG, DEPTH_CONFIDENCE_PATH, DEPTH_MAP_PATH,
+   WOOD_PANEL_DEPTH_PATH, POINT_CLOUD_PATH
+)
 
-start_time = time.time()
+# Load depth map
+def load_depth_map(filename):
+   wait_for(filename)  # may still be queued by the segment stage in this process
+   depth_map = cv2.imread(filename, cv2.IMREAD_UNCHANGED)
+   if depth_map is None:
+      raise FileNotFoundError(f'{filename} not found or could not be loaded.')
+   return depth_map
 
-# Get camera intrinsics from constants (no need to connect to camera every time)
-fx = OAK_D_LITE_INTRINSICS['fx']  # Focal Length X
-fy = OAK_D_LITE_INTRINSICS['fy']  # Focal Length Y
-cx = OAK_D_LITE_INTRINSICS['cx']  # Principal Point X (center of the image)
-cy = OAK_D_LITE_INTRINSICS['cy']  # Principal Point Y
+# Generate point cloud from a (masked) depth map
+# rays: undistorted ray table (ray_table.py); defaults to the cached device's with default intrinsics
+def depth_to_cloud(depth_map, intrinsics=None, depth_scale=DEPTH_SCALE, rays=None):
+   if intrinsics is None:
+      # Cached device calibration (no need to connect to camera every time)
+      intrinsics = get_intrinsics(DEPTH_CAMERA)
+      rays = get_ray_table(DEPTH_CAMERA)
+   return PointCloud.from_depth(depth_map, intrinsics, depth_scale, rays)
 
-# Load depth map
-depth_map = cv2.imread(WOOD_PANEL_DEPTH_PATH, cv2.IMREAD_UNCHANGED)
-if depth_map is None:
-   raise FileNotFoundError(f'{WOOD_PANEL_DEPTH_PATH} not found or could not be loaded.')
-
-height, width = depth_map.shape
-
-# Generate point cloud
-points = []
-for v in range(height):
-   for u in range(width):
-       d = depth_map[v, u]
-       if d == 0:
-           continue  # skip invalid depth
-       z = d * DEPTH_SCALE
-       x = (u - cx) * z / fx
-       y = (v - cy) * z / fy
-       points.append((x, y, z))
-
-# Save to PLY file
-def save_ply(filename, points):
+# Nx3 array of points, for callers that don't need the PointCloud container
+def depth_to_points(depth_map, intrinsics=None, depth_scale=DEPTH_SCALE, rays=None):
+   return depth_to_cloud(depth_map, intrinsics, depth_scale, rays).points
+
+# Save to PLY file, optionally with a per-point confidence property
+def save_ply(filename, points, confidence=None):
    with open(filename, 'w') as f:
        f.write('ply\n')
        f.write('format ascii 1.0\n')
@@ -39,13 +45,84 @@ def save_ply(filename, points):
        f.write('property float x\n')
        f.write('property float y\n')
        f.write('property float z\n')
+       if confidence is not None:
+           f.write('property float confidence\n')
        f.write('end_header\n')
-       for p in points:
-           f.write(f'{p[0]} {p[1]} {p[2]}\n')
+       if confidence is None:
+           for p in points:
+               f.write(f'{p[0]} {p[1]} {p[2]}\n')
+       else:
+           for p, c in zip(points, confidence):
+               f.write(f'{p[0]} {p[1]} {p[2]} {c}\n')
+
+# Per-pixel confidence of the fused depth capture, or None if there is none for the current
+# capture: the file records a digest of the depth map saved with it, so a map left over
+# from an earlier panel (e.g. before an unfused capture) is never used
+def load_depth_confidence(shape):
+   if not os.path.exists(DEPTH_CONFIDENCE_PATH) or not os.path.exists(DEPTH_MAP_PATH):
+      return None
+   with np.load(DEPTH_CONFIDENCE_PATH) as saved:
+      if 'depth_digest' not in saved or str(saved['depth_digest']) != file_digest(DEPTH_MAP_PATH):
+         print(f"⚠️ Ignoring {DEPTH_CONFIDENCE_PATH}: it belongs to another capture than {DEPTH_MAP_PATH}")
+         return None
+      confidence = saved['confidence']
+   if confidence.shape != shape:
+      return None
+   return confidence
+
+# Per-point confidence from the fused depth capture, if one matching this depth map exists
+def load_point_confidence(cloud):
+   confidence = load_depth_confidence(cloud.grid_shape)
+   if confidence is None:
+      return None
+   return confidence.ravel()[cloud.pixel_index]
+
+def main():
+   start_time = time.time()
+
+   depth_map = load_depth_map(WOOD_PANEL_DEPTH_PATH)
+   intrinsics = get_intrinsics(DEPTH_CAMERA)
+   rays = get_ray_table(DEPTH_CAMERA)
+   distortion = get_distortion(DEPTH_CAMERA) if rays is not None else None
+
+   # A masked depth map already converted with the same settings comes from the stage cache
+   cache = get_cache()
+   cloud_key = None
+   if cache.enabled:
+      depth_filter = DEPTH_FILTER_CONFIG if DEPTH_FILTER_CONFIG['enabled'] else None
+      cloud_key = cache.key('cloud', depth_map, intrinsics=intrinsics, distortion=distortion,
+                            depth_scale=DEPTH_SCALE, depth_filter=depth_filter)
+   cached = cache.get('cloud', cloud_key)
+   if cached is not None:
+      depth_map = cached['depth']
+      cloud = PointCloud(cached['xyz'], cached['pixel_index'], depth_map.shape)
+      print(f"Loaded filtered depth and {len(cloud)} points from the stage cache")
+   else:
+      # Drop flying pixels and speckle before back-projection
+      if DEPTH_FILTER_CONFIG['enabled']:
+         depth_map, stats = filter_depth(depth_map)
+         print(f"Filtered depth: removed {stats['removed']}/{stats['input']} pixels "
+               f"(edges {stats['removed_edges']}, discontinuities {stats['removed_discontinuities']}, "
+               f"speckle {stats['removed_speckle']}) in {stats['elapsed_ms']:.1f} ms")
+      cloud = depth_to_cloud(depth_map, intrinsics, rays=rays)
+      cache.put('cloud', cloud_key, depth=depth_map, xyz=cloud.xyz, pixel_index=cloud.pixel_index)
+   if rays is not None:
+      print("Back-projecting along undistorted rays (lens distortion corrected)")
+
+   record_array('depth_map', depth_map)
+   record_array('cloud_xyz', cloud.xyz)
+   confidence = load_point_confidence(cloud)
+   write_file(POINT_CLOUD_PATH, lambda target: save_ply(target, cloud.points, confidence), CRITICAL)
+   print(f"Writing {len(cloud)} points to {POINT_CLOUD_PATH} ({cloud.nbytes / 1e6:.2f} MB in memory)")
+
+   # Compact copy of the panel geometry for later audits
+   if ARCHIVE_CONFIG['enabled']:
+      archive_path = archive_panel(depth_map, intrinsics, DEPTH_SCALE, distortion=distortion)
+      print(f"Archiving panel depth to {archive_path}")
 
-save_ply(POINT_CLOUD_PATH, points)
-print(f"Saved {len(points)} points to {POINT_CLOUD_PATH}")
+   end_time = time.time()
+   elapsed_time = end_time - start_time
+   print(f"Execution time: {elapsed_time:.2f} seconds")
 
-end_time = time.time()
-elapsed_time = end_time - start_time
-print(f"Execution time: {elapsed_time:.2f} seconds")
\ No newline at end of file
+if __name__ == "__main__":
+   main()
@@ -1,28 +1,43 @@
 import numpy as np
+import sys
 import time
-from constants import POINT_CLOUD_PATH, DEVIATIONS_PATH, DEVIATION_THRESHOLD
+from artifact_writer import wait_for, write_text, HEAVY
+from profiling import record_array
+from stage_cache import file_digest, get_cache
+from constants import (
+   POINT_CLOUD_PATH, DEVIATIONS_PATH, DEVIATION_HEATMAP_PATH, DEVIATION_THRESHOLD, PROGRESSIVE_VERDICT_CONFIG,
+   PYRAMID_CONFIG
+)
 
-# Load point cloud from PLY file
-def load_ply(filename):
-   points = []
+# Read a PLY file as (Nx3 float32 points, {extra property name: column})
+def read_ply(filename):
+   wait_for(filename)  # may still be queued by the cloud stage in this process
+   properties = []
    with open(filename, 'r') as f:
-       header = True
        for line in f:
-           if header:
-               if line.strip() == 'end_header':
-                   header = False
-               continue
-           parts = line.strip().split()
-           if len(parts) >= 3:
-               x, y, z = map(float, parts[:3])
-               points.append([x, y, z])
-   return np.array(points)
+           parts = line.split()
+           if parts[:1] == ['property']:
+               properties.append(parts[-1])
+           if line.strip() == 'end_header':
+               break
+       data = np.loadtxt(f, dtype=np.float32, ndmin=2).reshape(-1, max(len(properties), 3))
+   extras = {name: data[:, i] for i, name in enumerate(properties) if name not in ('x', 'y', 'z')}
+   return data[:, :3], extras
+
+# Load point cloud from PLY file as an Nx3 float32 array
+def load_ply(filename):
+   return read_ply(filename)[0]
 
 # Fit plane to 3D points using least squares (ax + by + c = z)
-def fit_plane(points):
+# Optional per-point weights (e.g. fused depth confidence) give a weighted fit
+def fit_plane(points, weights=None):
    X = points[:, :2]
    X = np.c_[X, np.ones(X.shape[0])]  # [x, y, 1]
    Z = points[:, 2]
+   if weights is not None:
+       sqrt_w = np.sqrt(weights)
+       X = X * sqrt_w[:, None]
+       Z = Z * sqrt_w
    # Solve for [a, b, c] in ax + by + c = z
    coeffs, _, _, _ = np.linalg.lstsq(X, Z, rcond=None)
    return coeffs  # a, b, c
@@ -34,32 +49,202 @@ def compute_deviations(points, plane_coeffs):
    deviations = points[:, 2] - z_plane
    return deviations
 
-if __name__ == "__main__":
-   start_time = time.time()
-   # Parameters
-   ply_file = POINT_CLOUD_PATH
-   deviation_threshold = DEVIATION_THRESHOLD  # meters (from constants)
+# Per-cloud sums of values over ragged segments (counts[i] rows for cloud i, in order).
+# np.add.reduceat runs on the non-empty segments only: for an empty one it would return
+# the next cloud's first value
+def segment_sums(values, counts, starts=None):
+   sums = np.zeros(counts.size)
+   nonempty = counts > 0
+   if nonempty.any():
+      if starts is None:
+         starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+      sums[nonempty] = np.add.reduceat(values, starts[nonempty])
+   return sums
+
+# Per-cloud sums of 1 (or the weight), x, y, z and their products over concatenated
+# points, taken relative to origin
+def batch_moments(points, offsets, origin, weights=None):
+   counts = np.diff(offsets)
+   starts = offsets[:-1] - offsets[0]
+   rows = slice(offsets[0], offsets[-1])
+   # One pass each: float64 conversion and shift, then one product and one reduction per moment
+   x, y, z = (np.subtract(points[rows, i], origin[i], dtype=np.float64) for i in range(3))
+   if weights is None:
+      sums = {'n': counts.astype(np.float64)}
+      wx, wy, wz = x, y, z
+   else:
+      w = np.asarray(weights[rows], dtype=np.float64)
+      sums = {'n': segment_sums(w, counts, starts)}
+      wx, wy, wz = w * x, w * y, w * z
+   for name, values in (('x', wx), ('y', wy), ('z', wz), ('xx', wx * x), ('xy', wx * y), ('yy', wy * y),
+                        ('xz', wx * z), ('yz', wy * z), ('zz', wz * z)):
+      sums[name] = segment_sums(values, counts, starts)
+   return sums
+
+# [a, b, c] per cloud from its moment sums: all 3x3 normal equations in one stacked
+# np.linalg.solve. Clouds with fewer than 3 points or collinear points get NaN
+def solve_planes(m, counts):
+   normal = np.empty((counts.size, 3, 3))
+   normal[:, 0] = np.stack([m['xx'], m['xy'], m['x']], axis=1)
+   normal[:, 1] = np.stack([m['xy'], m['yy'], m['y']], axis=1)
+   normal[:, 2] = np.stack([m['x'], m['y'], m['n']], axis=1)
+   # Degenerate when the centred x/y spread has (almost) no area
+   n = np.where(m['n'] > 0, m['n'], 1.0)
+   cxx, cxy, cyy = m['xx'] - m['x'] ** 2 / n, m['xy'] - m['x'] * m['y'] / n, m['yy'] - m['y'] ** 2 / n
+   solvable = (counts >= 3) & (cxx * cyy - cxy * cxy > 1e-12 * np.maximum(cxx * cyy, np.finfo(float).tiny))
+   normal[~solvable] = np.eye(3)
+   rhs = np.stack([m['xz'], m['yz'], m['z']], axis=1)
+   coeffs = np.linalg.solve(normal, rhs[:, :, None])[:, :, 0]
+   coeffs[~solvable] = np.nan
+   return coeffs
+
+# Flatness of many clouds in one vectorized call, for audits over stored panels: points is
+# the clouds' Nx3 points concatenated and offsets[i]:offsets[i + 1] the rows of cloud i.
+# Per cloud: plane [a, b, c] (as fit_plane), residual std-dev (as np.std of
+# compute_deviations, here from the moment sums), verdict and point count. Clouds without
+# a plane get NaN and are not WARPED
+def batch_flatness(points, offsets, threshold=DEVIATION_THRESHOLD, weights=None):
+   offsets = np.asarray(offsets)
+   counts = np.diff(offsets)
+   # Shift by the first point so the sums don't carry the ~0.6 m camera distance
+   origin = points[offsets[0]].astype(np.float64) if offsets[-1] > offsets[0] else np.zeros(3)
+   m = batch_moments(points, offsets, origin)
+   fit_moments = m if weights is None else batch_moments(points, offsets, origin, weights)
+   a, b, c = solve_planes(fit_moments, counts).T
+
+   # Residual sum and sum of squares of z - (ax + by + c), every point counted once
+   total = m['z'] - a * m['x'] - b * m['y'] - c * m['n']
+   squares = (m['zz'] + a * a * m['xx'] + b * b * m['yy'] + c * c * m['n']
+              - 2 * a * m['xz'] - 2 * b * m['yz'] - 2 * c * m['z']
+              + 2 * a * b * m['xy'] + 2 * a * c * m['x'] + 2 * b * c * m['y'])
+   n = np.maximum(m['n'], 1.0)
+   std_dev = np.sqrt(np.maximum(squares / n - (total / n) ** 2, 0.0))
+   return {
+      'plane': np.stack([a, b, c + origin[2] - a * origin[0] - b * origin[1]], axis=1),
+      'std_dev': std_dev,
+      'warped': std_dev > threshold,  # NaN compares False
+      'n_points': counts,
+   }
+
+# Concatenate clouds (each Nx3) for the batch routines: (points, offsets)
+def concat_clouds(clouds):
+   offsets = np.concatenate([[0], np.cumsum([len(cloud) for cloud in clouds])]).astype(np.int64)
+   points = np.concatenate(clouds) if clouds else np.empty((0, 3), dtype=np.float32)
+   return points, offsets
+
+# Confidence interval for the residual std-dev from a random sample of points.
+# Distribution-free: the standard error of the variance comes from the fourth moment
+# (warped panels have far from Gaussian residuals)
+def std_interval(residuals, z):
+   n = residuals.size
+   r2 = residuals * residuals
+   variance = r2.sum() / max(n - 3, 1)  # three plane parameters were fitted
+   fourth = np.dot(r2, r2) / n
+   se_variance = np.sqrt(max(fourth - variance * variance, 0.0) / n)
+   std_dev = np.sqrt(variance)
+   low = np.sqrt(max(variance - z * se_variance, 0.0))
+   high = np.sqrt(variance + z * se_variance)
+   return std_dev, low, high
+
+# Decide FLAT/WARPED from growing random subsets, stopping once the std-dev interval is
+# entirely on one side of the threshold. Borderline panels end up using every point
+def progressive_verdict(points, threshold=DEVIATION_THRESHOLD, weights=None, config=PROGRESSIVE_VERDICT_CONFIG):
+   total = points.shape[0]
+   rng = np.random.default_rng(config['seed'])
+   # Sampled with replacement: drawing n indices costs O(n), a permutation would cost O(total)
+   index = np.empty(0, dtype=np.int64)
+   n = min(config['initial_points'], total)
+   rounds = 0
+   while True:
+      rounds += 1
+      if n >= total:
+         # Same computation as the full analysis, so borderline verdicts cannot change
+         plane_coeffs = fit_plane(points, weights)
+         std_dev = float(np.std(compute_deviations(points, plane_coeffs)))
+         low = high = std_dev
+         n = total
+      else:
+         index = np.concatenate([index, rng.integers(0, total, n - index.size)])
+         sample = points[index]
+         plane_coeffs = fit_plane(sample, weights[index] if weights is not None else None)
+         std_dev, low, high = std_interval(compute_deviations(sample, plane_coeffs), config['z'])
+      if low > threshold or high <= threshold or n == total:
+         return {
+            'warped': std_dev > threshold if n == total else low > threshold,
+            'std_dev': std_dev,
+            'interval': (low, high),
+            'plane': plane_coeffs,
+            'n_used': n,
+            'fraction': n / total,
+            'rounds': rounds,
+         }
+      n = min(n * config['growth'], total)
 
-   # Load points
-   points = load_ply(ply_file)
+# Coarse-to-fine analysis straight from the masked depth image (pyramid.py): plane and
+# std-dev from per-cell moments, local |residual| heatmap written as an image
+def pyramid_analysis(threshold=DEVIATION_THRESHOLD):
+   from calibration import get_intrinsics
+   from depth_filter import filter_depth
+   from depth_to_cloud import load_depth_confidence, load_depth_map
+   from pyramid import pyramid_flatness, heatmap_image
+   from ray_table import get_ray_table
+   from artifact_writer import write_png
+   from constants import DEPTH_CAMERA, DEPTH_FILTER_CONFIG, WOOD_PANEL_DEPTH_PATH
+
+   depth_map = load_depth_map(WOOD_PANEL_DEPTH_PATH)
+   if DEPTH_FILTER_CONFIG['enabled']:
+      depth_map, _ = filter_depth(depth_map)  # same points as the cloud stage keeps
+   weights = load_depth_confidence(depth_map.shape)
+   if weights is not None:
+      print("Using per-pixel depth confidence as plane fit weights")
+
+   result = pyramid_flatness(depth_map, get_intrinsics(DEPTH_CAMERA), threshold,
+                             rays=get_ray_table(DEPTH_CAMERA), weights=weights)
+   a, b, c = result['plane']
+   print(f"Fitted plane: z = {a:.6f}*x + {b:.6f}*y + {c:.6f}")
+   print(f"Pyramid 1/{result['factor']}: {result['cells']} cells, {result['refined_cells']} refined at full "
+         f"resolution ({result['refined_fraction'] * 100:.1f}% of {result['n_points']} points)"
+         + (", verdict re-checked point by point" if result['fallback'] else ""))
+   write_png(DEVIATION_HEATMAP_PATH, heatmap_image(result['heatmap'], threshold), HEAVY, copy=False)
+   return result
+
+# Load points (and per-point confidence when the depth was fused over several frames)
+def load_points(ply_file):
+   points, extras = read_ply(ply_file)
    if points.shape[0] == 0:
        print("No points loaded from point cloud.")
-       exit(1)
+       sys.exit(1)
+   weights = extras.get('confidence')
+   if weights is not None:
+       print("Using per-point depth confidence as plane fit weights")
+   return points, weights
 
-   # Fit plane
-   plane_coeffs = fit_plane(points)
-   print(f"Fitted plane: z = {plane_coeffs[0]:.6f}*x + {plane_coeffs[1]:.6f}*y + {plane_coeffs[2]:.6f}")
+# Plane, deviations and their std-dev for a PLY file. A file analyzed before (same bytes)
+# comes from the stage cache; the threshold is not part of the key, so changing it reuses the fit
+def full_analysis(ply_file):
+   cache = get_cache()
+   fit_key = None
+   if cache.enabled:
+      wait_for(ply_file)
+      fit_key = cache.key('fit', file_digest(ply_file))
+   cached = cache.get('fit', fit_key)
+   if cached is not None:
+      print(f"Loaded the plane fit of {cached['deviations'].size} points from the stage cache")
+      return cached['plane'], cached['deviations'], float(cached['std_dev'])
 
-   # Compute deviations
+   points, weights = load_points(ply_file)
+   plane_coeffs = fit_plane(points, weights)
    deviations = compute_deviations(points, plane_coeffs)
-   std_dev = np.std(deviations)
-   print(f"Standard deviation of vertical deviations: {std_dev:.6f} meters")
-
-   # Save deviations for inspection
-   np.savetxt(DEVIATIONS_PATH, deviations)
+   record_array('points', points)
+   record_array('deviations', deviations)
+   std_dev = float(np.std(deviations))
+   cache.put('fit', fit_key, plane=plane_coeffs, deviations=deviations, std_dev=np.array(std_dev))
+   return plane_coeffs, deviations, std_dev
 
+# Print the verdict and the stage's execution time
+def report_verdict(warped, deviation_threshold, start_time):
    # Determine if warped
-   if std_dev > deviation_threshold:
+   if warped:
        print(f"Wood panel is WARPED (std dev > {deviation_threshold})")
    else:
        print(f"Wood panel is FLAT (std dev <= {deviation_threshold})")
@@ -67,3 +252,39 @@ if __name__ == "__main__":
    end_time = time.time()
    elapsed_time = end_time - start_time
    print(f"Execution time: {elapsed_time:.2f} seconds")
+
+def main():
+   start_time = time.time()
+   # Parameters
+   ply_file = POINT_CLOUD_PATH
+   deviation_threshold = DEVIATION_THRESHOLD  # meters (from constants)
+
+   if PYRAMID_CONFIG['enabled']:
+      result = pyramid_analysis(deviation_threshold)
+      print(f"Standard deviation of vertical deviations: {result['std_dev']:.6f} meters")
+      report_verdict(result['warped'], deviation_threshold, start_time)
+      return
+
+   if PROGRESSIVE_VERDICT_CONFIG['enabled']:
+      points, weights = load_points(ply_file)
+      result = progressive_verdict(points, deviation_threshold, weights)
+      low, high = result['interval']
+      print(f"Progressive verdict: used {result['n_used']}/{points.shape[0]} points "
+            f"({result['fraction'] * 100:.1f}%) in {result['rounds']} round(s)")
+      print(f"Standard deviation of vertical deviations: {result['std_dev']:.6f} meters "
+            f"(interval {low:.6f} - {high:.6f})")
+      warped = result['warped']
+   else:
+      # Fit plane and compute deviations
+      plane_coeffs, deviations, std_dev = full_analysis(ply_file)
+      print(f"Fitted plane: z = {plane_coeffs[0]:.6f}*x + {plane_coeffs[1]:.6f}*y + {plane_coeffs[2]:.6f}")
+      print(f"Standard deviation of vertical deviations: {std_dev:.6f} meters")
+
+      # Save deviations for inspection
+      write_text(DEVIATIONS_PATH, deviations, HEAVY, copy=False)
+      warped = std_dev > deviation_threshold
+
+   report_verdict(warped, deviation_threshold, start_time)
+
+if __name__ == "__main__":
+   main()
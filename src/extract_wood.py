@@ -1,140 +1,238 @@
-import torch
-from transformers import CLIPSegProcessor, CLIPSegForImageSegmentation
 from PIL import Image
 import numpy as np
 import cv2
+import sys
 import time
 import warnings
+from artifact_writer import write_png, CRITICAL, NORMAL
+from compact_mask import CompactMask
+from profiling import record_array
+from stage_cache import digest, get_cache
 from constants import (
-    RGB_IMAGE_PATH, WOOD_REFERENCE_PATH, WOOD_PANEL_MASK_PATH, 
+    RGB_IMAGE_PATH, WOOD_REFERENCE_PATH, WOOD_PANEL_MASK_PATH,
     WOOD_PANEL_DEPTH_PATH, DEPTH_MAP_PATH, CLIPSEG_MODEL, SEGMENTATION_THRESHOLD,
     TEXT_OR_IMAGE, TEXT_PROMPT
 )
 
-# Suppress CLIPSeg processor warnings
-warnings.filterwarnings("ignore", category=UserWarning, module="transformers")
-
-start_time = time.time()
-
-print("=" * 50)
-print("Wood Panel Segmentation with CLIPSeg")
-print("=" * 50)
-
-# Load the RGB image (from file, as saved by cam_output.py)
-print("\n1. Loading RGB image...")
-try:
-    rgb_image = Image.open(RGB_IMAGE_PATH).convert("RGB")
-    print(f"✓ Loaded RGB image: {rgb_image.size}")
-except Exception as e:
-    print(f"✗ Error loading RGB image: {e}")
-    exit(1)
-
-# Load CLIPSeg model and processor
-print("\n2. Loading CLIPSeg model...")
-try:
-    processor = CLIPSegProcessor.from_pretrained(CLIPSEG_MODEL)
-    model = CLIPSegForImageSegmentation.from_pretrained(CLIPSEG_MODEL)
-    print("✓ CLIPSeg model loaded successfully")
-except Exception as e:
-    print(f"✗ Error loading CLIPSeg model: {e}")
-    exit(1)
-
-# Configuration
-use_text_prompt = TEXT_OR_IMAGE  # Switch to text prompt as it's more reliable
-text_prompt = TEXT_PROMPT
-
-print(f"\n3. Running segmentation...")
-if use_text_prompt:
-    print(f"Using text prompt: '{text_prompt}'")
-else:
-    print("Using reference image for segmentation")
-    try:
-        reference_image = Image.open(WOOD_REFERENCE_PATH).convert("RGB")
-        print(f"✓ Loaded reference image: {reference_image.size}")
-    except Exception as e:
-        print(f"✗ Error loading reference image: {e}")
-        exit(1)
+# torch and transformers are imported inside the functions that need them so that
+# the mask helpers in this module can be used without paying the model import cost
 
-# Prepare inputs for CLIPSeg
-try:
-    if use_text_prompt:
+def load_clipseg_model(model_name=CLIPSEG_MODEL, local_files_only=False):
+    """Load the CLIPSeg processor and model (local_files_only skips any Hub lookup)."""
+    from transformers import CLIPSegProcessor, CLIPSegForImageSegmentation
+
+    # Suppress CLIPSeg processor warnings
+    warnings.filterwarnings("ignore", category=UserWarning, module="transformers")
+
+    processor = CLIPSegProcessor.from_pretrained(model_name, local_files_only=local_files_only)
+    model = CLIPSegForImageSegmentation.from_pretrained(model_name, local_files_only=local_files_only)
+    return processor, model
+
+def load_segmentation_model(local_files_only=False):
+    """Load the compiled artifact (compiled_model.py) when it matches the configured model
+    and prompt, otherwise the regular Hugging Face model. Returns (processor, model)."""
+    from compiled_model import artifact_matches, load_compiled_model, read_manifest
+    from resources import configure_torch
+
+    if artifact_matches(read_manifest()):
+        loaded = load_compiled_model()
+    else:
+        loaded = load_clipseg_model(local_files_only=local_files_only)
+    configure_torch()  # torch is imported now; apply the stage's thread budget to it
+    return loaded
+
+def predict_logits(processor, model, rgb_images, text_prompt=None, reference_image=None):
+    """Run CLIPSeg on a batch of images in one forward pass.
+    Returns the raw logits as a float32 (B, 352, 352) array."""
+    import torch
+
+    # Prepare inputs for CLIPSeg
+    if text_prompt is not None:
         # Use text prompt - more reliable approach
-        inputs = processor(text=[text_prompt], images=[rgb_image], return_tensors="pt")
+        inputs = processor(text=[text_prompt] * len(rgb_images), images=rgb_images,
+                           padding=True, return_tensors="pt")
     else:
         # Use image prompt - prepare both images separately
-        encoded_image = processor(images=[rgb_image], return_tensors="pt")
+        encoded_image = processor(images=rgb_images, return_tensors="pt")
         encoded_prompt = processor(images=[reference_image], return_tensors="pt")
-    
-    print("✓ Inputs prepared for CLIPSeg")
-except Exception as e:
-    print(f"✗ Error preparing inputs: {e}")
-    exit(1)
-
-# Run segmentation
-try:
+        conditional = encoded_prompt.pixel_values.expand(len(rgb_images), -1, -1, -1)
+
+    # Run segmentation
     with torch.no_grad():
-        if use_text_prompt:
+        if text_prompt is not None:
             outputs = model(**inputs)
         else:
-            outputs = model(**encoded_image, conditional_pixel_values=encoded_prompt.pixel_values)
-        mask = outputs.logits[0]  # shape: (352, 352)
-    
-    print("✓ Segmentation completed")
-except Exception as e:
-    print(f"✗ Error during segmentation: {e}")
-    exit(1)
-
-# Convert mask to numpy and resize to original image size
-print("\n4. Processing segmentation mask...")
-mask_np = torch.sigmoid(mask).cpu().numpy()
-mask_resized = cv2.resize(mask_np, rgb_image.size, interpolation=cv2.INTER_LINEAR)
-
-# Threshold to get binary mask
-mask_binary = (mask_resized > SEGMENTATION_THRESHOLD).astype(np.uint8) * 255
-print(f"✓ Applied threshold: {SEGMENTATION_THRESHOLD}")
-
-# Save the mask
-cv2.imwrite(WOOD_PANEL_MASK_PATH, mask_binary)
-print(f"✓ Segmentation mask saved: {WOOD_PANEL_MASK_PATH}")
-
-# Load the depth map
-print("\n5. Loading depth map...")
-try:
-    depth_map = cv2.imread(DEPTH_MAP_PATH, cv2.IMREAD_UNCHANGED)
-    if depth_map is None:
-        raise FileNotFoundError(f"Could not load depth map from {DEPTH_MAP_PATH}")
-    print(f"✓ Loaded depth map: {depth_map.shape}")
-except Exception as e:
-    print(f"✗ Error loading depth map: {e}")
-    exit(1)
-
-# Ensure mask and depth map are the same size
-print("\n6. Applying mask to depth map...")
-if depth_map.shape[:2] != mask_binary.shape:
-    mask_binary_resized = cv2.resize(mask_binary, (depth_map.shape[1], depth_map.shape[0]), interpolation=cv2.INTER_NEAREST)
-    print(f"✓ Resized mask from {mask_binary.shape} to {mask_binary_resized.shape}")
-else:
-    mask_binary_resized = mask_binary
-    print("✓ Mask and depth map sizes match")
-
-# Apply mask: where if condition is true (mask_binary_resized == 255), keep depth value, otherwise set background to 0
-wood_panel_depth = np.where(mask_binary_resized == 255, depth_map, 0).astype(depth_map.dtype)
-
-# Count segmented pixels
-wood_pixels = np.count_nonzero(mask_binary_resized == 255)
-total_pixels = mask_binary_resized.size
-percentage = (wood_pixels / total_pixels) * 100
-print(f"✓ Wood panel coverage: {wood_pixels}/{total_pixels} pixels ({percentage:.1f}%)")
-
-# Save the masked depth map
-cv2.imwrite(WOOD_PANEL_DEPTH_PATH, wood_panel_depth)
-print(f"✓ Masked depth map saved: {WOOD_PANEL_DEPTH_PATH}")
-
-end_time = time.time()
-elapsed_time = end_time - start_time
-
-print(f"\n Segmentation completed successfully!")
-print(f"Generated files:")
-print(f"  - {WOOD_PANEL_MASK_PATH}")
-print(f"  - {WOOD_PANEL_DEPTH_PATH}")
-print(f"Execution time: {elapsed_time:.2f} seconds")
\ No newline at end of file
+            outputs = model(**encoded_image, conditional_pixel_values=conditional)
+        logits = outputs.logits.reshape(len(rgb_images), *outputs.logits.shape[-2:])  # (B, 352, 352)
+    return logits.cpu().numpy().astype(np.float32, copy=False)
+
+def logits_to_masks(logits, sizes):
+    """Mask probabilities from CLIPSeg logits, resized to each (width, height) in sizes."""
+    with np.errstate(over='ignore'):  # exp overflows to inf for very negative logits: probability 0
+        masks = 1.0 / (1.0 + np.exp(-logits))
+    return [cv2.resize(mask, size, interpolation=cv2.INTER_LINEAR) for mask, size in zip(masks, sizes)]
+
+def predict_masks(processor, model, rgb_images, text_prompt=None, reference_image=None):
+    """Run CLIPSeg on a batch of images in one forward pass.
+    Returns one probability mask per image, resized to that image's size."""
+    logits = predict_logits(processor, model, rgb_images, text_prompt, reference_image)
+    return logits_to_masks(logits, [image.size for image in rgb_images])
+
+def predict_mask(processor, model, rgb_image, text_prompt=None, reference_image=None):
+    """Run CLIPSeg and return mask probabilities resized to the RGB image size."""
+    return predict_masks(processor, model, [rgb_image], text_prompt, reference_image)[0]
+
+def logits_cache_key(cache, rgb_image, text_prompt=None, reference_image=None):
+    """Stage cache key of the CLIPSeg logits: the image pixels plus the model, the prompt
+    and the compiled artifact (traced graph, frozen preprocessing) when it is used."""
+    from compiled_model import artifact_matches, read_manifest
+
+    manifest = read_manifest()
+    reference = digest(np.asarray(reference_image)) if reference_image is not None else None
+    return cache.key('logits', np.asarray(rgb_image), model=CLIPSEG_MODEL, prompt=text_prompt, reference=reference,
+                     compiled=manifest if artifact_matches(manifest) else None)
+
+def threshold_mask(mask_probabilities, threshold=SEGMENTATION_THRESHOLD):
+    """Threshold mask probabilities into a 0/255 uint8 mask."""
+    return (mask_probabilities > threshold).astype(np.uint8) * 255
+
+def apply_mask_to_depth(mask, depth_map):
+    """Resize the mask (0/255 array or CompactMask) to the depth map if needed and zero out
+    depth outside the panel. Returns (masked depth, CompactMask at depth resolution)."""
+    if not isinstance(mask, CompactMask):
+        mask = CompactMask.from_array(mask == 255)
+    # Nearest-neighbour resize and masking only touch the mask's bounding box
+    mask = mask.resized(depth_map.shape[:2])
+    return mask.apply(depth_map), mask
+
+def main():
+    """Segment the wood panel from the RGB image and mask the depth map."""
+    start_time = time.time()
+
+    print("=" * 50)
+    print("Wood Panel Segmentation with CLIPSeg")
+    print("=" * 50)
+
+    # Load the RGB image (from file, as saved by cam_output.py)
+    print("\n1. Loading RGB image...")
+    try:
+        rgb_image = Image.open(RGB_IMAGE_PATH).convert("RGB")
+        print(f"✓ Loaded RGB image: {rgb_image.size}")
+    except Exception as e:
+        print(f"✗ Error loading RGB image: {e}")
+        sys.exit(1)
+
+    # Configuration
+    use_text_prompt = TEXT_OR_IMAGE  # Switch to text prompt as it's more reliable
+    text_prompt = TEXT_PROMPT if use_text_prompt else None
+    reference_image = None
+    if not use_text_prompt:
+        try:
+            reference_image = Image.open(WOOD_REFERENCE_PATH).convert("RGB")
+        except Exception as e:
+            print(f"✗ Error loading reference image: {e}")
+            sys.exit(1)
+
+    # Logits of an image already segmented with the same model and prompt come from the
+    # stage cache, without loading the model
+    cache = get_cache()
+    logits_key = logits_cache_key(cache, rgb_image, text_prompt, reference_image) if cache.enabled else None
+    cached = cache.get('logits', logits_key)
+
+    # Load CLIPSeg model and processor
+    print("\n2. Loading CLIPSeg model...")
+    if cached is not None:
+        print("✓ Skipped: logits for this image and prompt are in the stage cache")
+    else:
+        try:
+            processor, model = load_segmentation_model()
+            print("✓ CLIPSeg model loaded successfully")
+        except Exception as e:
+            print(f"✗ Error loading CLIPSeg model: {e}")
+            sys.exit(1)
+
+    print(f"\n3. Running segmentation...")
+    if use_text_prompt:
+        print(f"Using text prompt: '{text_prompt}'")
+    else:
+        print("Using reference image for segmentation")
+        print(f"✓ Loaded reference image: {reference_image.size}")
+
+    if cached is not None:
+        logits = cached['logits']
+        print("✓ Segmentation loaded from the stage cache")
+    else:
+        try:
+            logits = predict_logits(processor, model, [rgb_image], text_prompt, reference_image)
+            cache.put('logits', logits_key, logits=logits)
+            print("✓ Segmentation completed")
+        except Exception as e:
+            print(f"✗ Error during segmentation: {e}")
+            sys.exit(1)
+
+    # Threshold to get binary mask
+    print("\n4. Processing segmentation mask...")
+    mask_key = None
+    if cache.enabled:
+        mask_key = cache.key('mask', logits, threshold=SEGMENTATION_THRESHOLD, size=rgb_image.size)
+    cached = cache.get('mask', mask_key)
+    if cached is not None:
+        mask_binary = CompactMask(tuple(cached['shape']), tuple(cached['bbox']), cached['packed']).to_array()
+    else:
+        mask_resized = logits_to_masks(logits, [rgb_image.size])[0]
+        record_array('mask_probabilities', mask_resized)
+        mask_binary = threshold_mask(mask_resized, SEGMENTATION_THRESHOLD)
+        if cache.enabled:
+            compact = CompactMask.from_array(mask_binary == 255)
+            cache.put('mask', mask_key, shape=np.array(compact.shape), bbox=np.array(compact.bbox), packed=compact.packed)
+    record_array('mask_binary', mask_binary)
+    print(f"✓ Applied threshold: {SEGMENTATION_THRESHOLD}" + (" (mask from the stage cache)" if cached is not None else ""))
+
+    # Save the mask
+    if write_png(WOOD_PANEL_MASK_PATH, mask_binary, NORMAL, copy=False):
+        print(f"✓ Segmentation mask queued: {WOOD_PANEL_MASK_PATH}")
+    else:
+        print(f"⚠️ Writer queue full, skipped {WOOD_PANEL_MASK_PATH}")
+
+    # Load the depth map
+    print("\n5. Loading depth map...")
+    try:
+        depth_map = cv2.imread(DEPTH_MAP_PATH, cv2.IMREAD_UNCHANGED)
+        if depth_map is None:
+            raise FileNotFoundError(f"Could not load depth map from {DEPTH_MAP_PATH}")
+        print(f"✓ Loaded depth map: {depth_map.shape}")
+    except Exception as e:
+        print(f"✗ Error loading depth map: {e}")
+        sys.exit(1)
+
+    # Ensure mask and depth map are the same size
+    print("\n6. Applying mask to depth map...")
+    wood_panel_depth, panel_mask = apply_mask_to_depth(mask_binary, depth_map)
+    record_array('depth_map', depth_map)
+    record_array('wood_panel_depth', wood_panel_depth)
+    if panel_mask.shape != mask_binary.shape:
+        print(f"✓ Resized mask from {mask_binary.shape} to {panel_mask.shape}")
+    else:
+        print("✓ Mask and depth map sizes match")
+
+    # Count segmented pixels
+    wood_pixels = panel_mask.area
+    total_pixels = panel_mask.shape[0] * panel_mask.shape[1]
+    percentage = (wood_pixels / total_pixels) * 100
+    print(f"✓ Wood panel coverage: {wood_pixels}/{total_pixels} pixels ({percentage:.1f}%)")
+
+    # Save the masked depth map
+    write_png(WOOD_PANEL_DEPTH_PATH, wood_panel_depth, CRITICAL, copy=False)  # read by the cloud stage
+    print(f"✓ Masked depth map queued: {WOOD_PANEL_DEPTH_PATH}")
+
+    end_time = time.time()
+    elapsed_time = end_time - start_time
+
+    print(f"\n Segmentation completed successfully!")
+    print(f"Generated files:")
+    print(f"  - {WOOD_PANEL_MASK_PATH}")
+    print(f"  - {WOOD_PANEL_DEPTH_PATH}")
+    print(f"Execution time: {elapsed_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
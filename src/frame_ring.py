@@ -0,0 +1,258 @@
+"""
+Shared-memory ring buffer for handing frames between stage processes
+One writer (e.g. the capture process that owns the USB device) publishes RGB, depth
+and mask frames into fixed-size slots of a named shared memory block. Any number of
+readers (segmentation, analysis) attach by name and get NumPy views of a slot without
+copying. Each slot carries a sequence number, a timestamp and a small JSON metadata
+field. Slots are reused after `slots` frames, so readers check Frame.valid() after
+using a view (a seqlock: the writer marks the slot before and after writing it).
+Usage: python src/frame_ring.py {info,remove}
+"""
+
+import argparse
+import contextlib
+import json
+import struct
+import sys
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from constants import FRAME_RING_CONFIG, CAMERA_RESOLUTION, SENSOR_RESOLUTION_SIZES, DEPTH_FUSION_CONFIG
+
+MAGIC = b"WQR1"
+HEADER_SIZE = 4096        # magic, layout length, published sequence, JSON layout
+SLOT_HEADER_SIZE = 512    # begin/end sequence, timestamp, field flags, metadata
+META_SIZE = SLOT_HEADER_SIZE - 32
+ALIGN = 64
+FIELDS = ('rgb', 'depth', 'mask')
+
+def default_shapes():
+    """Frame shapes and dtypes for the configured camera resolutions."""
+    rgb_width, rgb_height = SENSOR_RESOLUTION_SIZES[CAMERA_RESOLUTION['rgb']]
+    width, height = SENSOR_RESOLUTION_SIZES[CAMERA_RESOLUTION['mono']]
+    return {
+        'rgb': ([rgb_height, rgb_width, 3], 'uint8'),
+        # Fused depth is float (sub-millimeter); single frames are the sensor's uint16
+        'depth': ([height, width], 'float32' if DEPTH_FUSION_CONFIG['frames'] > 1 else 'uint16'),
+        'mask': ([height, width], 'uint8'),  # at depth resolution, ready to apply
+    }
+
+@contextlib.contextmanager
+def _untracked():
+    # Before Python 3.13 every process that opens a block registers it with the resource
+    # tracker, which unlinks it when that process exits while others still use the ring
+    from multiprocessing import resource_tracker
+    register, unregister = resource_tracker.register, resource_tracker.unregister
+    resource_tracker.register = lambda name, rtype: None if rtype == "shared_memory" else register(name, rtype)
+    resource_tracker.unregister = lambda name, rtype: None if rtype == "shared_memory" else unregister(name, rtype)
+    try:
+        yield
+    finally:
+        resource_tracker.register, resource_tracker.unregister = register, unregister
+
+def _open_shared_memory(name, create=False, size=0):
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)  # Python 3.13+
+    except TypeError:
+        with _untracked():
+            return shared_memory.SharedMemory(name=name, create=create, size=size)
+
+class Frame:
+    """One slot's contents; rgb/depth/mask are views into shared memory (None if not sent)."""
+
+    __slots__ = ('ring', 'seq', 'timestamp', 'meta', 'rgb', 'depth', 'mask')
+
+    def __init__(self, ring, seq, timestamp, meta, arrays):
+        self.ring = ring
+        self.seq = seq
+        self.timestamp = timestamp
+        self.meta = meta
+        self.rgb, self.depth, self.mask = (arrays.get(field) for field in FIELDS)
+
+    def valid(self):
+        """True while the slot still holds this frame (check after reading the views)."""
+        if self.ring is None:  # detached copy
+            return True
+        return self.ring._slot_seq(self.seq) == (self.seq, self.seq)
+
+    def copy(self):
+        """Detached copy, for frames kept longer than the ring holds them."""
+        arrays = {field: getattr(self, field).copy() for field in FIELDS if getattr(self, field) is not None}
+        frame = Frame(None, self.seq, self.timestamp, self.meta, arrays)
+        if not self.valid():
+            raise RuntimeError(f"frame {self.seq} was overwritten while copying")
+        return frame
+
+class FrameRing:
+    """Named shared-memory ring of fixed-size frame slots."""
+
+    def __init__(self, shm, layout):
+        self.shm = shm
+        self.layout = layout
+        self.slots = layout['slots']
+        self.buf = shm.buf
+        self._published = np.ndarray((), dtype=np.uint64, buffer=self.buf, offset=8)
+        self._slot_headers = []
+        self._arrays = []
+        for slot in range(self.slots):
+            base = HEADER_SIZE + slot * layout['slot_size']
+            self._slot_headers.append(np.ndarray(2, dtype=np.uint64, buffer=self.buf, offset=base))
+            self._arrays.append({
+                field: np.ndarray(shape, dtype=dtype, buffer=self.buf, offset=base + layout['offsets'][field])
+                for field, (shape, dtype) in layout['fields'].items()
+            })
+
+    @classmethod
+    def create(cls, name=FRAME_RING_CONFIG['name'], slots=FRAME_RING_CONFIG['slots'], shapes=None):
+        """Create the ring (it stays until remove() or a reboot, like a file in /dev/shm)."""
+        shapes = shapes or default_shapes()
+        offsets = {}
+        offset = SLOT_HEADER_SIZE
+        for field in FIELDS:
+            if field not in shapes:
+                continue
+            offsets[field] = offset
+            shape, dtype = shapes[field]
+            offset += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // ALIGN) * ALIGN
+        layout = {'slots': slots, 'slot_size': offset, 'offsets': offsets,
+                  'fields': {field: (list(shape), dtype) for field, (shape, dtype) in shapes.items()}}
+        encoded = json.dumps(layout).encode("utf-8")
+        if 16 + len(encoded) > HEADER_SIZE:
+            raise ValueError("ring layout does not fit in the header")
+
+        shm = _open_shared_memory(name, create=True, size=HEADER_SIZE + slots * offset)
+        shm.buf[:16] = MAGIC + struct.pack("<IQ", len(encoded), 0)
+        shm.buf[16:16 + len(encoded)] = encoded
+        return cls(shm, layout)
+
+    @classmethod
+    def attach(cls, name=FRAME_RING_CONFIG['name']):
+        """Attach to an existing ring by name."""
+        shm = _open_shared_memory(name)
+        if bytes(shm.buf[:4]) != MAGIC:
+            shm.close()
+            raise ValueError(f"{name} is not a frame ring")
+        length = struct.unpack("<I", shm.buf[4:8])[0]
+        return cls(shm, json.loads(bytes(shm.buf[16:16 + length])))
+
+    @classmethod
+    def open(cls, name=FRAME_RING_CONFIG['name'], slots=FRAME_RING_CONFIG['slots'], shapes=None):
+        """Attach to the ring, creating it first if it does not exist."""
+        try:
+            return cls.attach(name)
+        except FileNotFoundError:
+            return cls.create(name, slots, shapes)
+
+    def _slot_seq(self, seq):
+        header = self._slot_headers[(seq - 1) % self.slots]
+        return int(header[0]), int(header[1])
+
+    @property
+    def published(self):
+        """Sequence number of the newest complete frame (0 before the first)."""
+        return int(self._published)
+
+    def write(self, rgb=None, depth=None, mask=None, meta=None):
+        """Copy a frame into the next slot and publish it. Returns its sequence number.
+        Only one process may write to a ring."""
+        seq = self.published + 1
+        base = HEADER_SIZE + (seq - 1) % self.slots * self.layout['slot_size']
+        header = self._slot_headers[(seq - 1) % self.slots]
+        encoded = json.dumps(meta or {}).encode("utf-8")
+        if len(encoded) > META_SIZE:
+            raise ValueError(f"metadata is {len(encoded)} bytes, the limit is {META_SIZE}")
+
+        header[0] = seq  # readers of the old frame now see it as overwritten
+        flags = 0
+        for bit, (field, array) in enumerate(zip(FIELDS, (rgb, depth, mask))):
+            if array is None:
+                continue
+            target = self._arrays[(seq - 1) % self.slots].get(field)
+            if target is None or array.shape != target.shape:
+                raise ValueError(f"{field} shape {array.shape} does not fit the ring's "
+                                 f"{None if target is None else target.shape}")
+            np.copyto(target, array, casting='same_kind')
+            flags |= 1 << bit
+        self.buf[base + 16:base + 32] = struct.pack("<dII", time.time(), flags, len(encoded))
+        self.buf[base + 32:base + 32 + len(encoded)] = encoded
+        header[1] = seq
+        self._published[...] = seq
+        return seq
+
+    def read(self, seq):
+        """Frame seq as views into shared memory, or None if it is not (or no longer) in the ring."""
+        if seq < 1 or seq > self.published or self._slot_seq(seq) != (seq, seq):
+            return None
+        base = HEADER_SIZE + (seq - 1) % self.slots * self.layout['slot_size']
+        timestamp, flags, length = struct.unpack("<dII", self.buf[base + 16:base + 32])
+        meta = json.loads(bytes(self.buf[base + 32:base + 32 + length]))
+        arrays = {field: array for field, array in self._arrays[(seq - 1) % self.slots].items()
+                  if flags & (1 << FIELDS.index(field))}
+        frame = Frame(self, seq, timestamp, meta, arrays)
+        return frame if frame.valid() else None
+
+    def latest(self):
+        """Newest frame, or None before the first one."""
+        return self.read(self.published)
+
+    def wait(self, after_seq=0, timeout=None):
+        """Block until a frame newer than after_seq is published and return the oldest such
+        frame still in the ring (frames that were already overwritten are skipped).
+        Returns None on timeout."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            published = self.published
+            if published > after_seq:
+                for seq in range(max(after_seq + 1, published - self.slots + 1), published + 1):
+                    frame = self.read(seq)
+                    if frame is not None:
+                        return frame
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            time.sleep(FRAME_RING_CONFIG['poll_interval'])
+
+    def close(self):
+        """Detach this process (views obtained from the ring must not be used afterwards)."""
+        self._published = None
+        self._slot_headers = []
+        self._arrays = []
+        self.buf = None
+        self.shm.close()
+
+    def remove(self):
+        """Detach and delete the shared memory block."""
+        with _untracked():
+            self.shm.unlink()
+        self.close()
+
+def main(argv=None):
+    """Show or remove the configured ring."""
+    parser = argparse.ArgumentParser(description="Shared-memory frame ring")
+    parser.add_argument("action", choices=["info", "remove"])
+    parser.add_argument("--name", default=FRAME_RING_CONFIG['name'])
+    args = parser.parse_args(argv)
+
+    try:
+        ring = FrameRing.attach(args.name)
+    except FileNotFoundError:
+        print(f"✗ No frame ring named {args.name}")
+        sys.exit(1)
+
+    if args.action == "remove":
+        ring.remove()
+        print(f"✓ Removed frame ring {args.name}")
+        return
+    layout = ring.layout
+    print(f"Frame ring {args.name}: {layout['slots']} slots of {layout['slot_size'] / 1e6:.2f} MB, "
+          f"{ring.published} frames published")
+    for field, (shape, dtype) in layout['fields'].items():
+        print(f"  {field:5s} {tuple(shape)} {dtype}")
+    frame = ring.latest()
+    if frame is not None:
+        print(f"  latest: #{frame.seq} at {time.strftime('%H:%M:%S', time.localtime(frame.timestamp))}, "
+              f"meta {frame.meta}")
+    del frame  # its views would keep the shared memory mapped
+    ring.close()
+
+if __name__ == "__main__":
+    main()
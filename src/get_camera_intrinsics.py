@@ -1,111 +1,54 @@
 """
-Script to get actual camera intrinsics from OAK-D Lite
-Run this once to get your camera's exact calibration values
+Script to get actual camera calibration from OAK-D Lite
+Run this once (or after re-calibrating) to cache your camera's exact calibration values
+in calibration/<MxId>.json; the cache is only rewritten when the device calibration changes
 """
 
 import depthai as dai
-import json
+from calibration import refresh_calibration, cache_path
+from constants import CAMERA_RESOLUTION, DEPTH_CAMERA
+
+def get_camera_calibration():
+    """Read calibration from connected OAK-D Lite and refresh its cache file"""
 
-def get_camera_intrinsics():
-    """Get camera intrinsics from connected OAK-D Lite"""
-    
     pipeline = dai.Pipeline()
-    
+
     try:
         with dai.Device(pipeline) as device:
             print("✓ Connected to OAK-D Lite")
-            
-            # Get calibration data
-            calib_data = device.readCalibration()
-            
-            # Get intrinsics for left mono camera (used for depth)
-            # Using 400P resolution as default
-            intrinsics = calib_data.getCameraIntrinsics(
-                dai.CameraBoardSocket.LEFT, 
-                dai.MonoCameraProperties.SensorResolution.THE_400_P
-            )
-            
-            # Also get the camera resolution to verify
-            resolution = calib_data.getCameraResolution(
-                dai.CameraBoardSocket.LEFT, 
-                dai.MonoCameraProperties.SensorResolution.THE_400_P
-            )
-            print(f"Camera resolution: {resolution}")
-            
-            # Extract the values
-            fx = intrinsics[0][0]
-            fy = intrinsics[1][1]
-            cx = intrinsics[0][2]
-            cy = intrinsics[1][2]
-            
-            print(f"\nYour OAK-D Lite intrinsics (400P resolution):")
-            print(f"fx: {fx:.1f}")
-            print(f"fy: {fy:.1f}")
-            print(f"cx: {cx:.1f}")
-            print(f"cy: {cy:.1f}")
-            
-            return {
-                'fx': fx,
-                'fy': fy,
-                'cx': cx,
-                'cy': cy
-            }
-            
+
+            calibration, updated = refresh_calibration(dai, device)
+            if updated:
+                print(f"✓ Calibration cache written: {cache_path(calibration['mxid'])}")
+            else:
+                print(f"✓ Calibration unchanged, cache is up to date: {cache_path(calibration['mxid'])}")
+            return calibration
+
     except Exception as e:
-        print(f"✗ Error getting camera intrinsics: {e}")
+        print(f"✗ Error getting camera calibration: {e}")
         print("Make sure your OAK-D Lite is connected and recognized")
         return None
 
-def update_constants_file(intrinsics):
-    """Update the constants.py file with actual intrinsics"""
-    
-    if intrinsics is None:
-        print("No intrinsics to update")
-        return
-    
-    try:
-        # Read the current constants file
-        with open('src/constants.py', 'r') as f:
-            content = f.read()
-        
-        # Update the intrinsics dictionary
-        old_intrinsics = "OAK_D_LITE_INTRINSICS = {\n    'fx': 461.9,  # Horizontal focal length in pixels\n    'fy': 461.9,  # Vertical focal length in pixels\n    'cx': 320.0,  # Principal point X coordinate in pixels\n    'cy': 200.0,  # Principal point Y coordinate in pixels\n}"
-        
-        new_intrinsics = f"""OAK_D_LITE_INTRINSICS = {{
-    'fx': {intrinsics['fx']:.1f},  # Horizontal focal length in pixels
-    'fy': {intrinsics['fy']:.1f},  # Vertical focal length in pixels
-    'cx': {intrinsics['cx']:.1f},  # Principal point X coordinate in pixels
-    'cy': {intrinsics['cy']:.1f},  # Principal point Y coordinate in pixels
-}}"""
-        
-        # Replace in content
-        updated_content = content.replace(old_intrinsics, new_intrinsics)
-        
-        # Write back to file
-        with open('src/constants.py', 'w') as f:
-            f.write(updated_content)
-        
-        print("✓ Updated src/constants.py with your camera's intrinsics")
-        
-    except Exception as e:
-        print(f"✗ Error updating constants file: {e}")
-
 def main():
-    """Main function to get and update camera intrinsics"""
+    """Main function to get and cache camera calibration"""
     print("=" * 50)
     print("OAK-D Lite Camera Intrinsics Calibration")
     print("=" * 50)
-    
-    # Get intrinsics from camera
-    intrinsics = get_camera_intrinsics()
-    
-    if intrinsics:
-        # Update constants file
-        update_constants_file(intrinsics)
-        
+
+    # Get calibration from camera
+    calibration = get_camera_calibration()
+
+    if calibration:
+        resolution = CAMERA_RESOLUTION['mono']
+        intrinsics = calibration['cameras'][DEPTH_CAMERA]['intrinsics'][resolution]
+        print(f"\nYour OAK-D Lite intrinsics ({DEPTH_CAMERA} camera, {resolution}):")
+        print(f"fx: {intrinsics['fx']:.1f}")
+        print(f"fy: {intrinsics['fy']:.1f}")
+        print(f"cx: {intrinsics['cx']:.1f}")
+        print(f"cy: {intrinsics['cy']:.1f}")
+
         print("\n✓ Calibration complete!")
-        print("Your camera intrinsics have been saved to src/constants.py")
-        print("You can now run depth_to_cloud.py with accurate intrinsics")
+        print("depth_to_cloud.py will now use these intrinsics without connecting to the camera")
     else:
         print("\n✗ Calibration failed")
         print("Please check your camera connection and try again")
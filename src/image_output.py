@@ -4,11 +4,25 @@ import time
 import cv2
 import numpy as np
 import depthai as dai
+from calibration import refresh_calibration
+from depth_fusion import DepthFusion
 from constants import (
-    RGB_IMAGE_PATH, DEPTH_MAP_PATH, CAMERA_RESOLUTION,
-    STEREO_DEPTH_CONFIG
+    RGB_IMAGE_PATH, DEPTH_MAP_PATH, DEPTH_CONFIDENCE_PATH, CAMERA_RESOLUTION,
+    STEREO_DEPTH_CONFIG, DEPTH_FUSION_CONFIG, FRAME_RING_CONFIG, STEREO_RECORDING_CONFIG
 )
 
+def save_depth_confidence(fusion):
+    """Save the per-pixel confidence of the fused depth (used to weight the plane fit) with a
+    digest of the depth map it belongs to. Without fusion any earlier capture's file is removed."""
+    from stage_cache import file_digest
+    if fusion is None:
+        if os.path.exists(DEPTH_CONFIDENCE_PATH):
+            os.remove(DEPTH_CONFIDENCE_PATH)
+            print(f"✓ Removed depth confidence of an earlier capture: {DEPTH_CONFIDENCE_PATH}")
+        return
+    np.savez(DEPTH_CONFIDENCE_PATH, confidence=fusion.confidence(), depth_digest=file_digest(DEPTH_MAP_PATH))
+    print(f"✓ Depth confidence saved: {DEPTH_CONFIDENCE_PATH}")
+
 def detect_camera(dai):
     """Detect if OAK-D Lite camera is connected."""
     try:
@@ -67,6 +81,13 @@ def create_camera_pipeline(dai):
         left_cam.out.link(stereo.left)
         right_cam.out.link(stereo.right)
         stereo.depth.link(depth_out.input)
+
+        # Rectified mono frames for offline stereo tuning (stereo_replay.py)
+        if STEREO_RECORDING_CONFIG['enabled']:
+            for name, output in (('rectified_left', stereo.rectifiedLeft), ('rectified_right', stereo.rectifiedRight)):
+                rectified_out = pipeline.create(dai.node.XLinkOut)
+                rectified_out.setStreamName(name)
+                output.link(rectified_out.input)
         
         print("✓ Camera pipeline created successfully")
         return pipeline
@@ -75,8 +96,11 @@ def create_camera_pipeline(dai):
         print(f"✗ Failed to create pipeline: {e}")
         return None
     
-def capture_images(device, pipeline):
-    """Capture RGB and depth images from the camera."""
+def capture_images(device, pipeline, fusion=None, recording=None):
+    """Capture RGB and depth images from the camera.
+    With a DepthFusion, depth frames are accumulated until its ring is full and the fused depth is returned.
+    With a recording dict (pipeline built with STEREO_RECORDING_CONFIG enabled), the latest
+    rectified mono frames are stored in it as 'left' and 'right'."""
     try:
         print("Starting camera pipeline...")
         device.startPipeline(pipeline)
@@ -84,6 +108,10 @@ def capture_images(device, pipeline):
         # Get output queues
         rgb_queue = device.getOutputQueue(name="rgb", maxSize=4, blocking=False)
         depth_queue = device.getOutputQueue(name="depth", maxSize=4, blocking=False)
+        rectified_queues = {}
+        if recording is not None:
+            rectified_queues = {side: device.getOutputQueue(name=f"rectified_{side}", maxSize=4, blocking=False)
+                                for side in ('left', 'right')}
         
         print("Waiting for camera to stabilize.")
         time.sleep(2)  # Give camera time to adjust
@@ -105,12 +133,25 @@ def capture_images(device, pipeline):
                 print("✓ RGB frame captured")
             
             if depth_packet is not None:
-                depth_frame = depth_packet.getFrame()
-                print("✓ Depth frame captured")
+                if fusion is None:
+                    depth_frame = depth_packet.getFrame()
+                    print("✓ Depth frame captured")
+                else:
+                    fusion.add(depth_packet.getFrame())
+                    if fusion.full:
+                        depth_frame = fusion.fused()
+                        print(f"✓ Fused {fusion.frames} depth frames")
             
-            if rgb_frame is not None and depth_frame is not None:
+            for side, queue in rectified_queues.items():
+                packet = queue.tryGet()
+                if packet is not None:
+                    recording[side] = packet.getFrame()
+
+            if rgb_frame is not None and depth_frame is not None and all(side in recording for side in rectified_queues):
                 break
             
+            if fusion is not None and depth_packet is not None:
+                continue  # keep draining depth frames while fusing
             time.sleep(0.1)
         
         if rgb_frame is None or depth_frame is None:
@@ -151,6 +192,17 @@ def save_images(rgb_frame, depth_frame):
         print(f"✗ Error saving images: {e}")
         return False
 
+def publish_frames(rgb_frame, depth_frame, mxid=None):
+    """Publish a capture to the shared-memory frame ring (frame_ring.py) for stage
+    processes that read from it. Returns the frame's sequence number."""
+    from frame_ring import FrameRing
+
+    ring = FrameRing.open()
+    try:
+        return ring.write(rgb=rgb_frame, depth=depth_frame, meta={'mxid': mxid})
+    finally:
+        ring.close()
+
 def main():
     """Main function to capture and save images from OAK-D Lite."""
     print("=" * 50)
@@ -174,24 +226,50 @@ def main():
     try:
         with dai.Device(device_info) as device:
             print("✓ Connected to camera successfully")
+
+            # Keep the calibration cache current (only rewritten if the calibration changed)
+            try:
+                _, updated = refresh_calibration(dai, device)
+                print("✓ Calibration cache updated" if updated else "✓ Calibration cache up to date")
+            except Exception as e:
+                print(f"⚠️ Could not refresh calibration cache: {e}")
           
             # Capture images
             print("\n4. Capturing images...")
-            rgb_frame, depth_frame = capture_images(device, pipeline)
+            fusion = DepthFusion() if DEPTH_FUSION_CONFIG['frames'] > 1 else None
+            recording = {} if STEREO_RECORDING_CONFIG['enabled'] else None
+            rgb_frame, depth_frame = capture_images(device, pipeline, fusion, recording)
             
             if rgb_frame is not None and depth_frame is not None:
                 print(f"✓ Captured RGB frame: {rgb_frame.shape}")
                 print(f"✓ Captured depth frame: {depth_frame.shape}")
-                
+
                 # Save images
                 print("\n5. Saving images...")
-                if save_images(rgb_frame, depth_frame):
+                saved = save_images(rgb_frame, depth_frame)
+                save_depth_confidence(fusion if saved else None)
+                if saved:
                     print("\n🎉 Image capture completed successfully!")
                     print("Generated files:")
                     print(f"  - {RGB_IMAGE_PATH}")
                     print(f"  - {DEPTH_MAP_PATH}")
                 else:
                     print("\n⚠️ Image capture completed with errors saving images.")
+
+                if recording and 'left' in recording and 'right' in recording:
+                    from stereo_replay import recording_geometry, save_recording
+                    intrinsics, baseline = recording_geometry(device.getMxId())
+                    path = save_recording(recording['left'], recording['right'],
+                                          np.rint(depth_frame).astype(np.uint16), intrinsics, baseline,
+                                          meta={'mxid': device.getMxId()})
+                    print(f"✓ Rectified stereo pair recorded: {path}")
+
+                if FRAME_RING_CONFIG['enabled']:
+                    try:
+                        seq = publish_frames(rgb_frame, depth_frame, device.getMxId())
+                        print(f"✓ Published frame #{seq} to shared memory ring {FRAME_RING_CONFIG['name']}")
+                    except Exception as e:
+                        print(f"⚠️ Could not publish to the frame ring: {e}")
             else:
                 print("✗ Failed to capture images from camera.")
               
@@ -0,0 +1,298 @@
+"""
+Local inspection service that keeps CLIPSeg loaded between requests
+POST /inspect with an .npz body holding 'rgb' (HxWx3 uint8 RGB) and 'depth' (HxW) and,
+optionally, 'intrinsics' ([fx, fy, cx, cy] of the depth camera). Add ?mask=1 to get the
+segmentation mask back as a base64 PNG, and ?stream=<camera id> to have consecutive frames
+of that camera segmented around the previous frame's panel (ROI tracking; frames without a
+stream are always segmented over the full frame). The reply is JSON with the verdict and metrics.
+Concurrent requests are grouped into micro-batches: a batch is run as soon as it holds
+max_batch frames or its oldest request has waited max_latency_ms. GET /health reports status
+
+Usage: python src/inspection_service.py [--port 8765] [--max-batch 4] [--max-latency-ms 30]
+Runs offline: the model is loaded from the local Hugging Face cache only
+"""
+
+import argparse
+import base64
+import io
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from resources import apply_budget
+from constants import (
+    INSPECTION_SERVICE_CONFIG, ROI_TRACKER_CONFIG, DEPTH_CAMERA, DEPTH_SCALE, DEPTH_FILTER_CONFIG,
+    DEVIATION_THRESHOLD, TEXT_OR_IMAGE, TEXT_PROMPT, WOOD_REFERENCE_PATH
+)
+
+class MicroBatcher:
+    """Groups submitted items into batches for one worker thread."""
+
+    def __init__(self, process_batch, max_batch, max_latency):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_latency = max_latency  # seconds
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self.worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, item):
+        """Queue an item; the returned Future resolves to its result."""
+        future = Future()
+        self.queue.put((time.perf_counter(), item, future))
+        return future
+
+    def close(self):
+        self.queue.put(None)
+        self.worker.join()
+
+    def _collect(self, first):
+        """Add items to the batch until it is full or the oldest item's deadline passes.
+        Items already waiting are always taken, so a backlog drains in full batches."""
+        batch = [first]
+        deadline = first[0] + self.max_latency
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                entry = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                self.queue.put(None)  # stop after this batch
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            try:
+                results = self.process_batch([item for _, item, _ in batch])
+            except Exception as e:  # the whole batch failed (e.g. the model)
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            # process_batch returns an exception in place of the result of a frame that failed on its own
+            for (_, _, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+class FrameAnalyzer:
+    """Geometry path for a stream of frames: mask, filter and fit with reused buffers."""
+
+    def __init__(self):
+        from calibration import get_intrinsics
+        from ray_table import get_ray_table
+        from workspace import FrameWorkspace
+
+        self.default_intrinsics = get_intrinsics(DEPTH_CAMERA)
+        self.default_rays = get_ray_table(DEPTH_CAMERA)
+        self.workspace = FrameWorkspace()  # only one thread may analyze at a time
+
+    def analyze(self, request, mask):
+        """Mask, filter and fit one frame (mask: CompactMask at RGB or depth resolution); returns the
+        JSON-ready result. Filtering and back-projection only cover the depth around the mask."""
+        import cv2
+        from depth_filter import filter_depth
+        from extract_wood import apply_mask_to_depth
+
+        start = time.perf_counter()
+        depth_map, depth_mask = apply_mask_to_depth(mask, request['depth'])
+        window = depth_mask.window(ROI_TRACKER_CONFIG['depth_margin'])
+        if DEPTH_FILTER_CONFIG['enabled'] and window is not None:
+            top, left, bottom, right = window
+            depth_map[top:bottom, left:right], _ = filter_depth(depth_map[top:bottom, left:right],
+                                                                mask=depth_mask.to_array()[top:bottom, left:right])
+
+        intrinsics = request.get('intrinsics') or self.default_intrinsics
+        # Frames with their own intrinsics, or another resolution, use the pinhole model
+        rays = self.default_rays
+        if request.get('intrinsics') or (rays is not None and rays.shape[1:] != depth_map.shape[:2]):
+            rays = None
+        result = {'n_points': int(np.count_nonzero(depth_map))}
+        fit = None
+        if result['n_points'] < 3:
+            result['verdict'] = 'NO_PANEL'
+        else:
+            try:
+                fit = self.workspace.analyze(depth_map, intrinsics, DEPTH_SCALE, rays=rays, window=window)
+            except ValueError as e:  # degenerate point set, e.g. collinear valid pixels
+                result.update({'verdict': 'NO_PANEL', 'error': str(e)})
+        if fit is not None:
+            _, coeffs, _, std_dev = fit
+            result.update({
+                'verdict': 'WARPED' if std_dev > DEVIATION_THRESHOLD else 'FLAT',
+                'std_dev': std_dev,
+                'plane': [float(value) for value in coeffs],
+            })
+        if request.get('return_mask'):
+            result['mask_png'] = base64.b64encode(cv2.imencode(".png", mask.to_array())[1].tobytes()).decode("ascii")
+        result['analyze_ms'] = (time.perf_counter() - start) * 1000
+        return result
+
+class InspectionEngine(FrameAnalyzer):
+    """Warm CLIPSeg model plus the geometry path, run on batches of frames."""
+
+    def __init__(self, local_files_only=True):
+        from PIL import Image
+        from extract_wood import load_segmentation_model
+
+        self.processor, self.model = load_segmentation_model(local_files_only=local_files_only)
+        self.model.eval()
+        self.text_prompt = TEXT_PROMPT if TEXT_OR_IMAGE else None
+        self.reference_image = None if TEXT_OR_IMAGE else Image.open(WOOD_REFERENCE_PATH).convert("RGB")
+        super().__init__()  # the batcher's worker thread is the only one that analyzes frames
+        # One tracker per camera stream: frames of several clients are interleaved in a batch,
+        # and a panel box only carries over to the next frame of the same camera
+        self.trackers = {} if ROI_TRACKER_CONFIG['enabled'] else None
+
+    def predict(self, images):
+        from extract_wood import predict_masks
+
+        return predict_masks(self.processor, self.model, images, self.text_prompt, self.reference_image)
+
+    def process_batch(self, requests):
+        from roi_tracker import RoiTracker, segment_frames
+
+        start = time.perf_counter()
+        trackers = [None] * len(requests)
+        if self.trackers is not None:
+            for index, request in enumerate(requests):
+                if request.get('stream') is not None:
+                    trackers[index] = self.trackers.setdefault(request['stream'], RoiTracker())
+        masks = segment_frames([request['rgb'] for request in requests], trackers, self.predict)
+        segment_ms = (time.perf_counter() - start) * 1000
+
+        # A frame that cannot be analyzed fails only its own request, not the batch
+        results = []
+        for request, mask in zip(requests, masks):
+            try:
+                result = self.analyze(request, mask)
+            except Exception as e:
+                results.append(e)
+                continue
+            result.update({'batch_size': len(requests), 'segment_ms': segment_ms})
+            results.append(result)
+        return results
+
+def decode_request(body, return_mask=False, stream=None):
+    """Parse an .npz request body into the dict process_batch expects."""
+    with np.load(io.BytesIO(body), allow_pickle=False) as payload:
+        if 'rgb' not in payload or 'depth' not in payload:
+            raise ValueError("payload needs 'rgb' and 'depth' arrays")
+        request = {'rgb': payload['rgb'], 'depth': payload['depth'], 'return_mask': return_mask, 'stream': stream}
+        if 'intrinsics' in payload:
+            request['intrinsics'] = dict(zip(('fx', 'fy', 'cx', 'cy'), (float(v) for v in payload['intrinsics'])))
+    if request['rgb'].ndim != 3 or request['rgb'].shape[2] != 3 or request['rgb'].dtype != np.uint8:
+        raise ValueError("rgb must be an HxWx3 uint8 array")
+    if request['depth'].ndim != 2:
+        raise ValueError("depth must be an HxW array")
+    return request
+
+def encode_request(rgb, depth, intrinsics=None):
+    """Build an .npz request body (used by clients such as bench_service.py)."""
+    buffer = io.BytesIO()
+    arrays = {'rgb': rgb, 'depth': depth}
+    if intrinsics is not None:
+        arrays['intrinsics'] = np.array([intrinsics[key] for key in ('fx', 'fy', 'cx', 'cy')])
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+class InspectionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default backlog of 5 drops connections under bursts of clients
+
+def make_handler(batcher, timeout, trackers=None):
+    class InspectionHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urlparse(self.path).path != "/health":
+                return self._reply(404, {'error': 'not found'})
+            status = {'status': 'ok', 'batches': batcher.batches, 'frames': batcher.items,
+                      'queued': batcher.queue.qsize()}
+            if trackers:
+                status['roi'] = {stream: tracker.summary() for stream, tracker in list(trackers.items())}
+            self._reply(200, status)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/inspect":
+                return self._reply(404, {'error': 'not found'})
+            start = time.perf_counter()
+            try:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                query = parse_qs(url.query)
+                return_mask = query.get('mask', ['0'])[0] not in ('0', 'false')
+                request = decode_request(body, return_mask, query.get('stream', [None])[0])
+            except Exception as e:
+                return self._reply(400, {'error': str(e)})
+            try:
+                result = batcher.submit(request).result(timeout=timeout)
+            except Exception as e:
+                return self._reply(500, {'error': str(e)})
+            result['latency_ms'] = (time.perf_counter() - start) * 1000
+            self._reply(200, result)
+
+        def log_message(self, format, *args):
+            pass  # one line per frame would flood the console on a busy line
+
+    return InspectionHandler
+
+def main(argv=None):
+    """Load CLIPSeg once and serve inspection requests until interrupted."""
+    config = INSPECTION_SERVICE_CONFIG
+    parser = argparse.ArgumentParser(description="Local wood panel inspection service")
+    parser.add_argument("--host", default=config['host'])
+    parser.add_argument("--port", type=int, default=config['port'])
+    parser.add_argument("--max-batch", type=int, default=config['max_batch'])
+    parser.add_argument("--max-latency-ms", type=float, default=config['max_latency_ms'])
+    parser.add_argument("--allow-download", action="store_true",
+                        help="Allow fetching the model from the Hugging Face Hub if it is not cached")
+    args = parser.parse_args(argv)
+
+    # Before loading: the batcher thread and torch's pool inherit the budget and affinity
+    apply_budget('inspection_service')
+
+    print("Loading CLIPSeg model...")
+    start_time = time.time()
+    try:
+        engine = InspectionEngine(local_files_only=not args.allow_download)
+    except Exception as e:
+        print(f"✗ Error loading CLIPSeg model: {e}")
+        raise SystemExit(1)
+    print(f"✓ Model ready in {time.time() - start_time:.1f} s")
+
+    batcher = MicroBatcher(engine.process_batch, args.max_batch, args.max_latency_ms / 1000.0)
+    server = InspectionServer((args.host, args.port), make_handler(batcher, config['request_timeout'], engine.trackers))
+    print(f"✓ Serving on http://{args.host}:{args.port} (batches of up to {args.max_batch}, "
+          f"{args.max_latency_ms:.0f} ms max wait)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down")
+    finally:
+        server.server_close()
+        batcher.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Local defect detection (knots bulging, cracks, chipped edges) on top of global warp
+Each point's residual from the fitted plane is compared with the mean residual of its
+neighborhood; points that stand out are grouped into defect regions
+"""
+
+import sys
+import time
+import numpy as np
+from constants import (
+    WOOD_PANEL_DEPTH_PATH, DEPTH_FILTER_CONFIG, LOCAL_DEFECT_RADIUS, LOCAL_DEFECT_THRESHOLD, LOCAL_DEFECT_MIN_POINTS
+)
+from spatial_index import build_index
+
+def detect_local_defects(cloud, residuals, radius=LOCAL_DEFECT_RADIUS,
+                         threshold=LOCAL_DEFECT_THRESHOLD, min_points=LOCAL_DEFECT_MIN_POINTS, index=None):
+    """Flag regions whose residual deviates from their neighborhood.
+    Returns (local_deviation per point, list of defect dicts sorted by peak deviation)."""
+    if index is None:
+        index = build_index(cloud)
+
+    local_deviation = residuals - index.neighborhood_mean(residuals, radius)
+    flagged = np.abs(local_deviation) > threshold
+    labels = index.connected_regions(flagged, radius)
+
+    defects = []
+    if labels.max(initial=-1) < 0:
+        return local_deviation, defects
+
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+    starts = np.searchsorted(sorted_labels, np.arange(sorted_labels.max() + 1))
+    ends = np.append(starts[1:], len(sorted_labels))
+    for start, end in zip(starts, ends):
+        members = order[start:end]
+        if members.size < min_points:
+            continue
+        deviation = local_deviation[members]
+        peak = deviation[np.argmax(np.abs(deviation))]
+        defect = {
+            # Residuals are along +z (away from the camera): negative means raised towards it
+            'kind': 'bulge' if peak < 0 else 'depression',
+            'n_points': int(members.size),
+            'peak': float(peak),
+            'centroid': cloud.xyz[:, members].mean(axis=1, dtype=np.float64),
+        }
+        if cloud.pixel_index is not None:
+            v, u = np.divmod(cloud.pixel_index[members], cloud.grid_shape[1])
+            defect['bbox'] = (int(u.min()), int(v.min()), int(u.max() - u.min() + 1), int(v.max() - v.min() + 1))
+        defects.append(defect)
+
+    defects.sort(key=lambda d: abs(d['peak']), reverse=True)
+    return local_deviation, defects
+
+def main():
+    """Detect local defects on the masked panel depth map."""
+    from depth_filter import filter_depth
+    from depth_to_cloud import load_depth_map, depth_to_cloud
+    from deviation import fit_plane, compute_deviations
+
+    start_time = time.time()
+
+    depth_map = load_depth_map(WOOD_PANEL_DEPTH_PATH)
+    if DEPTH_FILTER_CONFIG['enabled']:
+        depth_map, _ = filter_depth(depth_map)
+    cloud = depth_to_cloud(depth_map)
+    if len(cloud) == 0:
+        print("No points in masked depth map.")
+        sys.exit(1)
+
+    residuals = compute_deviations(cloud.points, fit_plane(cloud.points))
+    _, defects = detect_local_defects(cloud, residuals)
+
+    print(f"Neighborhood radius: {LOCAL_DEFECT_RADIUS * 1000:.1f} mm, threshold: {LOCAL_DEFECT_THRESHOLD * 1000:.2f} mm")
+    if not defects:
+        print("No local defects found")
+    for i, defect in enumerate(defects, 1):
+        bbox = f" bbox(px)={defect['bbox']}" if 'bbox' in defect else ""
+        print(f"  Defect {i}: {defect['kind']}, {defect['n_points']} points, "
+              f"peak {defect['peak'] * 1000:+.2f} mm{bbox}")
+
+    elapsed_time = time.time() - start_time
+    print(f"Execution time: {elapsed_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Multi-camera capture and inspection for panels wider than one camera's view
+Every connected (or configured) OAK-D is opened and captured in its own thread using
+its own cached calibration. Each cloud is moved into the common panel frame with
+MULTI_CAMERA_EXTRINSICS and the merged cloud goes through the flatness analysis
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from artifact_writer import write_file, write_text, HEAVY
+from calibration import get_intrinsics, refresh_calibration
+from constants import (
+    DEPTH_CAMERA, DEPTH_SCALE, DEPTH_FILTER_CONFIG, MULTI_CAMERA_MXIDS, MULTI_CAMERA_EXTRINSICS,
+    DEVIATION_THRESHOLD, POINT_CLOUD_PATH, DEVIATIONS_PATH, TEXT_PROMPT
+)
+from depth_filter import filter_depth
+from depth_to_cloud import depth_to_cloud, save_ply
+from point_cloud import PointCloud
+from ray_table import get_ray_table
+from deviation import fit_plane, compute_deviations
+
+def detect_cameras(dai, mxids=MULTI_CAMERA_MXIDS):
+    """Return device infos for every connected device (or only the configured MxIds)."""
+    devices = dai.Device.getAllConnectedDevices()
+    if mxids is not None:
+        devices = [device for device in devices if device.getMxId() in mxids]
+    return devices
+
+def capture_from_device(dai, device_info):
+    """Open one device, refresh its calibration cache and capture an RGB/depth pair."""
+    from image_output import create_camera_pipeline, capture_images
+
+    mxid = device_info.getMxId()
+    pipeline = create_camera_pipeline(dai)
+    with dai.Device(device_info) as device:
+        refresh_calibration(dai, device)
+        rgb_frame, depth_frame = capture_images(device, pipeline)
+    if rgb_frame is None or depth_frame is None:
+        raise RuntimeError(f"no frames captured from {mxid}")
+
+    return {
+        'mxid': mxid,
+        'rgb': rgb_frame,
+        'depth': depth_frame,
+        'intrinsics': get_intrinsics(DEPTH_CAMERA, mxid=mxid),
+        'rays': get_ray_table(DEPTH_CAMERA, mxid=mxid),
+    }
+
+def capture_all(capture_fn, device_infos):
+    """Run capture_fn for every device in its own thread. Returns the successful captures."""
+    if not device_infos:
+        return []
+
+    captures = []
+    with ThreadPoolExecutor(max_workers=len(device_infos)) as executor:
+        futures = [executor.submit(capture_fn, info) for info in device_infos]
+        for info, future in zip(device_infos, futures):
+            try:
+                captures.append(future.result())
+            except Exception as e:
+                print(f"✗ Capture failed on {info.getMxId()}: {e}")
+    return captures
+
+def device_transform(mxid, n_devices, extrinsics=MULTI_CAMERA_EXTRINSICS):
+    """Return the 4x4 transform from a device's camera frame into the common frame."""
+    if mxid in extrinsics:
+        return np.asarray(extrinsics[mxid], dtype=np.float64)
+    if n_devices == 1:
+        return np.eye(4)
+    raise ValueError(f"No extrinsics configured for device {mxid} in MULTI_CAMERA_EXTRINSICS")
+
+def capture_to_cloud(capture, transform, depth_scale=DEPTH_SCALE):
+    """Back-project one capture with its own intrinsics and move it into the common frame."""
+    depth = capture.get('panel_depth', capture['depth'])
+    if DEPTH_FILTER_CONFIG['enabled']:
+        depth, capture['filter_stats'] = filter_depth(depth, mask=capture.get('panel_mask'))
+    return depth_to_cloud(depth, capture['intrinsics'], depth_scale, capture.get('rays')).transformed(transform)
+
+def merge_clouds(captures, extrinsics=MULTI_CAMERA_EXTRINSICS, depth_scale=DEPTH_SCALE):
+    """Back-project every capture in parallel and concatenate them in the common frame."""
+    transforms = [device_transform(c['mxid'], len(captures), extrinsics) for c in captures]
+    with ThreadPoolExecutor(max_workers=max(1, len(captures))) as executor:
+        clouds = list(executor.map(
+            lambda args: capture_to_cloud(*args, depth_scale=depth_scale),
+            zip(captures, transforms)
+        ))
+    for capture, cloud in zip(captures, clouds):
+        capture['n_points'] = len(cloud)
+    return PointCloud.concatenate(clouds)
+
+def segment_captures(captures, text_prompt=TEXT_PROMPT):
+    """Segment the panel in every capture with one shared CLIPSeg model and mask its depth."""
+    from PIL import Image
+    from extract_wood import load_segmentation_model, predict_mask, threshold_mask, apply_mask_to_depth
+
+    processor, model = load_segmentation_model()
+    for capture in captures:
+        rgb_image = Image.fromarray(capture['rgb'][:, :, ::-1])  # BGR -> RGB
+        mask_binary = threshold_mask(predict_mask(processor, model, rgb_image, text_prompt))
+        capture['panel_depth'], panel_mask = apply_mask_to_depth(mask_binary, capture['depth'])
+        capture['panel_mask'] = panel_mask.to_array()  # at depth resolution, for the filter's edge erosion
+
+def analyze_cloud(cloud, deviation_threshold=DEVIATION_THRESHOLD):
+    """Fit a plane to a (merged) cloud. Returns (plane_coeffs, deviations, std_dev, warped)."""
+    points = cloud.points
+    plane_coeffs = fit_plane(points)
+    deviations = compute_deviations(points, plane_coeffs)
+    std_dev = np.std(deviations)
+    return plane_coeffs, deviations, std_dev, std_dev > deviation_threshold
+
+def main(argv=None):
+    """Capture from every camera, merge the clouds and report flatness of the whole panel."""
+    parser = argparse.ArgumentParser(description="Multi-camera wood panel inspection")
+    parser.add_argument("--no-segment", action="store_true", help="Use the full depth frames without CLIPSeg masking")
+    args = parser.parse_args(argv)
+
+    import depthai as dai
+
+    start_time = time.time()
+    print("=" * 50)
+    print("Multi-camera Wood Panel Inspection")
+    print("=" * 50)
+
+    print("\n1. Detecting cameras...")
+    devices = detect_cameras(dai)
+    if not devices:
+        print("✗ No OAK-D devices found")
+        sys.exit(1)
+    print(f"✓ Using {len(devices)} OAK-D device(s): {', '.join(d.getMxId() for d in devices)}")
+
+    print("\n2. Capturing from all cameras in parallel...")
+    captures = capture_all(lambda info: capture_from_device(dai, info), devices)
+    if len(captures) != len(devices):
+        print(f"✗ Only {len(captures)}/{len(devices)} cameras captured")
+        sys.exit(1)
+
+    if not args.no_segment:
+        print("\n3. Segmenting wood panel in each view...")
+        segment_captures(captures)
+
+    print("\n4. Merging point clouds into the common frame...")
+    try:
+        cloud = merge_clouds(captures)
+    except ValueError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    for capture in captures:
+        removed = capture.get('filter_stats', {}).get('removed', 0)
+        print(f"  {capture['mxid']}: {capture['n_points']} points ({removed} removed by depth filter)")
+    if len(cloud) == 0:
+        print("No points in merged point cloud.")
+        sys.exit(1)
+    write_file(POINT_CLOUD_PATH, lambda target: save_ply(target, cloud.points))
+    print(f"✓ Queued {len(cloud)} merged points for {POINT_CLOUD_PATH}")
+
+    print("\n5. Analyzing flatness...")
+    plane_coeffs, deviations, std_dev, warped = analyze_cloud(cloud)
+    print(f"Fitted plane: z = {plane_coeffs[0]:.6f}*x + {plane_coeffs[1]:.6f}*y + {plane_coeffs[2]:.6f}")
+    print(f"Standard deviation of vertical deviations: {std_dev:.6f} meters")
+    write_text(DEVIATIONS_PATH, deviations, HEAVY, copy=False)
+    if warped:
+        print(f"Wood panel is WARPED (std dev > {DEVIATION_THRESHOLD})")
+    else:
+        print(f"Wood panel is FLAT (std dev <= {DEVIATION_THRESHOLD})")
+
+    print(f"Execution time: {time.time() - start_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
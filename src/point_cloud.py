@@ -0,0 +1,197 @@
+"""
+Compact point cloud container for the geometry stages
+Points are stored as a (3, N) float32 structure-of-arrays block (x, y and z rows are
+each contiguous), optionally with the flat pixel index each point came from.
+Derived quantities are computed on first use and cached until the points change
+"""
+
+import numpy as np
+
+class PointCloud:
+    """Structure-of-arrays float32 point cloud with lazily cached derived data."""
+
+    __slots__ = ('xyz', 'pixel_index', 'grid_shape', '_cache')
+
+    def __init__(self, xyz, pixel_index=None, grid_shape=None):
+        xyz = np.asarray(xyz, dtype=np.float32)
+        if xyz.ndim != 2 or xyz.shape[0] != 3:
+            raise ValueError(f"xyz must have shape (3, N), got {xyz.shape}")
+        if pixel_index is not None:
+            pixel_index = np.asarray(pixel_index, dtype=np.int32)
+            if pixel_index.shape != (xyz.shape[1],):
+                raise ValueError("pixel_index must hold one entry per point")
+            if grid_shape is None:
+                raise ValueError("grid_shape is required with pixel_index")
+        self.xyz = xyz
+        self.pixel_index = pixel_index
+        self.grid_shape = tuple(grid_shape) if grid_shape is not None else None
+        self._cache = {}
+
+    @classmethod
+    def from_points(cls, points):
+        """Build a cloud from an Nx3 array or a list of (x, y, z) tuples."""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        return cls(np.ascontiguousarray(points.T))
+
+    @classmethod
+    def from_depth(cls, depth_map, intrinsics, depth_scale, rays=None):
+        """Back-project every non-zero depth pixel, keeping its pixel index.
+        rays: optional (2, H, W) undistorted ray table (ray_table.py) used instead of the
+        pinhole model"""
+        flat = depth_map.ravel()
+        pixel_index = np.flatnonzero(flat).astype(np.int32)  # skip invalid (zero) depth
+
+        xyz = np.empty((3, pixel_index.size), dtype=np.float32)
+        z = xyz[2]
+        np.multiply(flat[pixel_index], depth_scale, out=z, casting='unsafe')
+        if rays is not None:
+            if rays.shape[1:] != depth_map.shape[:2]:
+                raise ValueError(f"ray table {rays.shape[1:]} does not match depth {depth_map.shape[:2]}")
+            np.take(rays[0].reshape(-1), pixel_index, out=xyz[0])
+            np.take(rays[1].reshape(-1), pixel_index, out=xyz[1])
+            xyz[0] *= z
+            xyz[1] *= z
+            return cls(xyz, pixel_index, depth_map.shape[:2])
+
+        fx, fy = intrinsics['fx'], intrinsics['fy']
+        cx, cy = intrinsics['cx'], intrinsics['cy']
+        v, u = np.divmod(pixel_index, np.int32(depth_map.shape[1]))
+        np.subtract(u, cx, out=xyz[0], casting='unsafe')
+        xyz[0] *= z
+        xyz[0] /= fx
+        np.subtract(v, cy, out=xyz[1], casting='unsafe')
+        xyz[1] *= z
+        xyz[1] /= fy
+        return cls(xyz, pixel_index, depth_map.shape[:2])
+
+    @property
+    def x(self):
+        return self.xyz[0]
+
+    @property
+    def y(self):
+        return self.xyz[1]
+
+    @property
+    def z(self):
+        return self.xyz[2]
+
+    @property
+    def points(self):
+        """Nx3 view of the points (no copy), for code that expects row-per-point arrays."""
+        return self.xyz.T
+
+    @property
+    def nbytes(self):
+        """Memory held by the point data and pixel indices."""
+        return self.xyz.nbytes + (self.pixel_index.nbytes if self.pixel_index is not None else 0)
+
+    def __len__(self):
+        return self.xyz.shape[1]
+
+    def __repr__(self):
+        return f"PointCloud({len(self)} points, {self.nbytes / 1e6:.2f} MB)"
+
+    def __getitem__(self, index):
+        """Slice the cloud without copying (cloud[a:b] shares memory with cloud)."""
+        if not isinstance(index, slice):
+            raise TypeError("PointCloud only supports slices; use subset() for masks and index arrays")
+        pixel_index = self.pixel_index[index] if self.pixel_index is not None else None
+        return PointCloud(self.xyz[:, index], pixel_index, self.grid_shape)
+
+    def invalidate(self):
+        """Drop cached derived data after the points were modified in place."""
+        self._cache.clear()
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    @property
+    def bounds(self):
+        """Axis-aligned bounding box as (min_xyz, max_xyz)."""
+        return self._cached('bounds', lambda: (self.xyz.min(axis=1), self.xyz.max(axis=1)))
+
+    @property
+    def centroid(self):
+        """Mean point (accumulated in float64)."""
+        return self._cached('centroid', lambda: self.xyz.mean(axis=1, dtype=np.float64))
+
+    @property
+    def principal_axes(self):
+        """(variances, axes) of the point covariance, largest first; axes are columns."""
+        def compute():
+            centered = self.xyz - self.centroid[:, None]
+            covariance = centered @ centered.T / max(len(self) - 1, 1)
+            variances, axes = np.linalg.eigh(covariance)
+            return variances[::-1], axes[:, ::-1]
+        return self._cached('principal_axes', compute)
+
+    @property
+    def normals(self):
+        """(3, N) unit normals from finite differences on the organized depth grid."""
+        if self.pixel_index is None:
+            raise ValueError("normals need pixel indices (build the cloud with PointCloud.from_depth)")
+        return self._cached('normals', self._grid_normals)
+
+    def _grid_normals(self):
+        height, width = self.grid_shape
+        grid = np.full((3, height * width), np.nan, dtype=np.float32)
+        grid[:, self.pixel_index] = self.xyz
+        grid = grid.reshape(3, height, width)
+
+        # Central differences along u and v; one-sided at the image border
+        du = np.empty_like(grid)
+        du[:, :, 1:-1] = grid[:, :, 2:] - grid[:, :, :-2]
+        du[:, :, 0] = grid[:, :, 1] - grid[:, :, 0]
+        du[:, :, -1] = grid[:, :, -1] - grid[:, :, -2]
+        dv = np.empty_like(grid)
+        dv[:, 1:-1] = grid[:, 2:] - grid[:, :-2]
+        dv[:, 0] = grid[:, 1] - grid[:, 0]
+        dv[:, -1] = grid[:, -1] - grid[:, -2]
+
+        du = du.reshape(3, -1)[:, self.pixel_index]
+        dv = dv.reshape(3, -1)[:, self.pixel_index]
+        normals = np.cross(du, dv, axis=0)
+        length = np.linalg.norm(normals, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            normals /= length
+        # Orient towards the camera (negative z); pixels without valid neighbours stay NaN
+        flip = normals[2] > 0
+        normals[:, flip] *= -1
+        return normals
+
+    def subset(self, selection):
+        """Copy out the points selected by a boolean mask or index array."""
+        pixel_index = self.pixel_index[selection] if self.pixel_index is not None else None
+        return PointCloud(self.xyz[:, selection], pixel_index, self.grid_shape)
+
+    def partition(self, mask):
+        """Reorder points in place so mask-selected points come first.
+        Returns (selected, rest) as zero-copy views of this cloud."""
+        mask = np.asarray(mask, dtype=bool)
+        order = np.argsort(~mask, kind='stable')
+        self.xyz[:] = self.xyz[:, order]
+        if self.pixel_index is not None:
+            self.pixel_index[:] = self.pixel_index[order]
+        cached_normals = self._cache.get('normals')
+        self.invalidate()
+        if cached_normals is not None:
+            self._cache['normals'] = cached_normals[:, order]
+
+        count = int(np.count_nonzero(mask))
+        return self[:count], self[count:]
+
+    @staticmethod
+    def concatenate(clouds):
+        """Join several clouds (e.g. from multiple cameras) into one without pixel indices."""
+        if not clouds:
+            return PointCloud(np.empty((3, 0), dtype=np.float32))
+        return PointCloud(np.concatenate([cloud.xyz for cloud in clouds], axis=1))
+
+    def transformed(self, transform):
+        """Return a new cloud moved by a 4x4 rigid transform."""
+        transform = np.asarray(transform, dtype=np.float32)
+        xyz = transform[:3, :3] @ self.xyz + transform[:3, 3:4]
+        return PointCloud(xyz, self.pixel_index, self.grid_shape)
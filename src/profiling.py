@@ -0,0 +1,145 @@
+"""
+Memory profiling for pipeline stages (python src/wood_qa.py --profile ...)
+For every stage records the peak RSS, the top Python/NumPy allocators (tracemalloc)
+and the size of the large intermediate arrays the stage registered through
+record_array(). Torch tensors are not seen by tracemalloc but show up in RSS.
+The report is printed, saved as JSON and checked against MEMORY_PROFILE_CONFIG budgets
+"""
+
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from constants import MEMORY_PROFILE_CONFIG
+
+_active = None  # MemoryProfiler collecting right now, if any
+
+def record_array(name, array):
+    """Register an intermediate array with the active profiler (no-op when not profiling)."""
+    if _active is not None:
+        _active.record_array(name, array)
+
+def _read_status(field):
+    """Value of a /proc/self/status field in MB, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+def current_rss_mb():
+    rss = _read_status("VmRSS")
+    return rss if rss is not None else peak_rss_mb()
+
+def peak_rss_mb():
+    """High-water RSS. VmHWM can be reset between stages; ru_maxrss covers the whole process."""
+    peak = _read_status("VmHWM")
+    if peak is not None:
+        return peak
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024.0 * 1024.0) if sys.platform == "darwin" else maxrss / 1024.0
+
+def _reset_peak_rss():
+    """Reset VmHWM so the next peak belongs to the next stage (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+class MemoryProfiler:
+    """Collects per-stage memory statistics; use stage() around each stage."""
+
+    def __init__(self, config=MEMORY_PROFILE_CONFIG):
+        self.config = config
+        self.stages = []
+        self._current = None
+
+    @contextmanager
+    def stage(self, name):
+        global _active
+        per_stage_peak = _reset_peak_rss()
+        rss_before = current_rss_mb()
+        tracemalloc.start(self.config['traceback_frames'])
+        before = tracemalloc.take_snapshot()
+        self._current = {'stage': name, 'arrays': {}}
+        _active = self
+        start = time.perf_counter()
+        try:
+            yield self._current
+        finally:
+            _active = None
+            after = tracemalloc.take_snapshot()
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self._current.update({
+                'seconds': time.perf_counter() - start,
+                'rss_before_mb': rss_before,
+                'rss_after_mb': current_rss_mb(),
+                'peak_rss_mb': peak_rss_mb(),
+                'peak_is_per_stage': per_stage_peak,
+                'traced_peak_mb': traced_peak / 1e6,
+                'top_allocators': self._top_allocators(before, after),
+            })
+            self.stages.append(self._current)
+            self._current = None
+
+    def _top_allocators(self, before, after):
+        # tracemalloc's own bookkeeping is not part of the stage
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+        stats = sorted(stats, key=lambda stat: stat.size, reverse=True)[:self.config['top_allocators']]
+        return [{'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 'size_mb': stat.size / 1e6, 'count': stat.count} for stat in stats if stat.size > 0]
+
+    def record_array(self, name, array):
+        if self._current is None:
+            return
+        nbytes = getattr(array, 'nbytes', 0)
+        if nbytes >= self.config['large_array_mb'] * 1e6:
+            self._current['arrays'][name] = {
+                'shape': list(getattr(array, 'shape', ())),
+                'dtype': str(getattr(array, 'dtype', '')),
+                'size_mb': nbytes / 1e6,
+            }
+
+    def check_budget(self, total_budget_mb=None):
+        """List of budget violations (empty when every stage fits)."""
+        budgets = dict(self.config['budget_mb'])
+        if total_budget_mb is not None:
+            budgets['total'] = total_budget_mb
+        violations = []
+        for stage in self.stages:
+            limit = budgets.get(stage['stage'])
+            if limit is not None and stage['peak_rss_mb'] > limit:
+                violations.append(f"{stage['stage']}: peak RSS {stage['peak_rss_mb']:.0f} MB > {limit} MB")
+        overall = max((stage['peak_rss_mb'] for stage in self.stages), default=0.0)
+        if budgets.get('total') is not None and overall > budgets['total']:
+            violations.append(f"total: peak RSS {overall:.0f} MB > {budgets['total']} MB")
+        return violations
+
+    def report(self):
+        """Print the per-stage report."""
+        print("\n" + "=" * 50)
+        print("Memory profile")
+        print("=" * 50)
+        for stage in self.stages:
+            scope = "" if stage['peak_is_per_stage'] else " (process peak so far)"
+            print(f"\n{stage['stage']}: peak RSS {stage['peak_rss_mb']:.1f} MB{scope}, "
+                  f"RSS {stage['rss_before_mb']:.1f} -> {stage['rss_after_mb']:.1f} MB, "
+                  f"traced peak {stage['traced_peak_mb']:.1f} MB, {stage['seconds']:.2f} s")
+            for name, info in stage['arrays'].items():
+                print(f"  array {name}: {info['shape']} {info['dtype']} {info['size_mb']:.1f} MB")
+            for allocator in stage['top_allocators']:
+                print(f"  {allocator['size_mb']:8.2f} MB  {allocator['count']:6d} blocks  {allocator['location']}")
+
+    def save(self, path=MEMORY_PROFILE_CONFIG['report_path']):
+        with open(path, 'w') as f:
+            json.dump({'stages': self.stages, 'budget_mb': self.config['budget_mb']}, f, indent=2)
+        return path
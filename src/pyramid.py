@@ -0,0 +1,185 @@
+"""
+Coarse-to-fine flatness analysis on the masked depth image
+The depth image is pooled into factor x factor cells with invalid-aware pooling of the
+back-projected coordinates and their products (invalid pixels count zero, so a cell's
+mean is its sum over its valid-pixel count). The plane is fitted on those cell moments
+and each cell's residual mean and spread follow from them, so the coarse level already
+gives the same plane, std-dev and verdict as the point-by-point analysis. Full-resolution residuals are only computed in
+cells whose mean residual is near DEVIATION_THRESHOLD or whose spread stands out; the
+other cells appear in the heatmap with their mean residual
+"""
+
+import numpy as np
+from constants import DEPTH_SCALE, DEVIATION_THRESHOLD, PYRAMID_CONFIG
+
+# Per-cell sums: pixel count (or weight), coordinates and their second-order products
+MOMENTS = ('n', 'x', 'y', 'z', 'xx', 'xy', 'yy', 'xz', 'yz', 'zz')
+
+def pool_sum(image, factor):
+    """Sum of each factor x factor cell; the image is zero-padded to whole cells."""
+    import cv2
+
+    height, width = image.shape
+    rows, cols = -(-height // factor), -(-width // factor)
+    if (rows * factor, cols * factor) != (height, width):
+        image = np.pad(image, ((0, rows * factor - height), (0, cols * factor - width)))
+    return cv2.resize(image, (cols, rows), interpolation=cv2.INTER_AREA) * (factor * factor)
+
+def cell_grid(depth_map, factor):
+    """(top, left, bottom, right) of the valid pixels' bbox, aligned to the cell grid, or None."""
+    rows = np.flatnonzero(depth_map.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(depth_map[rows[0]:rows[-1] + 1].any(axis=0))
+    top, left = rows[0] // factor * factor, cols[0] // factor * factor
+    return top, left, min(depth_map.shape[0], rows[-1] + 1), min(depth_map.shape[1], cols[-1] + 1)
+
+def window_rays(intrinsics, window, rays=None):
+    """(ray_x, ray_y) of the pixels in window: a (1, width) row and a (height, 1) column for
+    the pinhole model, full images from an undistortion ray table."""
+    top, left, bottom, right = window
+    if rays is not None:
+        return rays[0, top:bottom, left:right], rays[1, top:bottom, left:right]
+    ray_x = ((np.arange(left, right) - intrinsics['cx']) / intrinsics['fx'])[None, :]
+    ray_y = ((np.arange(top, bottom) - intrinsics['cy']) / intrinsics['fy'])[:, None]
+    return ray_x, ray_y
+
+def cell_moments(ray_x, ray_y, z, weight, factor):
+    """Pooled sums of MOMENTS per cell, with each pixel counted with its weight.
+    Pinhole rays are separable (x = ray_x[u] z, y = ray_y[v] z), so only six images are
+    formed at full resolution and summed over each cell's rows; the column factors are
+    applied on the row sums"""
+    height, width = z.shape
+    rows, cols = -(-height // factor), -(-width // factor)
+    if ray_x.shape[0] != 1 or ray_y.shape[1] != 1:
+        x, y = ray_x * z, ray_y * z
+        wx, wy, wz = weight * x, weight * y, weight * z
+        images = {'n': weight, 'x': wx, 'y': wy, 'z': wz, 'xx': wx * x, 'xy': wx * y, 'yy': wy * y,
+                  'xz': wx * z, 'yz': wy * z, 'zz': wz * z}
+        return {name: pool_sum(images[name], factor) for name in MOMENTS}
+
+    # Zero-padded to whole cells: w, wz, ry wz, wzz, ry wzz, ry^2 wzz
+    stack = np.zeros((6, rows * factor, cols * factor))
+    n, wz, ywz, wzz, ywzz, yywzz = stack[:, :height, :width]
+    n[:] = weight
+    np.multiply(weight, z, out=wz)
+    np.multiply(ray_y, wz, out=ywz)
+    np.multiply(wz, z, out=wzz)
+    np.multiply(ray_y, wzz, out=ywzz)
+    np.multiply(ray_y, ywzz, out=yywzz)
+    n, wz, ywz, wzz, ywzz, yywzz = stack.reshape(6, rows, factor, cols * factor).sum(axis=2)
+    ray_x = np.pad(ray_x[0], (0, cols * factor - width))
+    row_sums = {'n': n, 'x': ray_x * wz, 'y': ywz, 'z': wz, 'xx': ray_x * ray_x * wzz, 'xy': ray_x * ywzz,
+                'yy': yywzz, 'xz': ray_x * wzz, 'yz': ywzz, 'zz': wzz}
+    return {name: row_sums[name].reshape(rows, cols, factor).sum(axis=2) for name in MOMENTS}
+
+def solve_plane(moments):
+    """Least-squares plane [a, b, c] (z = ax + by + c) from summed moments."""
+    S = {name: float(values.sum()) for name, values in moments.items()}
+    normal = np.array([[S['xx'], S['xy'], S['x']], [S['xy'], S['yy'], S['y']], [S['x'], S['y'], S['n']]])
+    if abs(np.linalg.det(normal)) < 1e-300:
+        raise ValueError("degenerate point set: cannot fit a plane")
+    return np.linalg.solve(normal, np.array([S['xz'], S['yz'], S['z']]))
+
+def cell_residuals(moments, plane):
+    """Per-cell residual sum and sum of squares of z - (ax + by + c)."""
+    a, b, c = plane
+    m = moments
+    total = m['z'] - a * m['x'] - b * m['y'] - c * m['n']
+    squares = (m['zz'] + a * a * m['xx'] + b * b * m['yy'] + c * c * m['n']
+               - 2 * a * m['xz'] - 2 * b * m['yz'] - 2 * c * m['z']
+               + 2 * a * b * m['xy'] + 2 * a * c * m['x'] + 2 * b * c * m['y'])
+    return total, np.maximum(squares, 0.0)
+
+def pyramid_flatness(depth_map, intrinsics, threshold=DEVIATION_THRESHOLD, depth_scale=DEPTH_SCALE,
+                     rays=None, weights=None, config=PYRAMID_CONFIG):
+    """Plane, residual std-dev, verdict and heatmap of a masked depth image.
+    weights: optional per-pixel plane fit weights (e.g. fused depth confidence); like
+    deviation.py, they only weight the fit, the std-dev counts every point once.
+    heatmap holds |residual| (m) per depth pixel: exact in refined cells, the cell's mean
+    residual elsewhere."""
+    factor = config['factor']
+    window = cell_grid(depth_map, factor)
+    if window is None:
+        raise ValueError("no valid depth")
+    top, left, bottom, right = window
+    depth = depth_map[top:bottom, left:right]
+    valid = depth > 0
+    ray_x, ray_y = window_rays(intrinsics, window, rays)
+    z = depth * depth_scale  # float64: the moments cancel down to residuals of a fraction of a mm
+    count = valid.astype(np.float64)
+
+    moments = cell_moments(ray_x, ray_y, z, count, factor)
+    if weights is None:
+        plane = solve_plane(moments)
+    else:
+        plane = solve_plane(cell_moments(ray_x, ray_y, z, count * weights[top:bottom, left:right], factor))
+    total, squares = cell_residuals(moments, plane)
+    n = moments['n']
+    n_points = int(round(n.sum()))
+    mean = total.sum() / n_points
+    std_dev = float(np.sqrt(max(squares.sum() / n_points - mean * mean, 0.0)))
+
+    occupied = n > 0
+    cell_mean = np.zeros_like(n)
+    cell_mean[occupied] = total[occupied] / n[occupied]
+    cell_spread = np.zeros_like(n)
+    cell_spread[occupied] = np.sqrt(np.maximum(squares[occupied] / n[occupied] - cell_mean[occupied] ** 2, 0.0))
+    # Cells whose mean residual is near the threshold (clearly flat or clearly deviating
+    # cells are shown by their mean), and cells whose spread stands out (a crack or knot
+    # that the cell mean averages away)
+    refine = np.abs(np.abs(cell_mean) - threshold) <= config['refine_band'] * threshold
+    full_cells = n >= factor * factor
+    if full_cells.any():
+        refine |= cell_spread > config['spread_factor'] * np.median(cell_spread[full_cells])
+    refine &= occupied
+
+    # Fine level: per-pixel residuals in the refined cells only
+    height, width = z.shape
+    refined_pixels = np.repeat(np.repeat(refine, factor, axis=0), factor, axis=1)[:height, :width] & valid
+    heatmap = np.zeros(depth_map.shape, dtype=np.float32)
+    region = heatmap[top:bottom, left:right]
+    coarse = np.repeat(np.repeat(np.abs(cell_mean), factor, axis=0), factor, axis=1)[:height, :width]
+    np.copyto(region, coarse, where=valid & ~refined_pixels, casting='unsafe')
+    a, b, c = plane
+    rows, cols = np.nonzero(refined_pixels)
+    fine_z = z[rows, cols]
+    fine_x = np.broadcast_to(ray_x, z.shape)[rows, cols] * fine_z
+    fine_y = np.broadcast_to(ray_y, z.shape)[rows, cols] * fine_z
+    region[rows, cols] = np.abs(fine_z - a * fine_x - b * fine_y - c)
+
+    warped = std_dev > threshold
+    fallback = abs(std_dev - threshold) <= config['verdict_margin'] * threshold
+    if fallback:
+        # Too close to call on rounding alone: decide like deviation.py, point by point
+        from deviation import fit_plane, compute_deviations
+        from point_cloud import PointCloud
+
+        points = PointCloud.from_depth(depth_map, intrinsics, depth_scale, rays).points
+        point_weights = weights[depth_map > 0] if weights is not None else None
+        plane = fit_plane(points, point_weights)
+        std_dev = float(np.std(compute_deviations(points, plane)))
+        warped = std_dev > threshold
+
+    return {
+        'warped': warped,
+        'std_dev': std_dev,
+        'plane': plane,
+        'n_points': n_points,
+        'factor': factor,
+        'cells': int(np.count_nonzero(occupied)),
+        'refined_cells': int(np.count_nonzero(refine)),
+        'refined_fraction': float(np.count_nonzero(refined_pixels)) / max(n_points, 1),
+        'fallback': fallback,
+        'cell_residuals': cell_mean,
+        'heatmap': heatmap,
+    }
+
+def heatmap_image(heatmap, threshold=DEVIATION_THRESHOLD):
+    """Colour image of a |residual| heatmap: blue is on the plane, red is 2x the threshold or more."""
+    import cv2
+
+    scaled = np.clip(heatmap / (2 * threshold) * 255, 0, 255).astype(np.uint8)
+    image = cv2.applyColorMap(scaled, cv2.COLORMAP_JET)
+    image[heatmap == 0] = 0
+    return image
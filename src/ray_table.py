@@ -0,0 +1,77 @@
+"""
+Undistorted back-projection rays per (device, camera, resolution)
+A ray table holds, for every pixel, the slopes x/z and y/z of the ray through it after
+removing the lens distortion from the device calibration. Back-projection is then
+x = z * ray_x and y = z * ray_y, the same cost as the pinhole model. Tables are
+computed once with OpenCV's iterative undistortion and stored next to the calibration cache
+(CALIBRATION_DIR/rays/), keyed by the calibration hash so they follow recalibration.
+Only depth aligned to an unrectified, distorted camera needs them: StereoDepth output
+(DEPTH_RECTIFIED) is already rectified, i.e. undistorted
+"""
+
+import os
+import numpy as np
+from calibration import load_calibration, find_cache_file
+from constants import UNDISTORT_DEPTH, DEPTH_RECTIFIED, CALIBRATION_DIR, CAMERA_RESOLUTION, SENSOR_RESOLUTION_SIZES
+
+RAYS_DIR = os.path.join(CALIBRATION_DIR, "rays")
+
+# Tables already loaded or built in this process
+_tables = {}
+
+def build_ray_table(intrinsics, distortion, shape):
+    """(2, H, W) float32 undistorted ray slopes (x/z, y/z) for every pixel of an image."""
+    import cv2
+
+    height, width = shape
+    v, u = np.mgrid[0:height, 0:width]
+    pixels = np.stack([u.ravel(), v.ravel()], axis=-1).astype(np.float64).reshape(-1, 1, 2)
+    camera_matrix = np.array([[intrinsics['fx'], 0, intrinsics['cx']],
+                              [0, intrinsics['fy'], intrinsics['cy']],
+                              [0, 0, 1]], dtype=np.float64)
+    # The default 5 iterations leave visible error in the corners of wide-angle lenses
+    criteria = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 50, 1e-10)
+    distortion = np.asarray(distortion, dtype=np.float64)
+    if hasattr(cv2, 'undistortPointsIter'):  # OpenCV 4.x
+        rays = cv2.undistortPointsIter(pixels, camera_matrix, distortion, None, None, criteria)
+    else:                                    # OpenCV 5 merged it into undistortPoints
+        rays = cv2.undistortPoints(pixels, camera_matrix, distortion, criteria=criteria)
+    return np.ascontiguousarray(rays.reshape(height, width, 2).transpose(2, 0, 1), dtype=np.float32)
+
+def table_path(calibration, camera, resolution):
+    digest = calibration.get('calibration_hash', 'nohash')[:12]
+    return os.path.join(RAYS_DIR, f"{calibration['mxid']}_{camera}_{resolution}_{digest}.npy")
+
+def get_ray_table(camera='left', resolution=None, mxid=None):
+    """Ray table for a camera of the cached device, or None when the pinhole model applies
+    (UNDISTORT_DEPTH off, rectified depth, no calibration cache, or no distortion)."""
+    if not UNDISTORT_DEPTH or DEPTH_RECTIFIED:
+        return None  # rectified depth would be undistorted twice
+    if resolution is None:
+        resolution = CAMERA_RESOLUTION['rgb' if camera == 'rgb' else 'mono']
+    calibration = load_calibration(mxid)
+    if calibration is None:
+        return None
+    distortion = calibration['cameras'][camera]['distortion']
+    if not any(distortion):
+        return None
+
+    key = (find_cache_file(mxid), calibration.get('calibration_hash'), camera, resolution)
+    if key in _tables:
+        return _tables[key]
+
+    width, height = SENSOR_RESOLUTION_SIZES[resolution]
+    path = table_path(calibration, camera, resolution)
+    table = None
+    if os.path.exists(path):
+        table = np.load(path, mmap_mode='r')  # 2 MB at 400P; only mapped pages are read
+        if table.shape != (2, height, width):
+            table = None
+    if table is None:
+        table = build_ray_table(calibration['cameras'][camera]['intrinsics'][resolution], distortion, (height, width))
+        os.makedirs(RAYS_DIR, exist_ok=True)
+        tmp_path = path + ".partial.npy"
+        np.save(tmp_path, table)
+        os.replace(tmp_path, path)
+    _tables[key] = table
+    return table
@@ -0,0 +1,264 @@
+"""
+Golden-fixture regression gate
+Runs each pipeline stage on the fixtures in REGRESSION_CONFIG['fixtures_dir'] (rgb_image.png,
+depth_map.png, wood_panel_mask.png, wood_panel_depth_map.png, deviations.txt from a real
+run; copies of the repository-root files, which every pipeline run overwrites) and checks
+the outputs against them: mask IoU, masked depth, point count, plane
+coefficients and residuals. Stage timings are appended to a history file and a stage
+fails when its best time is above the median of its recent passing runs on the same host by
+more than REGRESSION_CONFIG['max_slowdown_pct']. The fixtures predate the depth filter,
+and the calibration cache, so the cloud stage runs unfiltered with the default pinhole
+intrinsics (OAK_D_LITE_INTRINSICS), as they were produced. The pipeline stage then runs
+the cloud and deviation stages as shipped (depth filter, calibration cache and ray table,
+configured analysis mode): its verdict must match the golden one. A segment stage that
+cannot run (torch or the cached model missing) fails unless --skip-segment is given.
+Usage: python src/wood_qa.py regress [--repeats N] [--accept] [--no-record] [--skip-segment]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+from calibration import get_intrinsics
+from compact_mask import CompactMask
+from depth_filter import filter_depth
+from depth_to_cloud import depth_to_cloud
+from deviation import fit_plane, compute_deviations, progressive_verdict
+from extract_wood import apply_mask_to_depth
+from ray_table import get_ray_table
+from constants import (
+    REGRESSION_CONFIG, RGB_IMAGE_PATH, DEPTH_MAP_PATH, WOOD_PANEL_MASK_PATH, WOOD_PANEL_DEPTH_PATH,
+    DEVIATIONS_PATH, OAK_D_LITE_INTRINSICS, TEXT_OR_IMAGE, TEXT_PROMPT, WOOD_REFERENCE_PATH,
+    DEPTH_CAMERA, DEPTH_FILTER_CONFIG, DEVIATION_THRESHOLD, PROGRESSIVE_VERDICT_CONFIG, PYRAMID_CONFIG
+)
+
+def fixture_path(name):
+    return os.path.join(REGRESSION_CONFIG['fixtures_dir'], os.path.basename(name))
+
+def load_fixtures():
+    """Golden inputs and outputs from the fixtures directory."""
+    fixtures = {
+        'depth_map': cv2.imread(fixture_path(DEPTH_MAP_PATH), cv2.IMREAD_UNCHANGED),
+        'mask': cv2.imread(fixture_path(WOOD_PANEL_MASK_PATH), cv2.IMREAD_GRAYSCALE),
+        'panel_depth': cv2.imread(fixture_path(WOOD_PANEL_DEPTH_PATH), cv2.IMREAD_UNCHANGED),
+    }
+    for name, image in fixtures.items():
+        if image is None:
+            raise FileNotFoundError(f"missing fixture for {name} in {REGRESSION_CONFIG['fixtures_dir']}/")
+    fixtures['deviations'] = np.loadtxt(fixture_path(DEVIATIONS_PATH))
+    return fixtures
+
+def timed(fn, repeats):
+    """Run fn repeats times. Returns (last result, best milliseconds); scheduling noise only adds time."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, min(times)
+
+def check(failures, name, value, ok, detail):
+    """Print one output check and collect it if it failed."""
+    print(f"  {'✓' if ok else '✗'} {name}: {value} ({detail})")
+    if not ok:
+        failures.append(name)
+
+def run_segment(fixtures, repeats, failures):
+    """CLIPSeg on rgb_image.png vs wood_panel_mask.png. Returns ms, or None (a failure) if the
+    model is unavailable."""
+    try:
+        from PIL import Image
+        from extract_wood import load_segmentation_model, predict_mask, threshold_mask
+        processor, model = load_segmentation_model(local_files_only=True)
+    except Exception as e:  # torch not installed or model not cached
+        print(f"  ✗ segment could not run: {e} (use --skip-segment to skip it)")
+        failures.append("segment")
+        return None
+    rgb_image = Image.open(fixture_path(RGB_IMAGE_PATH)).convert("RGB")
+    text_prompt = TEXT_PROMPT if TEXT_OR_IMAGE else None
+    reference_image = None if TEXT_OR_IMAGE else Image.open(WOOD_REFERENCE_PATH).convert("RGB")
+    mask, ms = timed(lambda: threshold_mask(predict_mask(processor, model, rgb_image, text_prompt, reference_image)),
+                     max(1, repeats // 2))  # a CLIPSeg pass takes seconds on the Pi
+    iou = CompactMask.from_array(mask == 255).iou(CompactMask.from_array(fixtures['mask'] == 255))
+    check(failures, "mask IoU", f"{iou:.4f}", iou >= REGRESSION_CONFIG['min_mask_iou'],
+          f"min {REGRESSION_CONFIG['min_mask_iou']}")
+    return ms
+
+def run_mask(fixtures, repeats, failures):
+    """Golden mask applied to depth_map.png vs wood_panel_depth_map.png."""
+    (panel_depth, _), ms = timed(lambda: apply_mask_to_depth(fixtures['mask'], fixtures['depth_map']), repeats)
+    golden = fixtures['panel_depth']
+    mismatched = int(np.count_nonzero(panel_depth != golden)) if panel_depth.shape == golden.shape else golden.size
+    check(failures, "masked depth", f"{mismatched} pixels differ", mismatched == 0, "must be identical")
+    return ms
+
+def run_cloud(fixtures, repeats, failures):
+    """Back-projection of wood_panel_depth_map.png; one point per golden residual."""
+    # Not get_intrinsics(): a device calibration cache would change every point
+    cloud, ms = timed(lambda: depth_to_cloud(fixtures['panel_depth'], OAK_D_LITE_INTRINSICS), repeats)
+    expected = len(fixtures['deviations'])
+    check(failures, "point count", len(cloud), len(cloud) == expected, f"golden {expected}")
+    fixtures['points'] = cloud.points
+    return ms
+
+def run_deviation(fixtures, repeats, failures):
+    """Plane fit and residuals vs deviations.txt (and the plane recovered from it)."""
+    points = fixtures.get('points')
+    golden = fixtures['deviations']
+    if points is None or len(points) != len(golden):
+        print("  ✗ deviation skipped: cloud does not match the golden point count")
+        failures.append("deviation")
+        return None
+
+    def analyze():
+        coeffs = fit_plane(points)
+        deviations = compute_deviations(points, coeffs)
+        return coeffs, deviations, float(np.std(deviations))
+    (coeffs, deviations, std_dev), ms = timed(analyze, repeats)
+
+    # The golden residuals are z - (ax + by + c), so the golden plane is the fit to z - residual
+    design = np.c_[points[:, :2], np.ones(len(points))]
+    golden_coeffs = np.linalg.lstsq(design, points[:, 2] - golden, rcond=None)[0]
+    tolerance = REGRESSION_CONFIG['residual_tolerance']
+    plane_error = float(np.max(np.abs(coeffs - golden_coeffs)))
+    check(failures, "plane coefficients", f"max difference {plane_error:.2e}",
+          plane_error <= REGRESSION_CONFIG['plane_tolerance'], f"tolerance {REGRESSION_CONFIG['plane_tolerance']:.0e}")
+    residual_error = float(np.max(np.abs(deviations - golden)))
+    check(failures, "residuals", f"max difference {residual_error:.2e} m", residual_error <= tolerance,
+          f"tolerance {tolerance:.0e} m")
+    golden_std = float(np.std(golden))
+    check(failures, "residual std-dev", f"{std_dev * 1000:.4f} mm", abs(std_dev - golden_std) <= tolerance,
+          f"golden {golden_std * 1000:.4f} mm")
+    golden_max = float(np.max(np.abs(golden)))
+    max_abs = float(np.max(np.abs(deviations)))
+    check(failures, "max |residual|", f"{max_abs * 1000:.4f} mm", abs(max_abs - golden_max) <= tolerance,
+          f"golden {golden_max * 1000:.4f} mm")
+    return ms
+
+def run_pipeline(fixtures, repeats, failures):
+    """Cloud and deviation stages with the shipped defaults on wood_panel_depth_map.png: the
+    verdict must match the golden one and the std-dev stay within pipeline_std_tolerance of it."""
+    intrinsics = get_intrinsics(DEPTH_CAMERA)
+    rays = get_ray_table(DEPTH_CAMERA)
+
+    def analyze():
+        depth = fixtures['panel_depth']
+        if DEPTH_FILTER_CONFIG['enabled']:
+            depth, _ = filter_depth(depth)
+        if PYRAMID_CONFIG['enabled']:
+            from pyramid import pyramid_flatness
+            result = pyramid_flatness(depth, intrinsics, DEVIATION_THRESHOLD, rays=rays)
+            return result['std_dev'], result['warped']
+        points = depth_to_cloud(depth, intrinsics, rays=rays).points
+        if PROGRESSIVE_VERDICT_CONFIG['enabled']:
+            result = progressive_verdict(points, DEVIATION_THRESHOLD)
+            return result['std_dev'], result['warped']
+        std_dev = float(np.std(compute_deviations(points, fit_plane(points))))
+        return std_dev, std_dev > DEVIATION_THRESHOLD
+    (std_dev, warped), ms = timed(analyze, repeats)
+
+    golden_std = float(np.std(fixtures['deviations']))
+    golden_warped = golden_std > DEVIATION_THRESHOLD
+    verdicts = {True: "WARPED", False: "FLAT"}
+    check(failures, "pipeline verdict", verdicts[bool(warped)], bool(warped) == golden_warped,
+          f"golden {verdicts[golden_warped]}")
+    tolerance = REGRESSION_CONFIG['pipeline_std_tolerance']
+    check(failures, "pipeline std-dev", f"{std_dev * 1000:.4f} mm", abs(std_dev - golden_std) <= tolerance,
+          f"golden {golden_std * 1000:.4f} mm, tolerance {tolerance * 1000:.1f} mm")
+    return ms
+
+STAGES = [('segment', run_segment), ('mask', run_mask), ('cloud', run_cloud), ('deviation', run_deviation),
+          ('pipeline', run_pipeline)]
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+def save_history(path, history):
+    tmp_path = path + ".partial"
+    with open(tmp_path, "w") as f:
+        json.dump(history[-REGRESSION_CONFIG['history_limit']:], f, indent=1)
+    os.replace(tmp_path, path)
+
+def baseline_ms(history, host, stage, runs):
+    """Median time of a stage over the last `runs` recorded runs on host (None without history)."""
+    times = [entry['stages'][stage] for entry in history if entry['host'] == host and stage in entry['stages']]
+    return statistics.median(times[-runs:]) if times else None
+
+def check_timings(timings, history, host, max_slowdown_pct):
+    """Compare stage timings with their rolling baselines. Returns the names of slowed-down stages."""
+    slow = []
+    for stage, ms in timings.items():
+        baseline = baseline_ms(history, host, stage, REGRESSION_CONFIG['baseline_runs'])
+        if baseline is None:
+            print(f"  - {stage:10s} {ms:8.2f} ms (no baseline yet)")
+            continue
+        change = (ms / baseline - 1) * 100
+        too_slow = (change > max_slowdown_pct and ms - baseline > REGRESSION_CONFIG['min_slowdown_ms'])
+        print(f"  {'✗' if too_slow else '✓'} {stage:10s} {ms:8.2f} ms (baseline {baseline:.2f} ms, {change:+.0f}%)")
+        if too_slow:
+            slow.append(stage)
+    return slow
+
+def main(argv=None):
+    """Run the stages on the golden fixtures; exit non-zero on an output or timing regression."""
+    parser = argparse.ArgumentParser(description="Golden-fixture regression gate")
+    parser.add_argument("--repeats", type=int, default=REGRESSION_CONFIG['repeats'], help="Timed runs per stage")
+    parser.add_argument("--max-slowdown-pct", type=float, default=REGRESSION_CONFIG['max_slowdown_pct'])
+    parser.add_argument("--history", default=REGRESSION_CONFIG['history_path'])
+    parser.add_argument("--accept", action="store_true",
+                        help="Record the timings even if they are slower (after an intentional change)")
+    parser.add_argument("--no-record", action="store_true", help="Do not add this run to the history")
+    parser.add_argument("--skip-segment", action="store_true",
+                        help="Skip the CLIPSeg stage (torch or the cached model not installed)")
+    args = parser.parse_args(argv)
+
+    print("=" * 50)
+    print("Golden-fixture regression check")
+    print("=" * 50)
+
+    try:
+        fixtures = load_fixtures()
+    except Exception as e:
+        print(f"✗ Error loading fixtures: {e}")
+        sys.exit(1)
+
+    failures = []
+    timings = {}
+    for name, run in STAGES:
+        print(f"\n{name}:")
+        if name == 'segment' and args.skip_segment:
+            print("  - skipped (--skip-segment)")
+            continue
+        ms = run(fixtures, args.repeats, failures)
+        if ms is not None:
+            timings[name] = round(ms, 3)
+
+    host = platform.node()
+    history = load_history(args.history)
+    print("\nTimings (best of runs):")
+    slow = check_timings(timings, history, host, args.max_slowdown_pct)
+
+    if not args.no_record and not failures and (not slow or args.accept):
+        history.append({'time': datetime.now().isoformat(timespec='seconds'), 'host': host, 'stages': timings})
+        save_history(args.history, history)
+        print(f"\nRecorded timings in {args.history}")
+
+    if failures:
+        print(f"\n✗ Outputs differ from the golden fixtures: {', '.join(failures)}")
+        sys.exit(1)
+    if slow and not args.accept:
+        print(f"\n✗ Slower than baseline by more than {args.max_slowdown_pct:.0f}%: {', '.join(slow)}")
+        sys.exit(1)
+    print("\n✓ All stages match the golden fixtures within their time budgets")
+
+if __name__ == "__main__":
+    main()
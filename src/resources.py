@@ -0,0 +1,87 @@
+"""
+Central CPU thread budgets for the pipeline stages (THREAD_BUDGETS in constants.py)
+torch, OpenCV and the BLAS behind NumPy each start a thread pool as wide as the machine,
+so stages running side by side oversubscribe the Pi's four cores. apply_budget(stage)
+limits all three to the stage's thread count and optionally pins the calling thread
+(and the threads it starts afterwards) to a set of cores. Libraries that are not
+imported yet are not imported here: environment variables cover BLAS/OpenMP pools
+created later, and configure_torch() is called right after torch is imported
+"""
+
+import os
+import sys
+from constants import THREAD_BUDGETS
+
+BLAS_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS')
+
+_current = None  # budget applied last, used by configure_torch()
+_blas_threads = None  # BLAS pool width NumPy started with (the env value when it was imported)
+_warned_threadpoolctl = False
+# Affinity before any budget pinned the process, restored for stages without 'cpus'
+_initial_affinity = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else None
+
+def get_budget(stage):
+    return THREAD_BUDGETS.get(stage, THREAD_BUDGETS['default'])
+
+def set_affinity(cpus):
+    """Pin the calling thread to cpus (Linux only); None restores the initial affinity, so
+    a stage without 'cpus' does not stay pinned by the stage before it. Returns True if applied."""
+    if _initial_affinity is None:
+        return False
+    if cpus is None:
+        if os.sched_getaffinity(0) == _initial_affinity:
+            return False
+        os.sched_setaffinity(0, _initial_affinity)
+        return True
+    cpus = {cpu for cpu in cpus if cpu in _initial_affinity} or _initial_affinity
+    os.sched_setaffinity(0, cpus)
+    return True
+
+def limit_blas(threads):
+    """Limit BLAS/OpenMP pools: env vars for pools not started yet, threadpoolctl for pools
+    NumPy has already started (warns once if it is missing and the limit would change)."""
+    global _blas_threads, _warned_threadpoolctl
+    for name in BLAS_ENV_VARS:
+        os.environ[name] = str(threads)
+    if 'numpy' not in sys.modules:
+        _blas_threads = threads
+        return
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        if threads != _blas_threads and not _warned_threadpoolctl:
+            _warned_threadpoolctl = True
+            print(f"⚠️ threadpoolctl is not installed: NumPy's BLAS keeps {_blas_threads or 'all'} threads "
+                  f"instead of the stage budget of {threads} (pip install threadpoolctl)")
+        return
+    threadpool_limits(threads)
+
+def configure_process(stages):
+    """Set the BLAS/OpenMP environment for a process that will run `stages`, before NumPy
+    is imported (the pools size themselves once, on import): the widest budget is used
+    and apply_budget() narrows it per stage where the library allows."""
+    limit_blas(max(get_budget(stage)['threads'] for stage in stages))
+
+def configure_torch():
+    """Apply the current budget to torch; call after importing torch."""
+    if _current is None or 'torch' not in sys.modules:
+        return
+    torch = sys.modules['torch']
+    torch.set_num_threads(_current['threads'])
+    try:
+        torch.set_num_interop_threads(1)  # only allowed before the first parallel op
+    except RuntimeError:
+        pass
+
+def apply_budget(stage):
+    """Apply the thread budget (and affinity) of a stage. Returns the budget used."""
+    global _current
+    budget = get_budget(stage)
+    _current = budget
+    threads = budget['threads']
+    limit_blas(threads)
+    if 'cv2' in sys.modules:
+        sys.modules['cv2'].setNumThreads(threads)
+    configure_torch()
+    set_affinity(budget.get('cpus'))
+    return budget
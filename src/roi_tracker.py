@@ -0,0 +1,135 @@
+"""
+Panel region tracking between consecutive frames
+On the line the panel sits in a predictable, slowly moving region of the frame. The
+tracker keeps the previous panel bounding box (as fractions of the frame, so it applies
+to the RGB and depth resolutions alike) and hands CLIPSeg only that box plus padding,
+which is cheaper to preprocess and gives the panel more of the model's 352x352 input.
+A cropped result is trusted when the mask stays clear of the crop edges and its area is
+close to the previous frame's; otherwise the frame is segmented again over the full
+frame, which also (re-)acquires the panel. A tracker follows one camera stream; frames
+of several streams are segmented together with segment_frames and one tracker per stream.
+Only the inspection service tracks; the CLI stages segment one capture per run
+"""
+
+import numpy as np
+from compact_mask import CompactMask
+from constants import ROI_TRACKER_CONFIG, SEGMENTATION_THRESHOLD
+
+class RoiTracker:
+    """Bounding box of the panel carried from one frame to the next."""
+
+    def __init__(self, config=ROI_TRACKER_CONFIG):
+        self.config = config
+        self.box = None            # (top, left, bottom, right) as fractions of the frame
+        self.area = None           # mask area as a fraction of the frame
+        self.since_full = 0        # frames since the last full-frame pass
+        self.stats = {'cropped': 0, 'full': 0, 'reacquired': 0, 'crop_fraction': 0.0}
+
+    def reset(self):
+        self.box = None
+        self.area = None
+
+    def window(self, shape):
+        """Padded (top, left, bottom, right) pixel window to segment in an image of shape,
+        or None when the next frame needs a full-frame pass."""
+        refresh = self.config['refresh_frames']
+        if self.box is None or (refresh and self.since_full >= refresh):
+            return None
+        height, width = shape[:2]
+        top, left, bottom, right = self.box
+        pad_y = (bottom - top) * self.config['padding']
+        pad_x = (right - left) * self.config['padding']
+        window = (max(0, int(np.floor((top - pad_y) * height))), max(0, int(np.floor((left - pad_x) * width))),
+                  min(height, int(np.ceil((bottom + pad_y) * height))),
+                  min(width, int(np.ceil((right + pad_x) * width))))
+        return None if window == (0, 0, height, width) else window
+
+    def confidence(self, mask, window):
+        """How far a mask segmented inside window can be trusted (0 to 1)."""
+        height, width = mask.shape
+        area = mask.area / (height * width)
+        if area < self.config['min_area']:
+            return 0.0
+        if window is not None:
+            margin = self.config['edge_margin']
+            limits = (0, 0, height, width)
+            for side, (edge, limit) in enumerate(zip(window, limits)):
+                # An edge of the crop that is not an edge of the frame may cut the panel off
+                if edge != limit and abs(mask.bbox[side] - edge) <= margin:
+                    return 0.0
+        if self.area is None:
+            return 1.0
+        return min(area / self.area, self.area / area)
+
+    def update(self, mask, window):
+        """Record the mask (CompactMask at full-frame size) of a frame segmented inside window
+        (None for the full frame). Returns True if the result is accepted; False means the
+        frame should be segmented again over the full frame."""
+        confidence = self.confidence(mask, window)
+        height, width = mask.shape
+        if window is None:
+            self.stats['full'] += 1
+            self.since_full = 0
+        else:
+            self.stats['cropped'] += 1
+            self.stats['crop_fraction'] += ((window[2] - window[0]) * (window[3] - window[1])) / (height * width)
+            self.since_full += 1
+        if window is not None and confidence < self.config['min_confidence']:
+            self.stats['reacquired'] += 1
+            self.reset()
+            return False
+        if confidence == 0.0:  # full frame without a trackable panel
+            self.reset()
+            return True
+        top, left, bottom, right = mask.bbox
+        self.box = (top / height, left / width, bottom / height, right / width)
+        self.area = mask.area / (height * width)
+        return True
+
+    def summary(self):
+        """Counts of cropped, full-frame and re-acquired frames, and the mean crop size."""
+        summary = dict(self.stats)
+        cropped = summary.pop('crop_fraction')
+        summary['frames'] = summary['cropped'] + summary['full'] - summary['reacquired']
+        summary['mean_crop'] = cropped / summary['cropped'] if summary['cropped'] else 1.0
+        return summary
+
+    def segment(self, rgb_images, predict, threshold=SEGMENTATION_THRESHOLD):
+        """Segment consecutive frames (HxWx3 uint8 arrays) of this tracker's stream with
+        predict (see segment_frames). Returns one CompactMask at full RGB resolution per frame."""
+        return segment_frames(rgb_images, [self] * len(rgb_images), predict, threshold)
+
+def segment_frames(rgb_images, trackers, predict, threshold=SEGMENTATION_THRESHOLD):
+    """Segment frames (HxWx3 uint8 arrays), each cropped to the window of its stream's tracker
+    (trackers[i], or None to segment frame i over the full frame without tracking), in one
+    predict call. predict maps a list of PIL images to a list of probability maps at those
+    images' sizes (e.g. a partial extract_wood.predict_masks). A frame whose cropped result is
+    not trusted is redone on the full frame. Frames of one stream must be in capture order.
+    Returns one CompactMask at full RGB resolution per frame."""
+    from PIL import Image
+
+    windows = [tracker.window(rgb.shape) if tracker is not None else None
+               for rgb, tracker in zip(rgb_images, trackers)]
+    crops = [Image.fromarray(crop(rgb, window)) for rgb, window in zip(rgb_images, windows)]
+    masks = []
+    for rgb, tracker, window, probabilities in zip(rgb_images, trackers, windows, predict(crops)):
+        mask = place(probabilities > threshold, window, rgb.shape)
+        if tracker is not None and not tracker.update(mask, window):
+            probabilities = predict([Image.fromarray(rgb)])[0]
+            mask = CompactMask.from_array(probabilities > threshold)
+            tracker.update(mask, None)
+        masks.append(mask)
+    return masks
+
+def crop(image, window):
+    """View of the image inside window (the whole image when window is None)."""
+    if window is None:
+        return image
+    top, left, bottom, right = window
+    return image[top:bottom, left:right]
+
+def place(crop_mask, window, shape):
+    """CompactMask of a full frame of shape from a boolean mask of the window's pixels."""
+    if window is None:
+        return CompactMask.from_array(crop_mask)
+    return CompactMask.from_crop(shape[:2], window[:2], crop_mask)
@@ -0,0 +1,164 @@
+"""
+Spatial indexes for neighborhood queries on panel point clouds
+GridIndex uses the organized depth-image layout of a single-camera cloud: the
+neighbours of a point are found in a small pixel window around it, so queries never
+scan the whole cloud. KDTreeIndex is the fallback for merged (unorganized) clouds
+and needs scipy
+"""
+
+import numpy as np
+from constants import LOCAL_DEFECT_KNN
+
+def box_sum(image, half):
+    """Sum over a (2*half+1)^2 window around every pixel (zero padded), via an integral image."""
+    padded = np.pad(image.astype(np.float64), ((half + 1, half), (half + 1, half)))
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    k = 2 * half + 1
+    return integral[k:, k:] - integral[:-k, k:] - integral[k:, :-k] + integral[:-k, :-k]
+
+class GridIndex:
+    """Radius and kNN queries through the pixel grid of an organized PointCloud."""
+
+    def __init__(self, cloud):
+        if cloud.pixel_index is None:
+            raise ValueError("GridIndex needs an organized cloud (PointCloud.from_depth)")
+        self.cloud = cloud
+        self.height, self.width = cloud.grid_shape
+
+        # Pixel -> point lookup, -1 where the pixel has no point
+        self.lookup = np.full(self.height * self.width, -1, dtype=np.int32)
+        self.lookup[cloud.pixel_index] = np.arange(len(cloud), dtype=np.int32)
+        self.lookup = self.lookup.reshape(self.height, self.width)
+        self.pixels_per_meter = self._estimate_focal_length()
+
+    def _estimate_focal_length(self):
+        """Estimate fx (pixels per meter at 1 m) from horizontally adjacent points."""
+        left = self.lookup[:, :-1]
+        right = self.lookup[:, 1:]
+        both = (left >= 0) & (right >= 0)
+        if not both.any():
+            return 1.0
+        x, z = self.cloud.x, self.cloud.z
+        i, j = left[both], right[both]
+        step = np.abs(x[j] - x[i]) / np.maximum(z[i], 1e-6)
+        step = step[step > 0]
+        return 1.0 / float(np.median(step)) if step.size else 1.0
+
+    def window_radius(self, radius, depth):
+        """Pixel half-width of the window that covers `radius` meters at `depth` (capped to the image)."""
+        half = int(np.ceil(radius * self.pixels_per_meter / max(float(depth), 1e-6)))
+        return min(max(1, half), max(self.height, self.width))
+
+    def _window(self, index, half):
+        v, u = divmod(int(self.cloud.pixel_index[index]), self.width)
+        window = self.lookup[max(v - half, 0):v + half + 1, max(u - half, 0):u + half + 1]
+        return window[window >= 0]
+
+    def _distances(self, index, candidates):
+        diff = self.cloud.xyz[:, candidates] - self.cloud.xyz[:, index:index + 1]
+        return np.sqrt(np.einsum('ij,ij->j', diff, diff))
+
+    def radius_neighbors(self, index, radius):
+        """Indices of points within `radius` meters of point `index` (including itself)."""
+        half = self.window_radius(radius, self.cloud.z[index])
+        candidates = self._window(index, half)
+        return candidates[self._distances(index, candidates) <= radius]
+
+    def knn(self, index, k):
+        """Indices and distances of the k nearest points to point `index` (including itself)."""
+        half = 1
+        limit = max(self.height, self.width)
+        while True:
+            candidates = self._window(index, half)
+            distances = self._distances(index, candidates)
+            if candidates.size >= k:
+                order = np.argpartition(distances, k - 1)[:k]
+                order = order[np.argsort(distances[order])]
+                # Points outside the window are at least ~half pixels away laterally, so on a
+                # smooth surface nothing closer can be missed
+                covered = half / self.pixels_per_meter * self.cloud.z[index]
+                if distances[order[-1]] <= covered or half >= limit:
+                    return candidates[order], distances[order]
+            elif half >= limit:
+                order = np.argsort(distances)
+                return candidates[order], distances[order]
+            half *= 2
+
+    def neighborhood_mean(self, values, radius):
+        """Mean of `values` over each point's pixel neighborhood of about `radius` meters.
+        Runs in linear time with box sums over the grid."""
+        half = self.window_radius(radius, np.median(self.cloud.z))
+        flat = self.cloud.pixel_index
+        grid = np.zeros(self.height * self.width)
+        grid[flat] = values
+        weight = np.zeros(self.height * self.width)
+        weight[flat] = 1.0
+        total = box_sum(grid.reshape(self.height, self.width), half).ravel()[flat]
+        count = box_sum(weight.reshape(self.height, self.width), half).ravel()[flat]
+        return total / count
+
+    def connected_regions(self, flagged, radius=None):
+        """Label 8-connected groups of flagged points on the pixel grid (-1 = not flagged).
+        radius is unused; pixel adjacency defines connectivity."""
+        import cv2
+
+        grid = np.zeros(self.height * self.width, dtype=np.uint8)
+        grid[self.cloud.pixel_index[flagged]] = 1
+        _, labels = cv2.connectedComponents(grid.reshape(self.height, self.width), connectivity=8)
+        labels = labels.ravel()[self.cloud.pixel_index].astype(np.int64) - 1
+        labels[~flagged] = -1
+        return labels
+
+class KDTreeIndex:
+    """Radius and kNN queries for unorganized clouds (e.g. merged multi-camera clouds)."""
+
+    def __init__(self, cloud):
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError as e:
+            raise ImportError("KDTreeIndex needs scipy for unorganized clouds: pip install scipy") from e
+        self.cloud = cloud
+        self.tree = cKDTree(cloud.points)
+
+    def radius_neighbors(self, index, radius):
+        """Indices of points within `radius` meters of point `index` (including itself)."""
+        return np.asarray(self.tree.query_ball_point(self.cloud.points[index], radius), dtype=np.int64)
+
+    def knn(self, index, k):
+        """Indices and distances of the k nearest points to point `index` (including itself)."""
+        distances, indices = self.tree.query(self.cloud.points[index], k=k)
+        return np.atleast_1d(indices), np.atleast_1d(distances)
+
+    def neighborhood_mean(self, values, radius, k=LOCAL_DEFECT_KNN):
+        """Mean of `values` over each point's k nearest neighbours within `radius` meters."""
+        distances, indices = self.tree.query(self.cloud.points, k=k, distance_upper_bound=radius)
+        valid = np.isfinite(distances)  # missing neighbours come back as inf / index n
+        padded = np.append(values, 0.0)
+        return (padded[indices] * valid).sum(axis=1) / valid.sum(axis=1)
+
+    def connected_regions(self, flagged, radius):
+        """Label groups of flagged points linked by pairs closer than `radius` (-1 = not flagged)."""
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        members = np.flatnonzero(flagged)
+        labels = np.full(len(self.cloud), -1, dtype=np.int64)
+        if members.size == 0:
+            return labels
+        pairs = _close_pairs(self.cloud.points[members], radius)
+        graph = coo_matrix(
+            (np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(members.size, members.size)
+        )
+        _, labels[members] = connected_components(graph, directed=False)
+        return labels
+
+def _close_pairs(points, radius):
+    """All index pairs of points closer than radius, as an (M, 2) array."""
+    from scipy.spatial import cKDTree
+    return cKDTree(points).query_pairs(radius, output_type='ndarray').reshape(-1, 2)
+
+def build_index(cloud):
+    """GridIndex for organized clouds, KDTreeIndex otherwise."""
+    if cloud.pixel_index is not None:
+        return GridIndex(cloud)
+    return KDTreeIndex(cloud)
@@ -0,0 +1,217 @@
+"""
+Content-addressed cache of stage results for re-analysis runs
+Each entry is keyed by a hash of the stage's inputs (image pixels, logits, masked depth,
+PLY bytes) and the settings its result depends on (model, prompt, intrinsics, filter
+and threshold settings), and stored as one .npz file in STAGE_CACHE_CONFIG['dir'].
+Downstream keys hash the upstream result itself, so a changed setting only reruns the
+stages whose inputs actually changed. Entries are evicted least recently used first
+once the cache is over its size limit; a hit refreshes the entry's modification time.
+Usage: python src/wood_qa.py cache [info|clear]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from constants import STAGE_CACHE_CONFIG
+
+def digest(*values):
+    """Hex digest of arrays, bytes, strings and JSON-serialisable settings."""
+    h = hashlib.blake2b(digest_size=20)
+    for value in values:
+        if isinstance(value, np.ndarray):
+            h.update(f"{value.dtype.str}{value.shape}".encode())
+            h.update(np.ascontiguousarray(value).data)
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            h.update(value)
+        elif isinstance(value, str):
+            h.update(value.encode())
+        else:
+            h.update(json.dumps(value, sort_keys=True, default=str).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+def file_digest(path):
+    """Digest of a file's bytes."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class StageCache:
+    """Size-bounded, least-recently-used store of stage results (dicts of arrays)."""
+
+    def __init__(self, config=STAGE_CACHE_CONFIG, enabled=None):
+        self.config = config
+        self.enabled = config['enabled'] if enabled is None else enabled
+        self.dir = config['dir']
+        self.max_bytes = int(config['max_mb'] * 1e6)
+        self.lock = threading.Lock()
+        self.stats = {}  # stage -> {'hits', 'misses', 'stored', 'evicted'}
+
+    def key(self, stage, *inputs, **settings):
+        """Cache key of a stage result from its inputs and the settings it depends on."""
+        return digest(self.config['version'], stage, settings, *inputs)
+
+    def _count(self, stage, field, amount=1):
+        with self.lock:
+            counts = self.stats.setdefault(stage, {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0})
+            counts[field] += amount
+
+    def _path(self, stage, key):
+        return os.path.join(self.dir, f"{stage}-{key}.npz")
+
+    def get(self, stage, key):
+        """The stored arrays for key, or None (always None when the cache is disabled)."""
+        if not self.enabled:
+            return None
+        path = self._path(stage, key)
+        try:
+            with np.load(path) as data:
+                result = {name: data[name] for name in data.files}
+            os.utime(path)  # most recently used
+        except (OSError, ValueError):  # missing, or evicted/truncated by another process
+            self._count(stage, 'misses')
+            return None
+        self._count(stage, 'hits')
+        return result
+
+    def put(self, stage, key, **arrays):
+        """Store arrays under key, then evict old entries beyond the size limit."""
+        if not self.enabled:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        path = self._path(stage, key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.partial"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)  # uncompressed: loading is the fast path
+        os.replace(tmp_path, path)
+        self._count(stage, 'stored')
+        self.evict()
+
+    def entries(self):
+        """(modification time, size, stage, path) of every entry, oldest first."""
+        if not os.path.isdir(self.dir):
+            return []
+        found = []
+        for entry in os.scandir(self.dir):
+            if entry.name.endswith('.npz'):
+                try:
+                    status = entry.stat()
+                except OSError:
+                    continue
+                found.append((status.st_mtime, status.st_size, entry.name.split('-', 1)[0], entry.path))
+        return sorted(found)
+
+    def evict(self, max_bytes=None):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, stage, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # already evicted by another process
+            total -= size
+            self._count(stage, 'evicted')
+        return total
+
+    def summary(self):
+        """Session counts summed over stages, with a per-stage breakdown."""
+        with self.lock:
+            stages = {stage: dict(counts) for stage, counts in self.stats.items()}
+        totals = {field: sum(counts[field] for counts in stages.values())
+                  for field in ('hits', 'misses', 'stored', 'evicted')}
+        lookups = totals['hits'] + totals['misses']
+        totals['hit_rate'] = totals['hits'] / lookups if lookups else 0.0
+        totals['stages'] = stages
+        return totals
+
+    def save_stats(self):
+        """Add this session's counts to the lifetime counts in the cache directory."""
+        if not self.stats or not os.path.isdir(self.dir):
+            return
+        path = os.path.join(self.dir, self.config['stats_path'])
+        lifetime = load_stats(self.config)
+        for stage, counts in self.summary()['stages'].items():
+            saved = lifetime.setdefault(stage, {})
+            for field, value in counts.items():
+                saved[field] = saved.get(field, 0) + value
+        tmp_path = f"{path}.{os.getpid()}.partial"
+        with open(tmp_path, 'w') as f:
+            json.dump(lifetime, f, indent=2)
+        os.replace(tmp_path, path)
+
+def load_stats(config=STAGE_CACHE_CONFIG):
+    """Lifetime counts per stage, or {} if none were saved."""
+    path = os.path.join(config['dir'], config['stats_path'])
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache(enabled=None):
+    """Process-wide cache; enabled overrides STAGE_CACHE_CONFIG['enabled'] on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = StageCache(enabled=enabled)
+        elif enabled is not None:
+            _cache.enabled = enabled
+        return _cache
+
+def shutdown():
+    """Save the process-wide cache's counts. Returns its summary, or None if it was not used."""
+    if _cache is None or not _cache.enabled or not _cache.stats:
+        return None
+    _cache.save_stats()
+    return _cache.summary()
+
+def format_summary(summary):
+    """One line of hit/miss counts, e.g. for the end of a wood_qa run."""
+    stages = ", ".join(f"{stage} {counts['hits']}/{counts['hits'] + counts['misses']}"
+                       for stage, counts in summary['stages'].items())
+    return (f"Stage cache: {summary['hits']} hits, {summary['misses']} misses ({summary['hit_rate'] * 100:.0f}%), "
+            f"{summary['stored']} stored, {summary['evicted']} evicted [hits per stage: {stages}]")
+
+def main(argv=None):
+    """Show or clear the stage cache."""
+    parser = argparse.ArgumentParser(prog="wood_qa cache", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("action", nargs='?', choices=['info', 'clear'], default='info')
+    args = parser.parse_args(argv)
+
+    cache = StageCache(enabled=True)
+    if args.action == 'clear':
+        removed = len(cache.entries())
+        cache.evict(0)
+        stats_path = os.path.join(cache.dir, cache.config['stats_path'])
+        if os.path.exists(stats_path):
+            os.remove(stats_path)
+        print(f"✓ Removed {removed} entries from {cache.dir}/")
+        return
+
+    entries = cache.entries()
+    total = sum(size for _, size, _, _ in entries)
+    print(f"Stage cache {cache.dir}/: {len(entries)} entries, {total / 1e6:.1f} MB "
+          f"of {cache.max_bytes / 1e6:.0f} MB ({'enabled' if cache.config['enabled'] else 'enable with --cache'})")
+    lifetime = load_stats(cache.config)
+    for stage in sorted({stage for _, _, stage, _ in entries} | set(lifetime)):
+        sizes = [size for _, size, entry_stage, _ in entries if entry_stage == stage]
+        counts = lifetime.get(stage, {})
+        hits, misses = counts.get('hits', 0), counts.get('misses', 0)
+        rate = f"{hits / (hits + misses) * 100:.0f}%" if hits + misses else "-"
+        print(f"  {stage:8s} {len(sizes):5d} entries {sum(sizes) / 1e6:8.1f} MB, "
+              f"{hits} hits / {misses} misses ({rate}), {counts.get('evicted', 0)} evicted")
+
+if __name__ == "__main__":
+    main()
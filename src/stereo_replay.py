@@ -0,0 +1,228 @@
+"""
+Offline stereo re-processing of recorded rectified mono pairs
+image_output.py saves the rectified left/right frames of a capture (with the device's
+depth, intrinsics and baseline) when STEREO_RECORDING_CONFIG['enabled'] is set. This
+module recomputes depth from those pairs on the host with OpenCV's semi-global matcher,
+configured like each device preset (STEREO_HOST_PRESETS) with or without LR-check,
+extended disparity and subpixel. Frames are cut into horizontal strips that worker
+processes match in parallel. `compare` runs every setting on the same recordings and
+reports latency, fill rate, panel flatness and agreement with the device depth, so
+STEREO_DEPTH_CONFIG can be tuned without the camera or the panel.
+Usage: python src/wood_qa.py stereo compare [recordings...] [--presets ...] [--workers N]
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from constants import (
+    STEREO_DEPTH_CONFIG, STEREO_HOST_PRESETS, STEREO_RECORDING_CONFIG, STEREO_REPLAY_CONFIG,
+    OAK_D_LITE_BASELINE, DEPTH_CAMERA, DEPTH_SCALE
+)
+
+TOGGLES = ('left_right_check', 'extended_disparity', 'subpixel')
+TOGGLE_LABELS = {'left_right_check': 'lr', 'extended_disparity': 'ext', 'subpixel': 'sub'}
+
+def setting_name(setting):
+    flags = [TOGGLE_LABELS[toggle] for toggle in TOGGLES if setting[toggle]]
+    return " ".join([setting['preset']] + flags)
+
+def device_setting(config=STEREO_DEPTH_CONFIG):
+    """The host setting matching the device configuration in constants.py."""
+    return {'preset': config['preset'], **{toggle: bool(config[toggle]) for toggle in TOGGLES}}
+
+def settings_grid(presets=None):
+    """Every preset with every combination of LR-check, extended disparity and subpixel."""
+    settings = []
+    for preset in presets or STEREO_HOST_PRESETS:
+        for values in itertools.product((True, False), repeat=len(TOGGLES)):
+            settings.append({'preset': preset, **dict(zip(TOGGLES, values))})
+    return settings
+
+def make_matcher(setting, config=STEREO_REPLAY_CONFIG):
+    """cv2.StereoSGBM configured for a host setting."""
+    import cv2
+
+    preset = STEREO_HOST_PRESETS[setting['preset']]
+    block = preset['block_size']
+    num_disparities = config['num_disparities'] * (2 if setting['extended_disparity'] else 1)
+    return cv2.StereoSGBM_create(
+        minDisparity=0,
+        numDisparities=-(-num_disparities // 16) * 16,
+        blockSize=block,
+        P1=preset['p1'] * block * block,
+        P2=preset['p2'] * block * block,
+        disp12MaxDiff=1 if setting['left_right_check'] else -1,
+        uniquenessRatio=preset['uniqueness'],
+        speckleWindowSize=preset['speckle_window'],
+        speckleRange=preset['speckle_range'],
+        mode=cv2.STEREO_SGBM_MODE_SGBM,
+    )
+
+def _match_strip(task):
+    """Disparity (pixels, 0 where invalid) of one strip, referenced to the right image like
+    the device depth: matching the mirrored pair makes the right image the reference."""
+    left, right, setting = task
+    raw = make_matcher(setting).compute(np.ascontiguousarray(right[:, ::-1]), np.ascontiguousarray(left[:, ::-1]))
+    raw = raw[:, ::-1]
+    disparity = np.where(raw > 0, raw.astype(np.float32) / 16.0, 0.0).astype(np.float32)
+    if not setting['subpixel']:
+        np.floor(disparity, out=disparity)
+    return disparity
+
+class StereoEngine:
+    """Host stereo matcher that splits frames into strips matched by worker processes."""
+
+    def __init__(self, workers=STEREO_REPLAY_CONFIG['workers'], tiles=STEREO_REPLAY_CONFIG['tiles'],
+                 overlap=STEREO_REPLAY_CONFIG['tile_overlap']):
+        self.workers = max(1, workers)
+        self.tiles = max(1, tiles)
+        self.overlap = overlap
+        self.executor = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def strips(self, height):
+        """(start, stop, padded start, padded stop) rows of each strip."""
+        bounds = np.linspace(0, height, self.tiles + 1).astype(int)
+        return [(start, stop, max(0, start - self.overlap), min(height, stop + self.overlap))
+                for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+    def disparity(self, left, right, setting):
+        """Disparity in pixels (float32, 0 where invalid) of a rectified pair."""
+        strips = self.strips(left.shape[0])
+        tasks = [(left[top:bottom], right[top:bottom], setting) for _, _, top, bottom in strips]
+        results = self.executor.map(_match_strip, tasks) if self.executor else map(_match_strip, tasks)
+        disparity = np.empty(left.shape[:2], dtype=np.float32)
+        for (start, stop, top, _), strip in zip(strips, results):
+            disparity[start:stop] = strip[start - top:stop - top]
+        return disparity
+
+    def depth(self, left, right, setting, fx, baseline):
+        """uint16 depth (like the device's, in DEPTH_SCALE units) of a rectified pair."""
+        disparity = self.disparity(left, right, setting)
+        depth = np.zeros(disparity.shape, dtype=np.float32)
+        valid = disparity > 0
+        depth[valid] = fx * baseline / DEPTH_SCALE / disparity[valid]
+        return np.clip(np.rint(depth), 0, np.iinfo(np.uint16).max).astype(np.uint16)
+
+def recording_geometry(mxid=None):
+    """(intrinsics, baseline in meters) from the calibration cache, or the OAK-D Lite defaults."""
+    from calibration import get_intrinsics, get_extrinsics
+
+    intrinsics = get_intrinsics(DEPTH_CAMERA, mxid=mxid)
+    extrinsics = get_extrinsics('left_to_right', mxid=mxid)
+    baseline = float(np.linalg.norm(np.asarray(extrinsics)[:3, 3])) if extrinsics is not None else OAK_D_LITE_BASELINE
+    return intrinsics, baseline
+
+def save_recording(left, right, depth, intrinsics, baseline, directory=STEREO_RECORDING_CONFIG['dir'], meta=None):
+    """Store a rectified pair with the device depth and geometry as one .npz. Returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime("pair_%Y%m%d_%H%M%S") + f"_{int(time.time() * 1000) % 1000:03d}.npz")
+    info = {'intrinsics': {key: float(intrinsics[key]) for key in ('fx', 'fy', 'cx', 'cy')},
+            'baseline': float(baseline), 'stereo_config': dict(STEREO_DEPTH_CONFIG), **(meta or {})}
+    np.savez_compressed(path, left=left, right=right, depth=depth if depth is not None else np.zeros(0),
+                        info=np.array(json.dumps(info)))
+    return path
+
+def load_recording(path):
+    """{'left', 'right', 'depth' (None if not recorded), 'intrinsics', 'baseline', ...}."""
+    with np.load(path) as data:
+        recording = json.loads(str(data['info']))
+        recording.update(left=data['left'], right=data['right'], depth=data['depth'] if data['depth'].size else None)
+    return recording
+
+def evaluate(depth, intrinsics, reference=None, roi=STEREO_REPLAY_CONFIG['roi']):
+    """Fill rate and flatness (plane-fit residual std-dev) of the central ROI, plus the median
+    absolute difference from a reference depth where both are valid (None without one)."""
+    from deviation import fit_plane, compute_deviations
+    from point_cloud import PointCloud
+
+    height, width = depth.shape
+    top, left = int(height * (1 - roi) / 2), int(width * (1 - roi) / 2)
+    central = np.zeros_like(depth)
+    central[top:height - top, left:width - left] = depth[top:height - top, left:width - left]
+    n_valid = int(np.count_nonzero(central))
+    result = {'fill': n_valid / max(1, (height - 2 * top) * (width - 2 * left)), 'std_mm': None, 'vs_device_mm': None}
+    if n_valid >= 3:
+        points = PointCloud.from_depth(central, intrinsics, DEPTH_SCALE).points
+        result['std_mm'] = float(np.std(compute_deviations(points, fit_plane(points)))) * 1000
+    if reference is not None:
+        both = (depth > 0) & (reference > 0)
+        if both.any():
+            difference = np.abs(depth[both].astype(np.float32) - reference[both].astype(np.float32))
+            result['vs_device_mm'] = float(np.median(difference)) * DEPTH_SCALE * 1000
+    return result
+
+def compare(paths, settings, engine):
+    """Run every setting on every recording. Returns one summary dict per setting."""
+    recordings = [load_recording(path) for path in paths]
+    rows = []
+    for setting in settings:
+        runs = []
+        for recording in recordings:
+            start = time.perf_counter()
+            depth = engine.depth(recording['left'], recording['right'], setting,
+                                 recording['intrinsics']['fx'], recording['baseline'])
+            latency_ms = (time.perf_counter() - start) * 1000
+            runs.append({'latency_ms': latency_ms, **evaluate(depth, recording['intrinsics'], recording['depth'])})
+
+        def mean(key):
+            values = [run[key] for run in runs if run[key] is not None]
+            return float(np.mean(values)) if values else None
+        rows.append({'setting': setting_name(setting), **{key: mean(key) for key in runs[0]}})
+    return rows
+
+def format_value(value, spec):
+    return format(value, spec) if value is not None else "-".rjust(len(format(0.0, spec)))
+
+def main(argv=None):
+    """Batch-compare stereo settings on recorded pairs."""
+    parser = argparse.ArgumentParser(description="Offline stereo re-processing of recorded mono pairs")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    compare_parser = subparsers.add_parser("compare", help="Compare stereo settings on recordings")
+    compare_parser.add_argument("recordings", nargs="*",
+                                help=f"Recorded .npz pairs (default: all in {STEREO_RECORDING_CONFIG['dir']}/)")
+    compare_parser.add_argument("--presets", nargs="+", choices=list(STEREO_HOST_PRESETS))
+    compare_parser.add_argument("--device-only", action="store_true",
+                                help="Only the setting matching STEREO_DEPTH_CONFIG")
+    compare_parser.add_argument("--workers", type=int, default=STEREO_REPLAY_CONFIG['workers'])
+    compare_parser.add_argument("--tiles", type=int, default=STEREO_REPLAY_CONFIG['tiles'])
+    args = parser.parse_args(argv)
+
+    paths = args.recordings or sorted(glob.glob(os.path.join(STEREO_RECORDING_CONFIG['dir'], "*.npz")))
+    if not paths:
+        print(f"✗ No recordings found; set STEREO_RECORDING_CONFIG['enabled'] and run a capture first")
+        sys.exit(1)
+    settings = [device_setting()] if args.device_only else settings_grid(args.presets)
+
+    print(f"Comparing {len(settings)} stereo setting(s) on {len(paths)} recording(s) "
+          f"({args.workers} workers, {args.tiles} strips per frame)")
+    with StereoEngine(args.workers, args.tiles) as engine:
+        rows = compare(paths, settings, engine)
+
+    current = setting_name(device_setting())
+    print(f"\n{'setting':32s} {'latency':>9s} {'fill':>6s} {'flat std':>9s} {'vs device':>10s}")
+    for row in sorted(rows, key=lambda row: row['latency_ms']):
+        marker = " *" if row['setting'] == current else ""
+        print(f"{row['setting']:32s} {row['latency_ms']:7.1f}ms {row['fill'] * 100:5.1f}% "
+              f"{format_value(row['std_mm'], '7.3f')}mm {format_value(row['vs_device_mm'], '8.3f')}mm{marker}")
+    print("\n* current STEREO_DEPTH_CONFIG; flat std is the plane-fit residual in the central region "
+          "(lower is better on a flat panel)")
+
+if __name__ == "__main__":
+    main()
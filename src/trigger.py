@@ -0,0 +1,338 @@
+"""
+Panel-arrival trigger mode: inspect each panel once as it arrives
+Frames stream from the camera (or a recorded session) and a trigger decides when a panel
+is in place: either the downscaled depth shows an object above the belt, centred in view
+(presence mode), or an external controller sends a UDP datagram (socket mode). Each
+trigger picks the best synchronized frame, assigns a panel ID, runs the inspection and
+logs the verdict with its trigger-to-verdict latency; the session ends with panels per
+minute and latency percentiles.
+Usage: python src/wood_qa.py trigger run [--replay SESSION_DIR] [--mode presence|socket] [--mask clipseg|depth]
+       python src/wood_qa.py trigger send [--panel-id ID]   (trigger stand-in)
+"""
+
+import argparse
+import collections
+import glob
+import json
+import os
+import socket
+import sys
+import time
+import warnings
+import numpy as np
+from constants import TRIGGER_CONFIG
+
+class PresenceDetector:
+    """Detects a panel above the belt, centred in view, on a downscaled depth stream."""
+
+    def __init__(self, config=TRIGGER_CONFIG):
+        self.config = config
+        self.step = config['downscale']
+        self.background = None       # belt depth per downscaled cell (0: never valid)
+        self._calibration = []
+        self._background_full = None
+        self.previous = None
+        self.armed = True
+        self.settled = 0
+        self.absent = 0
+        self.motion = 0.0            # mean depth change of the object since the previous frame
+        self.fill = 0.0
+
+    def observe(self, depth):
+        """Feed a depth frame. Returns True on the frame where a panel has been centred for
+        settle_frames frames (once per panel; it re-arms after the panel leaves)."""
+        config = self.config
+        small = depth[::self.step, ::self.step].astype(np.float32)
+        if self.background is None:
+            self._calibration.append(small)
+            if len(self._calibration) == config['background_frames']:
+                stack = np.stack(self._calibration)
+                stack[stack == 0] = np.nan
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", RuntimeWarning)  # cells that never had depth
+                    self.background = np.nan_to_num(np.nanmedian(stack, axis=0))
+                self._calibration = []
+            return False
+
+        above = (small > 0) & (small < self.background - config['min_height_mm'])
+        self.fill = float(np.count_nonzero(above)) / max(1, np.count_nonzero(self.background))
+        self.motion = float(np.abs(small - self.previous)[above].mean()) \
+            if self.previous is not None and above.any() else 0.0
+        self.previous = small
+
+        centred = False
+        if self.fill >= config['min_fill']:
+            self.absent = 0
+            rows, cols = np.nonzero(above)
+            offset_y = rows.mean() / above.shape[0] - 0.5
+            offset_x = cols.mean() / above.shape[1] - 0.5
+            centred = max(abs(offset_y), abs(offset_x)) <= config['center_tolerance']
+        else:
+            self.absent += 1
+            if self.absent >= config['rearm_frames']:
+                self.armed = True
+
+        self.settled = self.settled + 1 if centred and self.armed else 0
+        if self.settled >= config['settle_frames']:
+            self.armed = False
+            self.settled = 0
+            return True
+        return False
+
+    def panel_mask(self, depth):
+        """0/255 mask of the full-resolution depth pixels above the belt."""
+        if self._background_full is None or self._background_full.shape != depth.shape:
+            background = np.repeat(np.repeat(self.background, self.step, axis=0), self.step, axis=1)
+            self._background_full = background[:depth.shape[0], :depth.shape[1]]
+        above = (depth > 0) & (depth < self._background_full - self.config['min_height_mm'])
+        return above.astype(np.uint8) * 255
+
+class SocketTrigger:
+    """Non-blocking UDP listener; each datagram is one trigger (its text, if any, is the panel ID)."""
+
+    def __init__(self, host=TRIGGER_CONFIG['host'], port=TRIGGER_CONFIG['port']):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+
+    def poll(self):
+        """[(receive time, panel ID or None), ...] of the triggers received since the last poll."""
+        triggers = []
+        while True:
+            try:
+                message = self.sock.recv(1024)
+            except BlockingIOError:
+                return triggers
+            triggers.append((time.time(), message.decode("utf-8", "replace").strip() or None))
+
+    def close(self):
+        self.sock.close()
+
+def send_trigger(panel_id=None, host=TRIGGER_CONFIG['host'], port=TRIGGER_CONFIG['port']):
+    """Send one trigger datagram, like a PLC would."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto((panel_id or "").encode("utf-8"), (host, port))
+
+def replay_frames(session, fps=None):
+    """Frames of a recorded session (a directory of .npz files with 'rgb', 'depth' and
+    optionally 'timestamp'), paced at fps, at the recorded pace (fps None) or flat out (0)."""
+    paths = sorted(glob.glob(os.path.join(session, "*.npz")))
+    if not paths:
+        raise FileNotFoundError(f"no .npz frames in {session}")
+    start, first_recorded = time.time(), None
+    for index, path in enumerate(paths):
+        with np.load(path) as data:
+            frame = {'rgb': data['rgb'], 'depth': data['depth'], 'source': os.path.basename(path)}
+            recorded = float(data['timestamp']) if 'timestamp' in data else None
+        if fps is None and recorded is not None:
+            first_recorded = recorded if first_recorded is None else first_recorded
+            time.sleep(max(0.0, start + recorded - first_recorded - time.time()))
+        elif fps:
+            time.sleep(max(0.0, start + index / fps - time.time()))
+        frame['timestamp'] = time.time()
+        yield frame
+
+def save_frame(frame, directory):
+    """Append a frame to a recorded session."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"frame_{int(frame['timestamp'] * 1000):015d}.npz")
+    np.savez(path, rgb=frame_rgb(frame), depth=frame['depth'], timestamp=frame['timestamp'])
+
+def live_frames(rgb_history=8):
+    """Frames from the first connected camera. Each depth frame is paired with the RGB frame
+    closest to it in device time; RGB is only decoded for frames that are used."""
+    import depthai as dai
+    from image_output import create_camera_pipeline, detect_camera
+
+    device_info = detect_camera(dai)
+    pipeline = create_camera_pipeline(dai) if device_info else None
+    if pipeline is None:
+        raise RuntimeError("no camera or pipeline")
+    with dai.Device(device_info) as device:
+        device.startPipeline(pipeline)
+        rgb_queue = device.getOutputQueue(name="rgb", maxSize=4, blocking=False)
+        depth_queue = device.getOutputQueue(name="depth", maxSize=4, blocking=False)
+        rgb_packets = collections.deque(maxlen=rgb_history)
+        while True:
+            rgb_packets.extend(rgb_queue.tryGetAll())
+            depth_packet = depth_queue.tryGet()
+            if depth_packet is None or not rgb_packets:
+                time.sleep(0.002)
+                continue
+            stamp = depth_packet.getTimestamp()
+            rgb_packet = min(rgb_packets, key=lambda packet: abs(packet.getTimestamp() - stamp))
+            yield {'depth': depth_packet.getFrame(), 'rgb_packet': rgb_packet, 'timestamp': time.time(),
+                   'source': device.getMxId()}
+
+def frame_rgb(frame):
+    """RGB array of a frame, decoding the camera packet on first use."""
+    if frame.get('rgb') is None:
+        import cv2
+        frame['rgb'] = cv2.cvtColor(frame.pop('rgb_packet').getCvFrame(), cv2.COLOR_BGR2RGB)
+    return frame['rgb']
+
+class TriggerSession:
+    """Runs the trigger loop over a frame stream and keeps per-panel results."""
+
+    def __init__(self, inspect, mode=TRIGGER_CONFIG['mode'], detector=None, listener=None,
+                 log_path=TRIGGER_CONFIG['log_path'], record=None):
+        self.inspect = inspect              # function(frame) -> result dict with 'verdict'
+        self.mode = mode
+        self.detector = detector or PresenceDetector()
+        self.listener = listener
+        self.log_path = log_path
+        self.record = record
+        self.results = []
+        self.started = None
+        self.session_id = time.strftime("%Y%m%d-%H%M%S")
+
+    def next_panel_id(self):
+        return f"{self.session_id}-{len(self.results) + 1:04d}"
+
+    def run(self, frames, max_panels=None):
+        """Process frames until they run out, max_panels are inspected, or Ctrl-C."""
+        recent = collections.deque(maxlen=self.detector.config['settle_frames'])
+        pending = collections.deque()  # socket triggers waiting for a frame captured after them
+        self.started = time.time()
+        try:
+            for frame in frames:
+                if self.record:
+                    save_frame(frame, self.record)
+                triggered = self.detector.observe(frame['depth'])
+                recent.append((self.detector.motion, frame))
+                if self.mode == 'presence' and triggered:
+                    # The stillest of the settled frames has the least motion blur and stereo smear
+                    _, best = min(recent, key=lambda entry: entry[0])
+                    self.inspect_panel(best, time.time(), None)
+                elif self.mode == 'socket':
+                    pending.extend(self.listener.poll())
+                    while pending and frame['timestamp'] >= pending[0][0]:
+                        trigger_time, panel_id = pending.popleft()
+                        self.inspect_panel(frame, trigger_time, panel_id)
+                if max_panels is not None and len(self.results) >= max_panels:
+                    break
+        except KeyboardInterrupt:
+            print("\nStopping")
+        return self.summary()
+
+    def inspect_panel(self, frame, trigger_time, panel_id):
+        """Inspect one triggered frame and log the result. A panel that cannot be inspected
+        is logged as an ERROR entry and the session goes on with the next one."""
+        panel_id = panel_id or self.next_panel_id()
+        try:
+            result = self.inspect(frame)
+        except Exception as e:
+            result = {'verdict': 'ERROR', 'error': str(e)}
+        verdict_time = time.time()
+        entry = {
+            'panel_id': panel_id, 'trigger': self.mode, 'source': frame.get('source'),
+            'trigger_time': trigger_time, 'frame_age_ms': (trigger_time - frame['timestamp']) * 1000,
+            'latency_ms': (verdict_time - trigger_time) * 1000,
+            **{key: value for key, value in result.items() if key != 'mask_png'},
+        }
+        self.results.append(entry)
+        if self.log_path:
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        std = f", std-dev {entry['std_dev'] * 1000:.3f} mm" if entry.get('std_dev') is not None else ""
+        error = f" ({entry['error']})" if entry.get('error') else ""
+        print(f"  {'✗ ' if entry['verdict'] == 'ERROR' else ''}{panel_id}: {entry['verdict']}{error}{std}, "
+              f"trigger to verdict {entry['latency_ms']:.0f} ms")
+        return entry
+
+    def summary(self):
+        """Panel count, panels per minute and trigger-to-verdict latency percentiles."""
+        elapsed = time.time() - self.started if self.started else 0.0
+        latencies = np.array([entry['latency_ms'] for entry in self.results])
+        summary = {'panels': len(self.results), 'elapsed_s': elapsed,
+                   'errors': sum(1 for entry in self.results if entry['verdict'] == 'ERROR'),
+                   'panels_per_min': len(self.results) / elapsed * 60 if elapsed > 0 else 0.0}
+        if latencies.size:
+            summary.update({'latency_p50_ms': float(np.percentile(latencies, 50)),
+                            'latency_p95_ms': float(np.percentile(latencies, 95)),
+                            'latency_max_ms': float(latencies.max())})
+        return summary
+
+def depth_inspector(detector):
+    """Inspection that masks the panel by its height above the belt (no segmentation model)."""
+    from compact_mask import CompactMask
+    from inspection_service import FrameAnalyzer
+
+    analyzer = FrameAnalyzer()
+
+    def inspect(frame):
+        start = time.perf_counter()
+        mask = CompactMask.from_array(detector.panel_mask(frame['depth']))
+        result = analyzer.analyze({'depth': frame['depth']}, mask)
+        result['inspect_ms'] = (time.perf_counter() - start) * 1000
+        return result
+    return inspect
+
+def model_inspector(local_files_only=True):
+    """Inspection with CLIPSeg segmentation, like the inspection service."""
+    from inspection_service import InspectionEngine
+
+    engine = InspectionEngine(local_files_only=local_files_only)
+
+    def inspect(frame):
+        start = time.perf_counter()
+        request = {'rgb': frame_rgb(frame), 'depth': frame['depth'], 'stream': 'trigger'}  # one camera
+        result = engine.process_batch([request])[0]
+        if isinstance(result, Exception):  # the frame could not be analyzed
+            raise result
+        result['inspect_ms'] = (time.perf_counter() - start) * 1000
+        return result
+    return inspect
+
+def main(argv=None):
+    """Run the trigger loop, or send a stand-in trigger."""
+    parser = argparse.ArgumentParser(description="Panel-arrival trigger mode")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    run_parser = subparsers.add_parser("run", help="Inspect each arriving panel")
+    run_parser.add_argument("--mode", choices=["presence", "socket"], default=TRIGGER_CONFIG['mode'])
+    run_parser.add_argument("--mask", choices=["clipseg", "depth"], default="clipseg",
+                            help="Segment with CLIPSeg or take the pixels above the belt")
+    run_parser.add_argument("--replay", metavar="SESSION_DIR", help="Replay a recorded session instead of the camera")
+    run_parser.add_argument("--fps", type=float, default=None, help="Replay rate (default: as recorded, 0: flat out)")
+    run_parser.add_argument("--record", metavar="SESSION_DIR", help="Record the camera frames as a session")
+    run_parser.add_argument("--max-panels", type=int, default=None)
+    send_parser = subparsers.add_parser("send", help="Send a trigger to a running session (PLC stand-in)")
+    send_parser.add_argument("--panel-id", default=None)
+    args = parser.parse_args(argv)
+
+    if args.action == "send":
+        send_trigger(args.panel_id)
+        print(f"✓ Trigger sent to {TRIGGER_CONFIG['host']}:{TRIGGER_CONFIG['port']}")
+        return
+
+    detector = PresenceDetector()
+    try:
+        inspect = depth_inspector(detector) if args.mask == "depth" else model_inspector()
+    except Exception as e:
+        print(f"✗ Error loading the inspection: {e}")
+        sys.exit(1)
+    listener = SocketTrigger() if args.mode == "socket" else None
+    frames = replay_frames(args.replay, args.fps) if args.replay else live_frames()
+    session = TriggerSession(inspect, args.mode, detector, listener, record=args.record)
+
+    print(f"Waiting for panels ({args.mode} trigger, {args.mask} mask); "
+          f"the first {TRIGGER_CONFIG['background_frames']} frames must show the empty belt")
+    try:
+        summary = session.run(frames, args.max_panels)
+    except Exception as e:
+        print(f"✗ Error in the trigger loop: {e}")
+        sys.exit(1)
+    finally:
+        if listener is not None:
+            listener.close()
+
+    print(f"\n{summary['panels']} panel(s) in {summary['elapsed_s']:.1f} s ({summary['panels_per_min']:.1f} panels/min)")
+    if summary['errors']:
+        print(f"✗ {summary['errors']} panel(s) could not be inspected (verdict ERROR in the log)")
+    if summary['panels']:
+        print(f"Trigger to verdict: p50 {summary['latency_p50_ms']:.0f} ms, p95 {summary['latency_p95_ms']:.0f} ms, "
+              f"max {summary['latency_max_ms']:.0f} ms")
+        print(f"✓ Results logged to {TRIGGER_CONFIG['log_path']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Unified entry point for the Wood Warping Detection System
+Usage: python src/wood_qa.py [--profile [--memory-budget MB]] [--cache] {capture,segment,cloud,deviation,inspect,multi,defects,archive,serve,compile,regress,stereo,trigger,cache}
+Stage modules (and with them depthai, torch, transformers, cv2) are only
+imported once the selected subcommand needs them
+"""
+
+import argparse
+import contextlib
+import importlib
+import sys
+import time
+
+# Stage modules each subcommand needs, in the order they run
+STAGE_MODULES = {
+    'capture': ['image_output'],
+    'segment': ['extract_wood'],
+    'cloud': ['depth_to_cloud'],
+    'deviation': ['deviation'],
+    'inspect': ['extract_wood', 'depth_to_cloud', 'deviation'],
+    'multi': ['multi_camera'],
+    'defects': ['local_defects'],
+    'archive': ['cloud_archive'],
+    'serve': ['inspection_service'],
+    'compile': ['compiled_model'],
+    'regress': ['regression'],
+    'stereo': ['stereo_replay'],
+    'trigger': ['trigger'],
+    'cache': ['stage_cache'],
+}
+
+# Subcommands whose remaining command line options are passed on to the stage's main()
+PASSTHROUGH_COMMANDS = {'multi', 'archive', 'serve', 'compile', 'regress', 'stereo', 'trigger', 'cache'}
+
+COMMAND_HELP = {
+    'capture': "Capture RGB and depth from OAK-D Lite and save pngs",
+    'segment': "Segment the wood panel from RGB and mask the depth map",
+    'cloud': "Convert the masked depth map to a point cloud (PLY)",
+    'deviation': "Fit a plane to the point cloud and report flatness",
+    'inspect': "Run segment, cloud and deviation back to back",
+    'multi': "Capture from every connected camera and inspect the merged cloud",
+    'defects': "Find local defects (bulges, cracks, chipped edges) in the masked depth map",
+    'archive': "Convert point clouds to and from the compressed .wqc archive format",
+    'serve': "Keep CLIPSeg loaded and serve inspection requests over local HTTP",
+    'compile': "Save CLIPSeg as a self-contained artifact for fast offline loading",
+    'regress': "Check every stage against the golden fixtures and its timing history",
+    'stereo': "Recompute depth from recorded mono pairs with different stereo settings",
+    'trigger': "Inspect each panel as it arrives, on belt presence or an external trigger",
+    'cache': "Show or clear the stage result cache used by --cache re-analysis runs",
+}
+
+def import_stage(command):
+    """Import the stage modules needed by a subcommand and return them in run order."""
+    return [importlib.import_module(name) for name in STAGE_MODULES[command]]
+
+def build_parser():
+    """Create the argument parser with one subparser per pipeline stage."""
+    parser = argparse.ArgumentParser(prog="wood_qa", description="Wood Warping Detection System")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record peak RSS and top allocators per stage and check memory budgets")
+    parser.add_argument("--memory-budget", type=float, default=None, metavar="MB",
+                        help="Overall peak RSS budget for --profile (default: MEMORY_PROFILE_CONFIG)")
+    parser.add_argument("--cache", action="store_true",
+                        help="Reuse stage results (logits, masks, clouds, fits) whose inputs and settings are unchanged")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+    for command, help_text in COMMAND_HELP.items():
+        subparser = subparsers.add_parser(command, help=help_text)
+        if command in PASSTHROUGH_COMMANDS:
+            subparser.add_argument("stage_args", nargs=argparse.REMAINDER, help="Options for the stage")
+    return parser
+
+def main(argv=None):
+    """Parse arguments and run the selected subcommand."""
+    parser = build_parser()
+    # argparse.REMAINDER does not pick up options (--no-segment) right after a subcommand,
+    # so passthrough stages get everything after the subcommand name, in order
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args, extra_args = parser.parse_known_args(argv)
+    stage_args = None
+    if args.command in PASSTHROUGH_COMMANDS:
+        stage_args = argv[argv.index(args.command) + 1:]
+        if stage_args[:1] == ['--']:
+            stage_args = stage_args[1:]
+    elif extra_args:
+        parser.error(f"unrecognized arguments: {' '.join(extra_args)}")
+
+    start_time = time.time()
+    profiler = None
+    if args.profile:
+        from profiling import MemoryProfiler
+        profiler = MemoryProfiler()
+
+    # Thread pools size themselves on import, so the budgets are set before any stage loads
+    # (stage_cache imports numpy)
+    import resources
+    resources.configure_process(STAGE_MODULES[args.command])
+
+    if args.cache:
+        import stage_cache
+        stage_cache.get_cache(enabled=True)
+
+    for name in STAGE_MODULES[args.command]:
+        # Profiled stages include their imports (torch dominates the segment stage)
+        with profiler.stage(name) if profiler else contextlib.nullcontext():
+            module = importlib.import_module(name)
+            resources.apply_budget(name)
+            if stage_args is None:
+                module.main()
+            else:
+                module.main(stage_args)
+
+    elapsed_time = time.time() - start_time
+    print(f"Total execution time: {elapsed_time:.2f} seconds")
+
+    # Artifacts are written in the background after the verdict; wait for them before exiting
+    if 'artifact_writer' in sys.modules:
+        stats = sys.modules['artifact_writer'].shutdown()
+        if stats:
+            shed = f", {stats['shed']} skipped (queue full)" if stats['shed'] else ""
+            shed += f", {stats['superseded']} replaced by newer writes" if stats['superseded'] else ""
+            print(f"Artifacts: {stats['written']} written{shed}, longest queue wait {stats['max_wait_ms']:.0f} ms")
+    if 'stage_cache' in sys.modules:
+        summary = sys.modules['stage_cache'].shutdown()
+        if summary:
+            print(sys.modules['stage_cache'].format_summary(summary))
+
+    if profiler:
+        profiler.report()
+        print(f"\nSaved memory profile to {profiler.save()}")
+        violations = profiler.check_budget(args.memory_budget)
+        for violation in violations:
+            print(f"✗ Over memory budget - {violation}")
+        if violations:
+            return 1
+        print("✓ All stages within memory budget")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Reusable per-frame buffers for the geometry path in continuous operation
+A FrameWorkspace is sized once for the configured depth resolution. Back-projection,
+plane fitting and residuals then write into its buffers with out= ufuncs, so
+steady-state frames allocate no array memory (only small view objects)
+Results are views into the workspace and are overwritten by the next frame
+"""
+
+import numpy as np
+from point_cloud import PointCloud
+from constants import CAMERA_RESOLUTION, SENSOR_RESOLUTION_SIZES, DEPTH_SCALE
+
+class FrameWorkspace:
+    """Preallocated buffers for back-projection, plane fitting and residuals."""
+
+    def __init__(self, resolution=CAMERA_RESOLUTION['mono']):
+        width, height = SENSOR_RESOLUTION_SIZES[resolution]
+        self.allocations = 0  # buffer (re)allocations, for checking steady-state reuse
+        self._rays_key = None
+        self._allocate((height, width))
+
+    def _allocate(self, shape):
+        self.shape = tuple(shape)
+        size = shape[0] * shape[1]
+        # Point buffers have one extra slot that invalid pixels are scattered into
+        self.pixels = np.arange(size, dtype=np.int32)
+        self.valid = np.empty(size, dtype=bool)
+        self.invalid = np.empty(size, dtype=bool)
+        self.target = np.empty(size, dtype=np.intp)    # output slot of each pixel
+        self.ray_x = np.empty(size, dtype=np.float32)  # (u - cx) / fx per pixel, or the ray table's x/z
+        self.ray_y = np.empty(size, dtype=np.float32)  # (v - cy) / fy per pixel, or the ray table's y/z
+        self.xyz = np.empty((3, size + 1), dtype=np.float32)
+        self.pixel_index = np.empty(size + 1, dtype=np.int32)
+        self.depth = {}                                # compacted raw depth, per input dtype
+        self.window_depth = {}                         # depth inside a window, per input dtype
+        self.window_ray_x = np.empty(size, dtype=np.float32)
+        self.window_ray_y = np.empty(size, dtype=np.float32)
+        self.window_pixels = np.empty(size, dtype=np.int32)
+        self.weights = np.empty(size, dtype=np.float64)
+        self.dx = np.empty(size, dtype=np.float64)
+        self.dy = np.empty(size, dtype=np.float64)
+        self.dz = np.empty(size, dtype=np.float64)
+        self.scratch = np.empty(size, dtype=np.float64)
+        self.residuals = np.empty(size, dtype=np.float64)
+        self._rays_key = None
+        self.allocations += 1
+
+    def _depth_buffer(self, dtype, buffers=None, extra=1):
+        buffers = self.depth if buffers is None else buffers
+        if dtype not in buffers:
+            buffers[dtype] = np.empty(self.valid.size + extra, dtype=dtype)
+            self.allocations += 1
+        return buffers[dtype]
+
+    def _window_inputs(self, depth_map, window):
+        """Depth, rays and pixel indices of the pixels inside window, copied into the window
+        buffers so the compaction below runs on window-sized arrays."""
+        top, left, bottom, right = window
+        height, width = bottom - top, right - left
+        size = height * width
+        flat = self._depth_buffer(depth_map.dtype, self.window_depth, 0)[:size]
+        np.copyto(flat.reshape(height, width), depth_map[top:bottom, left:right])
+        buffers = []
+        for source, target in ((self.ray_x, self.window_ray_x), (self.ray_y, self.window_ray_y),
+                               (self.pixels, self.window_pixels)):
+            np.copyto(target[:size].reshape(height, width), source.reshape(self.shape)[top:bottom, left:right])
+            buffers.append(target[:size])
+        return (flat, *buffers)
+
+    def _update_rays(self, intrinsics, rays=None):
+        if rays is not None:
+            key = (self.shape, id(rays))
+            if key == self._rays_key:
+                return
+            if rays.shape[1:] != self.shape:
+                raise ValueError(f"ray table {rays.shape[1:]} does not match depth {self.shape}")
+            np.copyto(self.ray_x, rays[0].reshape(-1))
+            np.copyto(self.ray_y, rays[1].reshape(-1))
+            self._rays_key = key
+            return
+        key = (self.shape, intrinsics['fx'], intrinsics['fy'], intrinsics['cx'], intrinsics['cy'])
+        if key == self._rays_key:
+            return
+        height, width = self.shape
+        v, u = np.divmod(self.pixels, width)
+        np.subtract(u, intrinsics['cx'], out=self.ray_x, casting='unsafe')
+        self.ray_x /= intrinsics['fx']
+        np.subtract(v, intrinsics['cy'], out=self.ray_y, casting='unsafe')
+        self.ray_y /= intrinsics['fy']
+        self._rays_key = key
+
+    def back_project(self, depth_map, intrinsics, depth_scale=DEPTH_SCALE, rays=None, window=None):
+        """PointCloud of the non-zero depth pixels, as views into the workspace buffers.
+        rays: optional undistorted ray table (ray_table.py) instead of the pinhole model
+        window: optional (top, left, bottom, right) region holding all valid depth (e.g. the
+        padded panel bbox); only its pixels are scanned, with the same result"""
+        if depth_map.shape[:2] != self.shape:
+            self._allocate(depth_map.shape[:2])
+        self._update_rays(intrinsics, rays)
+
+        if window is None:
+            flat, ray_x, ray_y, pixels = depth_map.reshape(-1), self.ray_x, self.ray_y, self.pixels
+        else:
+            flat, ray_x, ray_y, pixels = self._window_inputs(depth_map, window)
+        size = flat.size
+        valid, invalid, target = self.valid[:size], self.invalid[:size], self.target[:size]
+
+        # Compact the valid pixels by scattering each one to its running-count slot.
+        # Boolean indexing and np.compress would allocate an index array every frame
+        np.not_equal(flat, 0, out=valid)
+        np.logical_not(valid, out=invalid)
+        np.copyto(target, valid)
+        np.cumsum(target, out=target)  # in place; cumsum straight from bool makes a copy
+        n = int(target[-1]) if size else 0
+        target -= 1
+        np.copyto(target, size, where=invalid)  # the spare slot
+
+        raw = self._depth_buffer(flat.dtype)
+        np.put(raw, target, flat, mode='clip')
+        np.put(self.xyz[0], target, ray_x, mode='clip')
+        np.put(self.xyz[1], target, ray_y, mode='clip')
+        np.put(self.pixel_index, target, pixels, mode='clip')
+
+        xyz = self.xyz[:, :n]
+        # Widen then scale in place: mixed-dtype ufuncs allocate casting buffers
+        np.copyto(xyz[2], raw[:n], casting='unsafe')
+        xyz[2] *= depth_scale
+        xyz[0] *= xyz[2]
+        xyz[1] *= xyz[2]
+        return PointCloud(xyz, self.pixel_index[:n], self.shape)
+
+    def fit_plane(self, cloud, weights=None):
+        """Least-squares plane z = ax + by + c (same result as deviation.fit_plane) from the
+        centered second moments, solved in closed form."""
+        n = len(cloud)
+        dx, dy, dz, tmp = self.dx[:n], self.dy[:n], self.dz[:n], self.scratch[:n]
+        np.copyto(dx, cloud.x)
+        np.copyto(dy, cloud.y)
+        np.copyto(dz, cloud.z)
+
+        if weights is None:
+            mx, my, mz = dx.sum() / n, dy.sum() / n, dz.sum() / n
+        else:
+            w = self.weights[:n]
+            np.copyto(w, weights)
+            total = w.sum()
+            mx, my, mz = np.dot(w, dx) / total, np.dot(w, dy) / total, np.dot(w, dz) / total
+        dx -= mx
+        dy -= my
+        dz -= mz
+
+        if weights is None:
+            sxx, sxy, sxz = np.dot(dx, dx), np.dot(dx, dy), np.dot(dx, dz)
+            syy, syz = np.dot(dy, dy), np.dot(dy, dz)
+        else:
+            np.multiply(w, dx, out=tmp)
+            sxx, sxy, sxz = np.dot(tmp, dx), np.dot(tmp, dy), np.dot(tmp, dz)
+            np.multiply(w, dy, out=tmp)
+            syy, syz = np.dot(tmp, dy), np.dot(tmp, dz)
+
+        det = sxx * syy - sxy * sxy
+        if det == 0:
+            raise ValueError("degenerate point set: cannot fit a plane")
+        a = (sxz * syy - syz * sxy) / det
+        b = (syz * sxx - sxz * sxy) / det
+        return np.array([a, b, mz - a * mx - b * my])
+
+    def compute_deviations(self, cloud, plane_coeffs):
+        """Vertical deviations z - (ax + by + c), as a view into the workspace."""
+        n = len(cloud)
+        a, b, c = (float(value) for value in plane_coeffs)
+        residuals, tmp = self.residuals[:n], self.scratch[:n]
+        np.copyto(residuals, cloud.x)
+        residuals *= a
+        np.copyto(tmp, cloud.y)
+        tmp *= b
+        residuals += tmp
+        residuals += c
+        np.copyto(tmp, cloud.z)
+        np.subtract(tmp, residuals, out=residuals)
+        return residuals
+
+    def std(self, values):
+        """Population std-dev (like np.std) without a temporary the size of values."""
+        tmp = self.scratch[:values.size]
+        np.subtract(values, values.sum() / values.size, out=tmp)
+        return float(np.sqrt(np.dot(tmp, tmp) / values.size))
+
+    def analyze(self, depth_map, intrinsics, depth_scale=DEPTH_SCALE, weights=None, rays=None, window=None):
+        """Back-project, fit and measure one frame. Returns (cloud, coeffs, deviations, std_dev)."""
+        cloud = self.back_project(depth_map, intrinsics, depth_scale, rays, window)
+        coeffs = self.fit_plane(cloud, weights)
+        deviations = self.compute_deviations(cloud, coeffs)
+        return cloud, coeffs, deviations, self.std(deviations)